@@ -0,0 +1,175 @@
+-- Set-based variant of DataCollection.sql: one row of features per input point.
+-- Parameters: an array of longitudes and an array of latitudes of equal length.
+-- Rows are returned in input order with point_id (1-based) as the first column.
+WITH
+target AS (
+  SELECT
+    p.point_id,
+    ST_SetSRID(ST_MakePoint(p.lon, p.lat), 4326) AS geom,
+    '2020-01-01'::date AS start_date,
+    '2023-12-31'::date AS end_date
+  FROM unnest(%s::double precision[], %s::double precision[]) WITH ORDINALITY AS p(lon, lat, point_id)
+),
+
+-- ERA5 Aggregation
+era5_agg AS (
+  SELECT
+    t.point_id,
+    r.var_name,
+    AVG(ST_Value(r.rast, t.geom)) AS avg_value
+  FROM target t
+  JOIN era5_data r
+    ON r.date_id BETWEEN t.start_date AND t.end_date
+   AND ST_Intersects(r.rast, t.geom)
+  GROUP BY t.point_id, r.var_name
+),
+
+-- TerraClimate Aggregation
+terraclim_agg AS (
+  SELECT
+    t.point_id,
+    r.var_name,
+    AVG(ST_Value(r.rast, t.geom)) AS avg_value
+  FROM target t
+  JOIN terraclim_data r
+    ON r.date_id BETWEEN t.start_date AND t.end_date
+   AND ST_Intersects(r.rast, t.geom)
+  GROUP BY t.point_id, r.var_name
+),
+
+-- SPEI Aggregation
+spei_agg AS (
+  SELECT
+    t.point_id,
+    AVG(ST_Value(r.rast, t.geom)) AS avg_spei
+  FROM target t
+  JOIN spei_data r
+    ON r.date_id BETWEEN t.start_date AND t.end_date
+   AND ST_Intersects(r.rast, t.geom)
+  GROUP BY t.point_id
+),
+
+-- Static Elevation Data
+elev_agg AS (
+  SELECT
+    t.point_id,
+    s.var_name,
+    ST_Value(s.rast, t.geom) AS value
+  FROM target t
+  JOIN elev_data s
+    ON ST_Intersects(s.rast, t.geom)
+),
+
+-- Pivot each source to one row per point
+era5_wide AS (
+  SELECT
+    e.point_id,
+    MAX(CASE WHEN e.var_name = 'evaptrans'  THEN e.avg_value END) AS era5_evaptrans,
+    MAX(CASE WHEN e.var_name = 'latheat'    THEN e.avg_value END) AS era5_latheat,
+    MAX(CASE WHEN e.var_name = 'netsolrad'  THEN e.avg_value END) AS era5_netsolrad,
+    MAX(CASE WHEN e.var_name = 'press'      THEN e.avg_value END) AS era5_press,
+    MAX(CASE WHEN e.var_name = 'sktemp'     THEN e.avg_value END) AS era5_sktemp,
+    MAX(CASE WHEN e.var_name = 'sotemp1'    THEN e.avg_value END) AS era5_sotemp1,
+    MAX(CASE WHEN e.var_name = 'sotemp2'    THEN e.avg_value END) AS era5_sotemp2,
+    MAX(CASE WHEN e.var_name = 'sotemp3'    THEN e.avg_value END) AS era5_sotemp3,
+    MAX(CASE WHEN e.var_name = 'temp'       THEN e.avg_value END) AS era5_temp,
+    MAX(CASE WHEN e.var_name = 'totprec'    THEN e.avg_value END) AS era5_totprec,
+    MAX(CASE WHEN e.var_name = 'uwind'      THEN e.avg_value END) AS era5_uwind,
+    MAX(CASE WHEN e.var_name = 'vwind'      THEN e.avg_value END) AS era5_vwind,
+    MAX(CASE WHEN e.var_name = 'volsowat1'  THEN e.avg_value END) AS era5_volsowat1,
+    MAX(CASE WHEN e.var_name = 'volsowat12' THEN e.avg_value END) AS era5_volsowat12,
+    MAX(CASE WHEN e.var_name = 'volsowat13' THEN e.avg_value END) AS era5_volsowat13
+  FROM era5_agg e
+  GROUP BY e.point_id
+),
+
+terraclim_wide AS (
+  SELECT
+    t.point_id,
+    MAX(CASE WHEN t.var_name = 'aet'  THEN t.avg_value END) AS terraclim_aet,
+    MAX(CASE WHEN t.var_name = 'def'  THEN t.avg_value END) AS terraclim_def,
+    MAX(CASE WHEN t.var_name = 'pdsi' THEN t.avg_value END) AS terraclim_pdsi,
+    MAX(CASE WHEN t.var_name = 'pet'  THEN t.avg_value END) AS terraclim_pet,
+    MAX(CASE WHEN t.var_name = 'ppt'  THEN t.avg_value END) AS terraclim_ppt,
+    MAX(CASE WHEN t.var_name = 'q'    THEN t.avg_value END) AS terraclim_q,
+    MAX(CASE WHEN t.var_name = 'soil' THEN t.avg_value END) AS terraclim_soil,
+    MAX(CASE WHEN t.var_name = 'srad' THEN t.avg_value END) AS terraclim_srad,
+    MAX(CASE WHEN t.var_name = 'tmin' THEN t.avg_value END) AS terraclim_tmin,
+    MAX(CASE WHEN t.var_name = 'tmax' THEN t.avg_value END) AS terraclim_tmax,
+    MAX(CASE WHEN t.var_name = 'vap'  THEN t.avg_value END) AS terraclim_vap,
+    MAX(CASE WHEN t.var_name = 'vpd'  THEN t.avg_value END) AS terraclim_vpd,
+    MAX(CASE WHEN t.var_name = 'ws'   THEN t.avg_value END) AS terraclim_ws
+  FROM terraclim_agg t
+  GROUP BY t.point_id
+),
+
+elev_wide AS (
+  SELECT
+    el.point_id,
+    MAX(CASE WHEN el.var_name = 'elev'      THEN el.value END) AS elevation,
+    MAX(CASE WHEN el.var_name = 'aspect'    THEN el.value END) AS aspect,
+    MAX(CASE WHEN el.var_name = 'flowdir'   THEN el.value END) AS flowdir,
+    MAX(CASE WHEN el.var_name = 'hillshade' THEN el.value END) AS hillshade,
+    MAX(CASE WHEN el.var_name = 'roughness' THEN el.value END) AS roughness,
+    MAX(CASE WHEN el.var_name = 'tpi'       THEN el.value END) AS tpi,
+    MAX(CASE WHEN el.var_name = 'tri'       THEN el.value END) AS tri,
+    MAX(CASE WHEN el.var_name = 'slope'     THEN el.value END) AS slope
+  FROM elev_agg el
+  GROUP BY el.point_id
+)
+
+-- Final SELECT, same feature order as DataCollection.sql
+SELECT
+  tg.point_id,
+  -- ERA5 variables
+  e.era5_evaptrans,
+  e.era5_latheat,
+  e.era5_netsolrad,
+  e.era5_press,
+  e.era5_sktemp,
+  e.era5_sotemp1,
+  e.era5_sotemp2,
+  e.era5_sotemp3,
+  e.era5_temp,
+  e.era5_totprec,
+  e.era5_uwind,
+  e.era5_vwind,
+  e.era5_volsowat1,
+  e.era5_volsowat12,
+  e.era5_volsowat13,
+
+  -- TerraClimate variables
+  t.terraclim_aet,
+  t.terraclim_def,
+  t.terraclim_pdsi,
+  t.terraclim_pet,
+  t.terraclim_ppt,
+  t.terraclim_q,
+  t.terraclim_soil,
+  t.terraclim_srad,
+  t.terraclim_tmin,
+  t.terraclim_tmax,
+  t.terraclim_vap,
+  t.terraclim_vpd,
+  t.terraclim_ws,
+
+  -- SPEI
+  sp.avg_spei,
+
+  -- Static ELEVATION
+  el.elevation,
+  el.aspect,
+  el.flowdir,
+  el.hillshade,
+  el.roughness,
+  el.tpi,
+  el.tri,
+  el.slope
+
+FROM
+  target tg
+  LEFT JOIN era5_wide e ON e.point_id = tg.point_id
+  LEFT JOIN terraclim_wide t ON t.point_id = tg.point_id
+  LEFT JOIN spei_agg sp ON sp.point_id = tg.point_id
+  LEFT JOIN elev_wide el ON el.point_id = tg.point_id
+ORDER BY tg.point_id;
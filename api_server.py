@@ -1,93 +1,137 @@
-import csv
 from dotenv import load_dotenv
 load_dotenv()
 
-import requests
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, stream_with_context
 import uuid
 import os
-import re
 import json
-import pandas as pd
+import time
+import logging
+import threading
 
 from app import (
-    is_location_query,
     handle_location_query,
-    geolocator,
-    retrieve_docs,
-    setup_chain,
+    route_query,
+    get_router,
+    reverse_geocode,
+    geocoder,
+    get_rag_pipeline,
+    get_ollama_client,
+    SemanticAnswerCache,
     get_session_history,
-    save_session_history,
-    init_db,
-    load_documents,
-    chunk_documents,
+    append_turn,
+    session_store,
+    is_valid_session_id,
+    history_window,
+    sync_db,
     call_embed_model,
-    generate_lagoa_rica_map
+    productivity,
+    site_maps,
+    site_recommendation,
+    SITE_NOTES
 )
-from langchain_core.runnables.history import RunnableWithMessageHistory
 
-from species_data_handler import get_species_for_location
+from species_data_handler import get_species_for_location, get_species_for_locations, load_species_code_to_name
+from model_registry import warm_up as warm_up_species_model
+from suitability_map import generate_suitability_maps
+from feature_cache import feature_cache
+from tracing import configure_logging, span, trace, record_timings, timed_stream, metrics_text
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
 data_folder = "data"
 db_path = "chroma_db"
-docs = load_documents(data_folder)
-chunks = chunk_documents(docs)
-embeddings_model = call_embed_model("sentence-transformers/all-MiniLM-L12-v2")
-vectorstore = init_db(chunks, embeddings_model, db_path)
 
-species_code_to_name = {}
+# The embedding model, vector store and RAG pipeline are built on first use
+# (or by the background warm-up below) rather than at import, so a worker
+# starts serving /health immediately and reports /ready once warm.
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "1") != "0"
+
+rag_services = {}
+rag_services_lock = threading.Lock()
+# each stage is "pending", "ready" or "failed: <error>". /ready needs rag and the
+# species model; without the warm-up only rag, which get_rag_services marks on first use.
+warm_up_status = {"rag": "pending", "species_model": "pending", "gazetteer": "pending", "productivity": "pending",
+                  "router": "pending", "started_at": None, "finished_at": None}
+READY_STAGES = ("rag", "species_model") if WARM_UP_ON_START else ("rag",)
+
+def get_rag_services():
+    if "rag_pipeline" not in rag_services:
+        with rag_services_lock:
+            if "rag_pipeline" not in rag_services:
+                embeddings_model = call_embed_model("sentence-transformers/all-MiniLM-L12-v2")
+                vectorstore = sync_db(data_folder, embeddings_model, db_path)
+                rag_services["embeddings_model"] = embeddings_model
+                rag_services["vectorstore"] = vectorstore
+                rag_services["answer_cache"] = SemanticAnswerCache(vectorstore)
+                rag_pipeline = get_rag_pipeline("llama3.2:1b", vectorstore, similar_docs_count=5)
+                if rag_pipeline.hybrid_retriever is not None:
+                    rag_pipeline.hybrid_retriever.keyword_index()
+                rag_services["rag_pipeline"] = rag_pipeline
+                warm_up_status["rag"] = "ready"
+    return rag_services
+
+def _warm_up_stage(name, load):
+    try:
+        load()
+    except Exception as e:
+        logger.exception("Warm-up of %s failed", name)
+        warm_up_status[name] = f"failed: {e}"
+    else:
+        warm_up_status[name] = "ready"
 
-with open('data/species_metadata.csv', 'r') as f:
-    reader = csv.reader(f)
-    for row in reader:
-        scientific_name = row[0]
-        species_code = row[1]
-        species_code_to_name[species_code] = scientific_name
+def warm_up():
+    warm_up_status["started_at"] = time.time()
+    _warm_up_stage("rag", get_rag_services)
+    _warm_up_stage("species_model", warm_up_species_model)
+    _warm_up_stage("gazetteer", geocoder.gazetteer.load)
+    _warm_up_stage("productivity", productivity.load)
+    _warm_up_stage("router", get_router)
+    warm_up_status["finished_at"] = time.time()
 
-#************************************************************************
-def is_species_query(query):
-    keywords = ["species", "clone", "plant", "forest", "recommend", "region", "genetic", "plantation"]
-    query_lower = query.lower()
-    return any(word in query_lower for word in keywords)
+def is_ready():
+    return all(warm_up_status[stage] == "ready" for stage in READY_STAGES)
 
-def chat_with_ollama(prompt):
-    try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={"model": "llama3", "prompt": prompt},
-            stream=True
-        )
+def start_warm_up():
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
 
-        full_text = ""
+if WARM_UP_ON_START:
+    start_warm_up()
 
-        for line in response.iter_lines():
-            if line:
-                data = json.loads(line.decode('utf-8'))
-                if 'response' in data:
-                    full_text += data['response']
+MAX_BATCH_POINTS = int(os.getenv("MAX_BATCH_POINTS", "1000"))
 
-        return full_text if full_text else "I'm unable to answer right now."
+species_code_to_name = load_species_code_to_name('data/species_metadata.csv')
 
+#************************************************************************
+def stream_ollama(prompt):
+    """Yield response tokens from Ollama as they are generated."""
+    return get_ollama_client().generate_stream("llama3", prompt)
+
+def stream_ollama_safe(prompt):
+    try:
+        produced = False
+        for token in timed_stream(stream_ollama(prompt)):
+            produced = True
+            yield token
+        if not produced:
+            yield "I'm unable to answer right now."
     except Exception as e:
-        print(f"Error connecting to ChatOllama: {e}")
-        return "Error connecting to ChatOllama."
+        logger.warning("Error connecting to ChatOllama: %s", e)
+        yield "Error connecting to ChatOllama."
+
+def chat_with_ollama(prompt):
+    return "".join(stream_ollama_safe(prompt))
 
 def map_species_codes_to_names(species_codes):
     return [species_code_to_name.get(code, code) for code in species_codes]
 
-def build_full_prompt(chat_history, user_input):
-    history_text = ""
-    for message in chat_history:
-        role = message.get('role') if isinstance(message, dict) else message[0]
-        content = message.get('content') if isinstance(message, dict) else message[1]
-        if role == 'human':
-            history_text += f"User: {content}\n"
-        elif role == 'ai':
-            history_text += f"AI: {content}\n"
-    history_text += f"User: {user_input}\nAI:"
-    return history_text
+def build_full_prompt(chat_history, user_input, session_id):
+    return history_window.prompt_text(session_id, chat_history.messages, user_input)
 
 
 #******************************************************************************
@@ -98,146 +142,283 @@ def index():
 
 @app.route("/chat/<session_id>")
 def chat_with_session(session_id):
-    session_file = os.path.join("rag_functions", "sessions", f"{session_id}.json")
-    if not os.path.exists(session_file):
-        with open(session_file, "w") as f:
-            json.dump([], f)  # for empty history
+    if not is_valid_session_id(session_id):
+        return jsonify({"error": "Invalid session_id"}), 400
+    session_store.create(session_id)
     return render_template("chat.html", session_id=session_id)
 
-@app.route("/chat", methods=["POST"])
-def chat():
-    user_input = request.json.get("message")
-    session_id = request.args.get("session_id")
-    session_file = os.path.join("rag_functions", "sessions", f"{session_id}.json")
+def site_clones_answer(site, k=3):
+    """HTML answer listing the best clones at a productivity site, with its annotated map."""
+    top_clones, map_url = site_recommendation(site, k)
+    if not top_clones:
+        return f"No clone results are recorded for {site}."
+    recommendation = "<br>".join(
+        f"{i+1}. {clone} — MAI6 {score:.2f}" for i, (clone, score) in enumerate(top_clones)
+    )
+    response_text = f"<strong>Top Recommended Clones for {site}:</strong><br><br>" + recommendation
+    if map_url:
+        response_text += f"<br><br><img class='preview-img' src='{map_url}' alt='Map Preview'>"
+    if site in SITE_NOTES:
+        response_text += "<br><br><strong>Climatic Information:</strong><br>" + "<br>".join(SITE_NOTES[site])
+    return response_text
+
+def location_prompt(user_input, location_name, species_list):
+    prompt = (
+            f"User asked: {user_input}\n\n"
+            f"Location: {location_name}\n"
+            f"Species found: {len(species_list)}\n\n"
+            f"Species List:\n" + "\n".join([
+        f"- {s}" for s in species_list[:5]
+    ])
+    )
+    logger.debug("Location prompt: %s", prompt)
+    return prompt
 
-    if not session_id:
-        return jsonify({"error": "Missing session_id"}), 400
+def generate_response(user_input, session_id, chat_history):
+    """Route a message and return an iterator over the pieces of the answer.
 
-    chat_history = get_session_history(session_id)
+    Canned answers come back as a single piece; Ollama and the RAG chain are
+    streamed token by token.
+    """
     response_text = None
+    prompt = user_input
+    cache_context = None
+    with span("routing"):
+        route = route_query(user_input)
 
-    if not is_species_query(user_input):
-        full_prompt = build_full_prompt(chat_history, user_input)
-        response = chat_with_ollama(full_prompt)
-
-    elif re.search(r"clones.*lagoa rica", user_input, re.IGNORECASE):
-        df = pd.read_excel("data/productivity.xlsx")
-        clone_scores = df.drop(columns=["longitude", "latitude", "project"]).iloc[0].to_dict()
-        top_clones = sorted(clone_scores.items(), key=lambda x: x[1], reverse=True)[:3]
-        recommendation = "\n".join(
-            [f"{i+1}. {clone} — MAI6 {score:.2f}" for i, (clone, score) in enumerate(top_clones)]
-        )
+    if route["intent"] == "general":
+        full_prompt = build_full_prompt(chat_history, user_input, session_id)
+        return stream_ollama_safe(full_prompt)
 
-        map_url = generate_lagoa_rica_map(clone_scores)
-
-        response_text = (
-                "<strong>Top Recommended Clones for Lagoa Rica:</strong><br><br>"
-                + recommendation.replace("\n", "<br>") +
-                f"<br><br><img class='preview-img' src='{map_url}' alt='Map Preview'>" +
-                "<br><br><strong>Climatic Information:</strong><br>"
-                "Located in Cluster 2<br>"
-                "Water Deficit Historic: 66 mm<br>"
-                "Precipitation Historic: 1343 mm<br>"
-                "Water Deficit Forecast: 153 mm"
-        )
+    elif route["intent"] == "site_clones":
+        with span("site_lookup"):
+            response_text = site_clones_answer(route["terms"]["site"][0])
 
-    elif is_location_query(user_input):
-        coords, error = handle_location_query(user_input)
+    elif route["intent"] == "location":
+        coords, error = handle_location_query(user_input, route)
         if error:
             response_text = error
         else:
             lat, lon = coords
+            # "clones near <place>" at one of our sites is answered from the productivity sheet
+            site = productivity.nearest_site(lat, lon) if "clone_word" in route["terms"] else None
+            if site:
+                return iter([site_clones_answer(site)])
             try:
-                species_list = get_species_for_location(lat, lon)
-                print(species_list)
+                species = get_species_for_location(lat, lon)
+                species_list = [species] if species else []
+                logger.debug("Species for %s, %s: %s", lat, lon, species_list)
             except Exception as e:
                 response_text = f"Database error: {str(e)}"
                 species_list = []
 
             if not species_list:
-                response_text = "No species found near this location."
+                response_text = response_text or "No species found near this location."
             else:
-                try:
-                    location = geolocator.reverse(f"{lat},{lon}")
-                    location_name = location.address.split(',')[0] if location else f"{lat:.4f}, {lon:.4f}"
-                except:
-                    location_name = f"{lat:.4f}, {lon:.4f}"
-
-                prompt = (
-                        f"User asked: {user_input}\n\n"
-                        f"Location: {location_name}\n"
-                        f"Species found: {len(species_list)}\n\n"
-                        f"Species List:\n" + "\n".join([
-                    f"- {s}" for s in species_list[:5]
-                ])
-                )
-                response_text = None
-                print(prompt)
-
-    if response_text is None:
-        prompt = user_input if 'prompt' not in locals() else prompt
-        retriever = retrieve_docs(prompt, vectorstore, similar_docs_count=5, see_content=False)
-        retrieved_docs = retriever.invoke(prompt)
-
-        if not retrieved_docs or len(retrieved_docs) == 0:
-            full_prompt = build_full_prompt(chat_history, user_input)
-            response_text = chat_with_ollama(full_prompt)
-        else:
-            rag_chain = setup_chain("llama3.2:1b", retriever)
-
-            conversational_rag_chain = RunnableWithMessageHistory(
-                rag_chain,
-                lambda _: chat_history,
-                input_messages_key="input",
-                history_messages_key="chat_history",
-                output_messages_key="answer"
-            )
-
-            final_answer = ""
-            for chunk in conversational_rag_chain.stream(
-                    {"input": prompt},
-                    config={"configurable": {"session_id": session_id}}
-            ):
-                if 'answer' in chunk:
-                    final_answer += chunk["answer"]
-            response_text = final_answer
-
-    session_history = []
-    if os.path.exists(session_file):
-        with open(session_file) as f:
-            session_history = json.load(f)
-
-    session_history.extend([
-        {"role": "human", "content": user_input},
-        {"role": "ai", "content": response_text}
-    ])
-    with open(session_file, "w") as f:
-        json.dump(session_history, f, indent=2)
+                with span("reverse_geocoding"):
+                    location_name = reverse_geocode(lat, lon) or f"{lat:.4f}, {lon:.4f}"
+                prompt = location_prompt(user_input, location_name, species_list)
+                # the prompt template dominates the embedding; only an exact match on its data may share answers
+                cache_context = (location_name, tuple(species_list))
+
+    if response_text is not None:
+        return iter([response_text])
+    return stream_rag_answer(prompt, user_input, session_id, chat_history, cache_context)
+
+def stream_rag_answer(prompt, user_input, session_id, chat_history, cache_context=None):
+    services = get_rag_services()
+    rag_pipeline = services["rag_pipeline"]
+    answer_cache = services["answer_cache"]
+    timings = {}
+    history_messages = history_window.chain_messages(session_id, chat_history.messages)
+    standalone, query_vector, retrieved_docs = rag_pipeline.retrieve(prompt, history_messages, timings)
+
+    if not retrieved_docs:
+        full_prompt = build_full_prompt(chat_history, user_input, session_id)
+        yield from stream_ollama_safe(full_prompt)
+        return
+
+    answer = answer_cache.lookup(query_vector, retrieved_docs, cache_context)
+    if answer is not None:
+        yield answer
+    else:
+        answer = ""
+        for token in rag_pipeline.stream_answer(prompt, history_messages, retrieved_docs, timings):
+            answer += token
+            yield token
+        answer_cache.store(query_vector, retrieved_docs, answer, timings.get("answer_s", 0.0), cache_context)
+
+    record_timings(timings)
+    logger.debug("RAG timings for %s: %s", session_id, timings)
 
-    save_session_history(session_id)
+@app.route("/chat", methods=["POST"])
+def chat():
+    user_input = request.json.get("message")
+    session_id = request.args.get("session_id")
+
+    if not session_id:
+        return jsonify({"error": "Missing session_id"}), 400
+    if not is_valid_session_id(session_id):
+        return jsonify({"error": "Invalid session_id"}), 400
+
+    with trace("chat", session_id=session_id):
+        chat_history = get_session_history(session_id)
+        response_text = "".join(generate_response(user_input, session_id, chat_history))
+        with span("session_persist"):
+            append_turn(session_id, user_input, response_text)
 
     return jsonify({"response": response_text})
 
+def sse_event(data, event=None):
+    payload = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    user_input = request.json.get("message")
+    session_id = request.args.get("session_id")
+
+    if not session_id:
+        return jsonify({"error": "Missing session_id"}), 400
+    if not is_valid_session_id(session_id):
+        return jsonify({"error": "Invalid session_id"}), 400
+
+    chat_history = get_session_history(session_id)
+
+    def events():
+        # the work happens while the response body is iterated, so the trace lives here
+        with trace("chat_stream", session_id=session_id):
+            pieces = []
+            try:
+                for piece in generate_response(user_input, session_id, chat_history):
+                    pieces.append(piece)
+                    yield sse_event({"token": piece})
+            except Exception as e:
+                logger.exception("Error while streaming response")
+                yield sse_event({"error": str(e)}, event="error")
+                return
+
+            response_text = "".join(pieces)
+            with span("session_persist"):
+                append_turn(session_id, user_input, response_text)
+            yield sse_event({"response": response_text}, event="done")
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def species_batch_response(payload):
+    """(body, status) for a /species/batch request payload."""
+    raw_points = payload.get("points") or []
+
+    if len(raw_points) > MAX_BATCH_POINTS:
+        return {"error": f"At most {MAX_BATCH_POINTS} points per request"}, 400
+
+    try:
+        top_k = max(1, int(payload.get("top_k", 3)))
+        points = [
+            (float(p["lat"]), float(p["lon"])) if isinstance(p, dict) else (float(p[0]), float(p[1]))
+            for p in raw_points
+        ]
+    except (KeyError, IndexError, TypeError, ValueError):
+        return {"error": "Points must be {lat, lon} objects or [lat, lon] pairs and top_k an integer"}, 400
+
+    try:
+        with trace("species_batch", points=len(points)):
+            predictions = get_species_for_locations(points, top_k=top_k)
+    except Exception as e:
+        return {"error": f"Database error: {str(e)}"}, 500
+
+    results = [
+        {
+            "lat": lat,
+            "lon": lon,
+            "species": [
+                {"code": code, "name": species_code_to_name.get(code, code), "probability": prob}
+                for code, prob in ranked
+            ],
+        }
+        for (lat, lon), ranked in zip(points, predictions)
+    ]
+    return {"results": results}, 200
+
+
+def species_suitability_response(payload):
+    """(body, status) for a /species/suitability request payload."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = [float(v) for v in payload["bbox"]]
+    except (KeyError, TypeError, ValueError):
+        return {"error": "bbox must be [min_lon, min_lat, max_lon, max_lat]"}, 400
+
+    try:
+        summary = generate_suitability_maps(
+            min_lon, min_lat, max_lon, max_lat,
+            species_code_to_name=species_code_to_name,
+            per_species=bool(payload.get("per_species", True)),
+        )
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except Exception as e:
+        return {"error": f"Database error: {str(e)}"}, 500
+
+    if "best" in summary["maps"]:
+        summary["html"] = f"<img class='preview-img' src='{summary['maps']['best']}' alt='Suitability Map'>"
+    return summary, 200
+
+
+@app.route("/species/batch", methods=["POST"])
+def species_batch():
+    body, status = species_batch_response(request.json or {})
+    return jsonify(body), status
+
+
+@app.route("/species/suitability", methods=["POST"])
+def species_suitability():
+    body, status = species_suitability_response(request.json or {})
+    return jsonify(body), status
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    answer_cache = rag_services.get("answer_cache")
+    return jsonify({
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "feature_cache": feature_cache.stats(),
+        "sessions": session_store.stats(),
+        "history_summaries": history_window.stats(),
+        "geocoder": geocoder.stats(),
+        "site_maps": site_maps.stats(),
+    })
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(metrics_text(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/health")
+def health():
+    return jsonify({"status": "ok"})
+
+
+@app.route("/ready")
+def ready():
+    ready = is_ready()
+    return jsonify({"ready": ready, **warm_up_status}), 200 if ready else 503
+
 
 @app.route("/history/<session_id>")
 def get_history(session_id):
-    session_path = os.path.join("rag_functions", "sessions", f"{session_id}.json")
-    if not os.path.exists(session_path):
-        return jsonify([])
-    with open(session_path, "r") as f:
-        return jsonify(json.load(f))
+    if not is_valid_session_id(session_id):
+        return jsonify({"error": "Invalid session_id"}), 400
+    return jsonify(session_store.messages(session_id))
 
 @app.route("/sessions")
 def list_sessions():
-    session_path = os.path.join("rag_functions", "sessions")
-    os.makedirs(session_path, exist_ok=True)
-
-    sessions = sorted(
-        [f for f in os.listdir(session_path) if f.endswith(".json")],
-        key=lambda f: os.path.getmtime(os.path.join(session_path, f)),
-        reverse=True
-    )
-    return jsonify([f.replace(".json", "") for f in sessions])
+    return jsonify(session_store.list_sessions())
 
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5050)
\ No newline at end of file
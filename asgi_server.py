@@ -0,0 +1,426 @@
+"""ASGI serving mode: async chat endpoints, bounded work pools and admission control.
+
+    uvicorn asgi_server:app --host 0.0.0.0 --port 5050 [--workers 4]
+
+/chat and /chat/stream are served natively: Ollama generations are awaited
+over httpx, blocking I/O (geocoding, the feature/PostGIS lookup, LangChain
+calls, session writes) runs on a bounded I/O thread pool and CPU-bound work
+(embedding and search, model predict, map rendering) on a bounded CPU pool.
+The species endpoints are native too and run on the pools. Every other
+route is the Flask app from api_server, each request on its own thread.
+
+Requests are admitted per route group. Beyond a group's concurrency limit a
+request waits in a short queue; a full queue is refused with 429 and a wait
+longer than ASGI_QUEUE_TIMEOUT with 503, both with Retry-After, so an
+overloaded worker answers quickly instead of piling up.
+"""
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from api_server import (
+    app as flask_app,
+    route_query,
+    handle_location_query,
+    reverse_geocode,
+    productivity,
+    site_clones_answer,
+    location_prompt,
+    build_full_prompt,
+    get_rag_services,
+    get_ollama_client,
+    get_session_history,
+    append_turn,
+    is_valid_session_id,
+    history_window,
+    sse_event,
+    warm_up_status,
+    is_ready,
+    species_batch_response,
+    species_suitability_response,
+)
+from species_data_handler import get_features, predict_species
+from rag_functions.ollama_client import NUM_PARALLEL
+from tracing import span, trace, record, record_timings, metrics_text
+
+logger = logging.getLogger(__name__)
+
+IO_THREADS = int(os.getenv("ASGI_IO_THREADS", "32"))
+CPU_THREADS = int(os.getenv("ASGI_CPU_THREADS", str(os.cpu_count() or 4)))
+QUEUE_TIMEOUT = float(os.getenv("ASGI_QUEUE_TIMEOUT", "2"))
+# group=concurrency:queue for each route group; chat beyond a few requests per Ollama slot only adds latency
+LIMITS = os.getenv("ASGI_LIMITS", f"chat={NUM_PARALLEL * 4}:{NUM_PARALLEL * 4},species=4:8,default=32:64")
+EXEMPT_PATHS = {"/health", "/ready", "/metrics"}
+
+io_pool = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="asgi-io")
+cpu_pool = ThreadPoolExecutor(max_workers=CPU_THREADS, thread_name_prefix="asgi-cpu")
+
+
+def route_group(path):
+    if path in EXEMPT_PATHS:
+        return None
+    if path in ("/chat", "/chat/stream"):
+        return "chat"
+    if path.startswith("/species/"):
+        return "species"
+    return "default"
+
+
+class Admission:
+    """Concurrency limit for one route group, with a bounded, time-limited wait for a slot."""
+
+    def __init__(self, name, limit, queue, timeout=QUEUE_TIMEOUT):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(limit)
+        self.stats = {"admitted": 0, "queue_full": 0, "queue_timeout": 0}
+
+    async def enter(self):
+        """None when admitted, else the status to refuse with (429 queue full, 503 wait timed out)."""
+        if self._slots.locked():
+            if self.waiting >= self.queue:
+                self.stats["queue_full"] += 1
+                return 429
+            self.waiting += 1
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.stats["queue_timeout"] += 1
+                return 503
+            finally:
+                self.waiting -= 1
+            record("admission_wait", time.perf_counter() - started)
+        else:
+            await self._slots.acquire()
+        self.active += 1
+        self.stats["admitted"] += 1
+        return None
+
+    def leave(self):
+        self.active -= 1
+        self._slots.release()
+
+
+def parse_limits(text):
+    groups = {}
+    for part in text.split(","):
+        name, _, numbers = part.strip().partition("=")
+        limit, _, queue = numbers.partition(":")
+        groups[name] = Admission(name, int(limit), int(queue or 0))
+    return groups
+
+
+admission = parse_limits(LIMITS)
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, groups=admission):
+        self.app = app
+        self.groups = groups
+
+    async def __call__(self, scope, receive, send):
+        group = self.groups.get(route_group(scope["path"])) if scope["type"] == "http" else None
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+        status = await group.enter()
+        if status is not None:
+            message = "Too many requests queued" if status == 429 else "Timed out waiting for capacity"
+            response = JSONResponse({"error": message}, status_code=status, headers={"Retry-After": "1"})
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            group.leave()
+
+
+async def run_in(pool, fn, *args):
+    """Run fn(*args) on a pool thread, keeping the caller's trace context."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, functools.partial(contextvars.copy_context().run, fn, *args))
+
+
+async def iterate_in(pool, make_iterator):
+    """Iterate a blocking iterator on a pool thread, yielding its items on the event loop."""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    end = object()
+
+    def pump():
+        try:
+            for item in make_iterator():
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (end, e))
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, (end, None))
+
+    loop.run_in_executor(pool, functools.partial(contextvars.copy_context().run, pump))
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+async def stream_ollama(prompt):
+    started = time.perf_counter()
+    produced = False
+    try:
+        async for token in get_ollama_client().agenerate_stream("llama3", prompt):
+            if not produced:
+                record("llm_first_token", time.perf_counter() - started)
+                produced = True
+            yield token
+        record("llm_completion", time.perf_counter() - started)
+        if not produced:
+            yield "I'm unable to answer right now."
+    except Exception as e:
+        logger.warning("Error connecting to ChatOllama: %s", e)
+        yield "Error connecting to ChatOllama."
+
+
+def _site_answer(site):
+    with span("site_lookup"):
+        return site_clones_answer(site)
+
+
+def _route(user_input):
+    with span("routing"):
+        return route_query(user_input)
+
+
+def _reverse_geocode(lat, lon):
+    with span("reverse_geocoding"):
+        return reverse_geocode(lat, lon)
+
+
+async def generate_response(user_input, session_id, chat_history):
+    """Async counterpart of api_server.generate_response, yielding the pieces of the answer."""
+    # the first call builds the router from the productivity sheet, so routing runs off the event loop
+    route = await run_in(io_pool, _route, user_input)
+
+    if route["intent"] == "general":
+        async for token in stream_ollama(build_full_prompt(chat_history, user_input, session_id)):
+            yield token
+        return
+
+    if route["intent"] == "site_clones":
+        yield await run_in(cpu_pool, _site_answer, route["terms"]["site"][0])
+        return
+
+    prompt = user_input
+    cache_context = None
+    if route["intent"] == "location":
+        coords, error = await run_in(io_pool, handle_location_query, user_input, route)
+        if error:
+            yield error
+            return
+        lat, lon = coords
+        site = await run_in(io_pool, productivity.nearest_site, lat, lon) if "clone_word" in route["terms"] else None
+        if site:
+            yield await run_in(cpu_pool, _site_answer, site)
+            return
+        try:
+            with span("features"):
+                vector = await run_in(io_pool, get_features, [(lat, lon)])
+            species = await run_in(cpu_pool, predict_species, vector)
+        except Exception as e:
+            logger.exception("Species prediction failed for %s, %s", lat, lon)
+            yield f"Database error: {str(e)}"
+            return
+        if not species:
+            yield "No species found near this location."
+            return
+        location_name = await run_in(io_pool, _reverse_geocode, lat, lon) or f"{lat:.4f}, {lon:.4f}"
+        prompt = location_prompt(user_input, location_name, [species])
+        cache_context = (location_name, (species,))
+
+    async for piece in stream_rag_answer(prompt, user_input, session_id, chat_history, cache_context):
+        yield piece
+
+
+async def stream_rag_answer(prompt, user_input, session_id, chat_history, cache_context=None):
+    services = await run_in(io_pool, get_rag_services)
+    rag_pipeline = services["rag_pipeline"]
+    answer_cache = services["answer_cache"]
+    timings = {}
+    history_messages = history_window.chain_messages(session_id, chat_history.messages)
+
+    started = time.perf_counter()
+    standalone = await run_in(io_pool, rag_pipeline.reformulate, prompt, history_messages)
+    timings["reformulate_s"] = time.perf_counter() - started
+    query_vector, retrieved_docs = await run_in(cpu_pool, rag_pipeline.search, standalone, timings)
+
+    if not retrieved_docs:
+        async for token in stream_ollama(build_full_prompt(chat_history, user_input, session_id)):
+            yield token
+        return
+
+    answer = await run_in(io_pool, answer_cache.lookup, query_vector, retrieved_docs, cache_context)
+    if answer is not None:
+        yield answer
+    else:
+        answer = ""
+        # the LangChain answer chain is synchronous; it runs on an I/O thread and its tokens are relayed
+        tokens = iterate_in(io_pool, lambda: rag_pipeline.stream_answer(prompt, history_messages,
+                                                                          retrieved_docs, timings))
+        async for token in tokens:
+            answer += token
+            yield token
+        await run_in(io_pool, answer_cache.store, query_vector, retrieved_docs, answer,
+                     timings.get("answer_s", 0.0), cache_context)
+
+    record_timings(timings)
+    logger.debug("RAG timings for %s: %s", session_id, timings)
+
+
+app = FastAPI(title="Species chat (ASGI)")
+app.add_middleware(AdmissionMiddleware)
+
+
+async def chat_request(request):
+    """(user_input, session_id) or an error response."""
+    session_id = request.query_params.get("session_id")
+    if not session_id:
+        return None, None, JSONResponse({"error": "Missing session_id"}, status_code=400)
+    if not is_valid_session_id(session_id):
+        return None, None, JSONResponse({"error": "Invalid session_id"}, status_code=400)
+    payload = await request.json()
+    return payload.get("message"), session_id, None
+
+
+@app.post("/chat")
+async def chat(request: Request):
+    user_input, session_id, error = await chat_request(request)
+    if error:
+        return error
+    with trace("chat", session_id=session_id):
+        chat_history = await run_in(io_pool, get_session_history, session_id)
+        pieces = [piece async for piece in generate_response(user_input, session_id, chat_history)]
+        response_text = "".join(pieces)
+        with span("session_persist"):
+            await run_in(io_pool, append_turn, session_id, user_input, response_text)
+    return JSONResponse({"response": response_text})
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    user_input, session_id, error = await chat_request(request)
+    if error:
+        return error
+    chat_history = await run_in(io_pool, get_session_history, session_id)
+
+    async def events():
+        with trace("chat_stream", session_id=session_id):
+            pieces = []
+            try:
+                async for piece in generate_response(user_input, session_id, chat_history):
+                    pieces.append(piece)
+                    yield sse_event({"token": piece})
+            except Exception as e:
+                logger.exception("Error while streaming response")
+                yield sse_event({"error": str(e)}, event="error")
+                return
+
+            response_text = "".join(pieces)
+            with span("session_persist"):
+                await run_in(io_pool, append_turn, session_id, user_input, response_text)
+            yield sse_event({"response": response_text}, event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    ready = is_ready()
+    return JSONResponse({"ready": ready, **warm_up_status}, status_code=200 if ready else 503)
+
+
+def admission_metrics():
+    lines = [
+        "# HELP asgi_admission_active Requests being served, per route group.",
+        "# TYPE asgi_admission_active gauge",
+    ]
+    lines += [f'asgi_admission_active{{group="{g.name}"}} {g.active}' for g in admission.values()]
+    lines += ["# HELP asgi_admission_waiting Requests queued for a slot, per route group.",
+              "# TYPE asgi_admission_waiting gauge"]
+    lines += [f'asgi_admission_waiting{{group="{g.name}"}} {g.waiting}' for g in admission.values()]
+    lines += ["# HELP asgi_admission_rejected_total Requests refused, per route group and status.",
+              "# TYPE asgi_admission_rejected_total counter"]
+    for g in admission.values():
+        lines.append(f'asgi_admission_rejected_total{{group="{g.name}",status="429"}} {g.stats["queue_full"]}')
+        lines.append(f'asgi_admission_rejected_total{{group="{g.name}",status="503"}} {g.stats["queue_timeout"]}')
+    return "\n".join(lines) + "\n"
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(metrics_text() + admission_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/species/batch")
+async def species_batch(request: Request):
+    body, status = await run_in(io_pool, species_batch_response, await request.json() or {})
+    return JSONResponse(body, status_code=status)
+
+
+@app.post("/species/suitability")
+async def species_suitability(request: Request):
+    body, status = await run_in(cpu_pool, species_suitability_response, await request.json() or {})
+    return JSONResponse(body, status_code=status)
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi with every request in its own ThreadSensitiveContext.
+
+    asgiref runs thread-sensitive sync code, WsgiToAsgi included, on one
+    shared thread, so the Flask routes would be served one at a time. A
+    context per request gives each its own thread; how many run at once is
+    bounded by the "default" admission group.
+    """
+
+    async def __call__(self, scope, receive, send):
+        async with ThreadSensitiveContext():
+            await super().__call__(scope, receive, send)
+
+
+# everything else (pages, history, session and cache endpoints) is the Flask app
+app.mount("/", ThreadedWsgiToAsgi(flask_app))
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("asgi_server:app", host="0.0.0.0", port=int(os.getenv("PORT", "5050")),
+                workers=int(os.getenv("ASGI_WORKERS", "1")))
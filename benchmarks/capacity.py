@@ -0,0 +1,257 @@
+"""Concurrent-user capacity of the Flask dev server against the ASGI server.
+
+Usage: python -m benchmarks.capacity [--servers flask,asgi] [--users 8,32,128] [--duration 20]
+                                     [--species-users 4] [--batch-points 50]
+                                     [--mix chat=3,rag=3,site=1,location=3] [--num-parallel 8]
+                                     [--tokens-per-second 50] [--tokens 40] [--db-delay-ms 20]
+                                     [--timeout 30] [--output capacity.json]
+
+Each server runs in its own process on the offline stand-ins of
+benchmarks.standins: "flask" is api_server.app on werkzeug's threaded
+server (what app.run() uses), "asgi" is asgi_server.app on uvicorn. For
+every user count, that many clients each post messages from the load-test
+mix to /chat/stream back to back for --duration seconds, while
+--species-users clients post --batch-points random points to
+/species/batch. Per step and route the report gives completed answers per second, p50/p95 latency and time to
+first byte of those answers, and how many requests were refused (429/503),
+failed or timed out after --timeout seconds. A server past its capacity
+shows up as rising p95 and timeouts (Flask) or as fast refusals while the
+admitted requests keep their latency (ASGI).
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from benchmarks.loadtest import MESSAGES, parse_mix, percentiles
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def serve(args):
+    """Server process: install the stand-ins and serve until killed."""
+    os.environ["OLLAMA_NUM_PARALLEL"] = str(args.num_parallel)
+    os.environ["LOG_LEVEL"] = "WARNING"
+    from benchmarks.standins import install_standins
+
+    api_server, handles = install_standins(args.tokens_per_second, args.tokens,
+                                           args.first_token_delay_ms / 1000, args.db_delay_ms / 1000)
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    api_server.get_rag_services()
+    try:
+        if args.serve == "flask":
+            from werkzeug.serving import make_server
+
+            make_server("127.0.0.1", args.port, api_server.app, threaded=True).serve_forever()
+        else:
+            import uvicorn
+            import asgi_server
+
+            uvicorn.run(asgi_server.app, host="127.0.0.1", port=args.port, log_level="warning")
+    finally:
+        shutil.rmtree(handles["workdir"], ignore_errors=True)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, args):
+    port = free_port()
+    command = [sys.executable, "-m", "benchmarks.capacity", "--serve", kind, "--port", str(port),
+               "--num-parallel", str(args.num_parallel), "--tokens-per-second", str(args.tokens_per_second),
+               "--tokens", str(args.tokens), "--first-token-delay-ms", str(args.first_token_delay_ms),
+               "--db-delay-ms", str(args.db_delay_ms)]
+    process = subprocess.Popen(command, cwd=BASE_DIR)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{kind} server exited with {process.returncode}")
+        try:
+            requests.get(f"{base}/health", timeout=1)
+            return process, base
+        except requests.RequestException:
+            time.sleep(0.5)
+    process.kill()
+    raise SystemExit(f"{kind} server did not start")
+
+
+def send(session, base, message, session_id, timeout):
+    """(status, ttfb, latency) where status is "ok", an HTTP status, "error" or "timeout"."""
+    started = time.perf_counter()
+    first = None
+    try:
+        with session.post(f"{base}/chat/stream?session_id={session_id}", json={"message": message},
+                          stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                return response.status_code, None, time.perf_counter() - started
+            status = "ok"
+            for chunk in response.iter_content(chunk_size=None):
+                if first is None and chunk:
+                    first = time.perf_counter() - started
+                if b"event: error" in chunk:
+                    status = "error"
+                if time.perf_counter() - started > timeout:
+                    return "timeout", first, time.perf_counter() - started
+    except requests.Timeout:
+        return "timeout", first, time.perf_counter() - started
+    except requests.RequestException:
+        return "error", first, time.perf_counter() - started
+    return status, first, time.perf_counter() - started
+
+
+def send_batch(session, base, points, timeout):
+    started = time.perf_counter()
+    try:
+        response = session.post(f"{base}/species/batch", json={"points": points, "top_k": 3}, timeout=timeout)
+    except requests.Timeout:
+        return "timeout", None, time.perf_counter() - started
+    except requests.RequestException:
+        return "error", None, time.perf_counter() - started
+    latency = time.perf_counter() - started
+    return ("ok" if response.status_code == 200 else response.status_code), latency, latency
+
+
+def summarize(results, wall_s):
+    ok = [r for r in results if r[0] == "ok"]
+    return {
+        "requests": len(results),
+        "completed": len(ok),
+        "throughput_rps": round(len(ok) / wall_s, 3),
+        "latency_ms": percentiles([r[2] for r in ok]),
+        "ttfb_ms": percentiles([r[1] for r in ok if r[1] is not None]),
+        "rejected_429": sum(1 for r in results if r[0] == 429),
+        "rejected_503": sum(1 for r in results if r[0] == 503),
+        "errors": sum(1 for r in results if r[0] == "error" or isinstance(r[0], int) and r[0] not in (429, 503)),
+        "timeouts": sum(1 for r in results if r[0] == "timeout"),
+    }
+
+
+def step(base, users, species_users, batch_points, duration, mix, timeout, seed):
+    """Closed loop: `users` chat clients and `species_users` /species/batch clients,
+    each sending its next request as soon as the last one finishes."""
+    results = {"chat": [], "species": []}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+    routes, weights = list(mix), list(mix.values())
+
+    def user(index):
+        rng = random.Random(seed * 1000 + index)
+        session = requests.Session()
+        while time.perf_counter() < stop_at:
+            route = rng.choices(routes, weights)[0]
+            message = rng.choice(MESSAGES[route]).format(
+                coordinates=f"{rng.uniform(-33, -15):.3f}, {rng.uniform(-55, -40):.3f}")
+            result = send(session, base, message, f"cap-{users}-{index}", timeout)
+            with lock:
+                results["chat"].append(result)
+            if result[0] in (429, 503):
+                time.sleep(rng.uniform(0.5, 1.5))  # honour Retry-After, roughly
+
+    def species_user(index):
+        rng = random.Random(seed * 1000 + 500 + index)
+        session = requests.Session()
+        while time.perf_counter() < stop_at:
+            # random points miss the feature cache, so every batch reaches the PostGIS stand-in
+            points = [[rng.uniform(-33, -15), rng.uniform(-55, -40)] for _ in range(batch_points)]
+            result = send_batch(session, base, points, timeout)
+            with lock:
+                results["species"].append(result)
+            if result[0] in (429, 503):
+                time.sleep(rng.uniform(0.5, 1.5))
+
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(users)]
+    threads += [threading.Thread(target=species_user, args=(i,), daemon=True) for i in range(species_users)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(duration + timeout + 5)
+    wall_s = time.perf_counter() - started
+
+    return {"users": users, "species_users": species_users,
+            "chat": summarize(results["chat"], wall_s), "species": summarize(results["species"], wall_s)}
+
+
+def run(args):
+    mix = parse_mix(args.mix)
+    report = {"config": {k: v for k, v in vars(args).items() if k not in ("output", "serve", "port")}}
+    for kind in args.servers.split(","):
+        process, base = start_server(kind, args)
+        try:
+            # one untimed pass warms lazy loads (router, gazetteer, model)
+            warm = requests.Session()
+            for messages in MESSAGES.values():
+                for message in messages:
+                    send(warm, base, message.format(coordinates="-25.43, -49.27"), "cap-warm", args.timeout)
+            report[kind] = []
+            for users in [int(u) for u in args.users.split(",")]:
+                result = step(base, users, args.species_users, args.batch_points, args.duration, mix,
+                              args.timeout, args.seed)
+                report[kind].append(result)
+                print_step(kind, result)
+        finally:
+            process.terminate()
+            process.wait(30)
+    return report
+
+
+def print_step(kind, result):
+    for route in ("chat", "species"):
+        r = result[route]
+        if not r["requests"]:
+            continue
+        lat, ttfb = r["latency_ms"], r["ttfb_ms"]
+        latency = "-" if lat["p50"] is None else f"{lat['p50']:.0f}/{lat['p95']:.0f}"
+        first = "-" if ttfb["p50"] is None else f"{ttfb['p50']:.0f}/{ttfb['p95']:.0f}"
+        print(f"{kind:<6} users {result['users']:>4} {route:<8} {r['throughput_rps']:7.2f} answers/s  "
+              f"p50/p95 {latency:>11} ms  TTFB {first:>11} ms  429 {r['rejected_429']:>4}  "
+              f"503 {r['rejected_503']:>4}  errors {r['errors']:>3}  timeouts {r['timeouts']:>3}",
+              flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", default="flask,asgi")
+    parser.add_argument("--users", default="8,32,128")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--mix", default="chat=3,rag=3,site=1,location=3")
+    parser.add_argument("--species-users", type=int, default=4, help="concurrent /species/batch clients")
+    parser.add_argument("--batch-points", type=int, default=50, help="points per /species/batch request")
+    parser.add_argument("--num-parallel", type=int, default=8, help="OLLAMA_NUM_PARALLEL of the server")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--first-token-delay-ms", type=float, default=50.0)
+    parser.add_argument("--db-delay-ms", type=float, default=20.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--serve", choices=["flask", "asgi"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nreport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Time-to-first-byte of /chat versus /chat/stream against a stub Ollama.
+
+Usage: python -m benchmarks.chat_ttfb [--requests 10] [--tokens-per-second 30] [--tokens 100]
+
+Starts benchmarks.stub_ollama, points api_server at it through
+OLLAMA_BASE_URL and serves api_server on an ephemeral port. The message is
+a plain (non-species) question so it goes straight to Ollama.
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+import uuid
+
+import requests
+
+from benchmarks.stub_ollama import start_stub_ollama
+
+
+def timed_request(url, payload):
+    started = time.perf_counter()
+    with requests.post(url, json=payload, stream=True, timeout=300) as response:
+        first = None
+        for chunk in response.iter_content(chunk_size=None):
+            if chunk and first is None:
+                first = time.perf_counter() - started
+        total = time.perf_counter() - started
+    return first, total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--tokens", type=int, default=100)
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_ollama(tokens_per_second=args.tokens_per_second, tokens=args.tokens)
+    os.environ["OLLAMA_BASE_URL"] = stub_url
+
+    from werkzeug.serving import make_server
+    import api_server
+
+    server = make_server("127.0.0.1", 0, api_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    payload = {"message": "Hello, how are you today?"}
+    for route in ("/chat", "/chat/stream"):
+        firsts, totals = [], []
+        for _ in range(args.requests):
+            first, total = timed_request(f"{base}{route}?session_id=bench-{uuid.uuid4()}", payload)
+            firsts.append(first)
+            totals.append(total)
+        print(f"{route:<13} TTFB p50 {statistics.median(firsts) * 1000:8.1f} ms   "
+              f"total p50 {statistics.median(totals) * 1000:8.1f} ms")
+
+    server.shutdown()
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Parity, query-embed latency and memory of the embedding backends (torch, onnx, onnx-int8).
+
+Usage: python -m benchmarks.embedding_backends [--backends torch,onnx,onnx-int8] [--k 5]
+                                               [--repeats 20] [--min-overlap 0.9] [--min-cosine 0.99]
+                                               [--model sentence-transformers/all-MiniLM-L12-v2]
+
+Export the ONNX models first (python -m rag_functions.docs_preprocess
+export-onnx). Each backend runs in its own process, which loads the model,
+embeds the chunks of the PDFs in data/ and the questions in
+benchmarks/retrieval_questions.json, times single-query embeds over
+--repeats passes and reports its resident set size (VmRSS).
+
+Parity is measured against the first backend. Per question, the top --k
+chunks by cosine similarity are compared, once with only the query
+embedded by the candidate (an index built with the reference backend, as
+after switching EMBEDDING_BACKEND without re-ingesting) and once with
+chunks and query both embedded by the candidate (after re-ingesting). A
+backend passes when the mean top-k overlap of both is at least
+--min-overlap and every query vector has cosine similarity of at least
+--min-cosine to the reference. Exits with status 1 if any backend fails.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_questions.json")
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:")) / 1024
+
+
+def worker(backend, model, texts_path, output_path, repeats):
+    """Embed everything with one backend; write the vectors and print timings as JSON."""
+    baseline_mb = rss_mb()
+    from rag_functions.docs_preprocess import load_local_embed_model
+
+    with open(texts_path) as f:
+        texts = json.load(f)
+    started = time.perf_counter()
+    embeddings = load_local_embed_model(model, backend=backend)
+    embeddings.embed_query("warm up")
+    load_s = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(repeats):
+        for question in texts["questions"]:
+            started = time.perf_counter()
+            embeddings.embed_query(question)
+            latencies.append(time.perf_counter() - started)
+    queries = np.array([embeddings.embed_query(q) for q in texts["questions"]], dtype=np.float32)
+
+    started = time.perf_counter()
+    chunks = np.array(embeddings.embed_documents(texts["chunks"]), dtype=np.float32)
+    chunks_s = time.perf_counter() - started
+    np.savez(output_path, queries=queries, chunks=chunks)
+
+    p50, p95 = np.percentile(np.asarray(latencies) * 1000, [50, 95])
+    print(json.dumps({
+        "load_s": round(load_s, 2),
+        "query_p50_ms": round(float(p50), 2),
+        "query_p95_ms": round(float(p95), 2),
+        "chunks_per_s": round(len(texts["chunks"]) / chunks_s, 1),
+        "rss_mb": round(rss_mb(), 1),
+        "model_mb": round(rss_mb() - baseline_mb, 1),
+    }))
+
+
+def top_k(queries, chunks, k):
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    chunks = chunks / np.linalg.norm(chunks, axis=1, keepdims=True)
+    return np.argsort(-(queries @ chunks.T), axis=1)[:, :k]
+
+
+def overlap(a, b):
+    return np.array([len(set(x) & set(y)) / len(x) for x, y in zip(a, b)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8", help="the first one is the reference")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L12-v2")
+    parser.add_argument("--data", default=os.path.join(BASE_DIR, "data"))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--min-overlap", type=float, default=0.9)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--texts", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.model, args.texts, args.out, args.repeats)
+        return 0
+
+    from rag_functions.database import load_documents
+    from rag_functions.docs_preprocess import chunk_documents
+
+    with open(QUESTIONS) as f:
+        questions = [item["question"] for item in json.load(f)]
+    chunks = [doc.page_content for doc in chunk_documents(load_documents(args.data))]
+    print(f"{len(chunks)} chunks, {len(questions)} questions, top {args.k}\n")
+
+    workdir = tempfile.mkdtemp(prefix="embedding-backends-")
+    texts_path = os.path.join(workdir, "texts.json")
+    with open(texts_path, "w") as f:
+        json.dump({"questions": questions, "chunks": chunks}, f)
+
+    backends = args.backends.split(",")
+    results, vectors = {}, {}
+    for backend in backends:
+        out = os.path.join(workdir, f"{backend}.npz")
+        env = dict(os.environ)
+        env.pop("EMBEDDING_SERVER_URL", None)
+        proc = subprocess.run([sys.executable, "-m", "benchmarks.embedding_backends", "--worker", backend,
+                               "--model", args.model, "--texts", texts_path, "--out", out,
+                               "--repeats", str(args.repeats)],
+                              cwd=BASE_DIR, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{backend}: failed\n{proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else ''}")
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+        with np.load(out) as data:
+            vectors[backend] = {"queries": data["queries"], "chunks": data["chunks"]}
+
+    print(f"{'backend':<10} {'load s':>7} {'query p50/p95 ms':>17} {'chunks/s':>9} {'RSS MB':>7} {'model MB':>9}")
+    for backend, r in results.items():
+        print(f"{backend:<10} {r['load_s']:>7.2f} {r['query_p50_ms']:>8.2f}/{r['query_p95_ms']:<8.2f} "
+              f"{r['chunks_per_s']:>9.1f} {r['rss_mb']:>7.1f} {r['model_mb']:>9.1f}")
+
+    failed = False
+    reference = backends[0]
+    if reference in vectors:
+        ref = vectors[reference]
+        ref_top = top_k(ref["queries"], ref["chunks"], args.k)
+        print(f"\nparity against {reference}:")
+        for backend in backends[1:]:
+            if backend not in vectors:
+                failed = True
+                continue
+            cand = vectors[backend]
+            q, r = cand["queries"], ref["queries"]
+            cosine = (q * r).sum(axis=1) / (np.linalg.norm(q, axis=1) * np.linalg.norm(r, axis=1))
+            query_only = overlap(ref_top, top_k(cand["queries"], ref["chunks"], args.k))
+            reindexed = overlap(ref_top, top_k(cand["queries"], cand["chunks"], args.k))
+            ok = (cosine.min() >= args.min_cosine and query_only.mean() >= args.min_overlap
+                  and reindexed.mean() >= args.min_overlap)
+            failed = failed or not ok
+            print(f"  {backend:<10} cosine min {cosine.min():.4f}  top-{args.k} overlap "
+                  f"query-only {query_only.mean():.3f} (min {query_only.min():.2f})  "
+                  f"reindexed {reindexed.mean():.3f} (min {reindexed.min():.2f})  {'ok' if ok else 'FAIL'}")
+    else:
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Memory per worker and embed throughput: per-worker models versus the shared embedding server.
+
+Usage: python -m benchmarks.embedding_server [--workers 4] [--threads 16] [--requests 50]
+                                             [--model sentence-transformers/all-MiniLM-L12-v2]
+
+Memory: starts --workers subprocesses that each call call_embed_model() and
+embed one query, first loading the model locally, then with
+EMBEDDING_SERVER_URL pointing at a shared server, and reports each
+process's resident set size (VmRSS).
+
+Throughput: --threads concurrent clients each send --requests single-query
+embeds, against the local model called directly, the server with
+micro-batching disabled (--max-batch 1) and the server with micro-batching.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rag_functions.docs_preprocess import RemoteEmbeddings, load_local_embed_model
+from rag_functions.embedding_server import serve
+
+WORKER_SCRIPT = """
+import json, sys
+from rag_functions.docs_preprocess import call_embed_model
+call_embed_model(sys.argv[1]).embed_query("warm up")
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+print(json.dumps({"rss_kb": rss}))
+"""
+
+
+def rss_mb(pid="self"):
+    with open(f"/proc/{pid}/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:")) / 1024
+
+
+def worker_rss(model, workers, server_url=None):
+    env = dict(os.environ)
+    env.pop("EMBEDDING_SERVER_URL", None)
+    if server_url:
+        env["EMBEDDING_SERVER_URL"] = server_url
+    procs = [subprocess.Popen([sys.executable, "-c", WORKER_SCRIPT, model], env=env, stdout=subprocess.PIPE)
+             for _ in range(workers)]
+    return [json.loads(proc.communicate()[0])["rss_kb"] / 1024 for proc in procs]
+
+
+def start_server(model, max_batch, max_wait_ms):
+    server = serve(model, port=0, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def throughput(name, embeddings, threads, requests):
+    texts = [f"Which tree species grow well at site {i}?" for i in range(threads * requests)]
+    latencies = []
+
+    def one(text):
+        started = time.perf_counter()
+        embeddings.embed_query(text)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, texts))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f"{name:<22} {len(texts) / elapsed:8.1f} embeds/s   "
+          f"p50 {statistics.median(latencies) * 1000:7.1f} ms   "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L12-v2")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    base_rss = rss_mb()
+    server, url = start_server(args.model, args.max_batch, args.max_wait_ms)
+    server_rss = rss_mb() - base_rss
+
+    local = worker_rss(args.model, args.workers)
+    remote = worker_rss(args.model, args.workers, url)
+    print(f"local model   : {statistics.mean(local):7.1f} MB per worker, "
+          f"{sum(local):7.1f} MB for {args.workers} workers")
+    print(f"shared server : {statistics.mean(remote):7.1f} MB per worker, "
+          f"{sum(remote) + server_rss:7.1f} MB for {args.workers} workers "
+          f"(server model ~{server_rss:.1f} MB)")
+    print()
+
+    throughput("local model", load_local_embed_model(args.model), args.threads, args.requests)
+    unbatched, unbatched_url = start_server(args.model, 1, 0)
+    throughput("server, no batching", RemoteEmbeddings(unbatched_url), args.threads, args.requests)
+    throughput("server, micro-batched", RemoteEmbeddings(url), args.threads, args.requests)
+
+    unbatched.shutdown()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
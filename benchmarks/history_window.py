@@ -0,0 +1,96 @@
+"""Prompt size and latency for long sessions: full history versus the windowed history.
+
+Usage: python -m benchmarks.history_window [--turns 10 50 200] [--prompt-tokens-per-second 2000]
+                                           [--requests 3]
+
+"full" builds the prompt the old way, every turn verbatim; "windowed" goes
+through rag_functions.history_window (recent turns within the token budget
+plus the rolling summary). Both prompts are sent to benchmarks.stub_ollama,
+which delays the first token in proportion to prompt length, so time to
+first token tracks prompt size the way a real model's prompt evaluation
+does. The background summary is built before timing and reported separately.
+"""
+import argparse
+import os
+import statistics
+import time
+
+from benchmarks.stub_ollama import start_stub_ollama
+
+QUESTION = "Which pine species tolerate frost at high elevation?"
+ANSWER = ("Pinus tecunumanii from high elevation sources and P. patula showed better frost tolerance "
+          "than the lowland sources in the freezing trials, while P. caribaea was the most sensitive. ")
+
+
+def make_session(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "human", "content": f"Turn {i}: {QUESTION}"})
+        messages.append({"role": "ai", "content": ANSWER * 2})
+    return messages
+
+
+def full_prompt(messages, user_input):
+    from rag_functions.history_window import format_lines
+
+    return format_lines(messages) + f"\nUser: {user_input}\nAI:"
+
+
+def timed(client, prompt, requests):
+    firsts, totals = [], []
+    for i in range(requests):
+        started = time.perf_counter()
+        first = None
+        # a distinct suffix per request keeps the client from coalescing repeats
+        for _ in client.generate_stream("bench", f"{prompt} [{i}]"):
+            if first is None:
+                first = time.perf_counter() - started
+        firsts.append(first)
+        totals.append(time.perf_counter() - started)
+    return statistics.median(firsts), statistics.median(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=3)
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_ollama(tokens_per_second=0, tokens=args.tokens,
+                                       prompt_tokens_per_second=args.prompt_tokens_per_second)
+    os.environ["OLLAMA_BASE_URL"] = stub_url
+
+    from rag_functions.history_window import HistoryWindow, estimate_tokens
+    from rag_functions.ollama_client import get_ollama_client
+
+    client = get_ollama_client()
+    window = HistoryWindow()
+
+    print(f"{'turns':>5}  {'mode':<9} {'prompt tok':>10}  {'TTFT p50':>10}  {'total p50':>10}")
+    for turns in args.turns:
+        messages = make_session(turns)
+        session_id = f"bench-{turns}"
+
+        started = time.perf_counter()
+        window.window(session_id, messages)
+        while window.stats()["pending"]:
+            time.sleep(0.01)
+        summary_s = time.perf_counter() - started
+
+        prompts = {
+            "full": full_prompt(messages, QUESTION),
+            "windowed": window.prompt_text(session_id, messages, QUESTION),
+        }
+        for mode, prompt in prompts.items():
+            first, total = timed(client, prompt, args.requests)
+            print(f"{turns:>5}  {mode:<9} {estimate_tokens(prompt):>10}  "
+                  f"{first * 1000:>8.1f}ms  {total * 1000:>8.1f}ms")
+        print(f"{'':>5}  background summary: {summary_s * 1000:.1f} ms")
+
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
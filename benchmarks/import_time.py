@@ -0,0 +1,73 @@
+"""Import-time profile of api_server, optionally against another git revision.
+
+Usage: python -m benchmarks.import_time [--compare <git-ref>] [--top 15]
+
+Runs `python -X importtime -c "import api_server"` in a fresh interpreter
+with the background warm-up disabled, then reports the wall time of the
+import and the packages that spend the most (self) time importing. With
+--compare the same measurement is taken in a temporary git worktree of the
+given revision (e.g. the commit before lazy startup) for a before/after view.
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(cwd):
+    env = dict(os.environ, WARM_UP_ON_START="0")
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import api_server"],
+        cwd=cwd, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started
+
+    packages = defaultdict(int)
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            packages[match.group(4).split(".")[0]] += int(match.group(1))  # self time, by package
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+    return wall, packages
+
+
+def report(name, wall, packages, top):
+    print(f"{name}: import api_server took {wall:.2f}s wall")
+    for package, micros in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<30} {micros / 1e6:7.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--compare", help="git revision to profile as the baseline")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    if args.compare:
+        worktree = tempfile.mkdtemp(prefix="import-baseline-")
+        subprocess.run(["git", "worktree", "add", "--detach", worktree, args.compare], cwd=ROOT, check=True,
+                       capture_output=True)
+        try:
+            # share the already-built vector store so the baseline measures import, not a rebuild
+            if os.path.isdir(os.path.join(ROOT, "chroma_db")):
+                os.symlink(os.path.join(ROOT, "chroma_db"), os.path.join(worktree, "chroma_db"))
+            report(f"before ({args.compare})", *profile(worktree), args.top)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=ROOT, capture_output=True)
+            shutil.rmtree(worktree, ignore_errors=True)
+
+    report("after (working tree)", *profile(ROOT), args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Mixed-traffic load test of api_server against local stand-ins, with a JSON report.
+
+Usage: python -m benchmarks.loadtest [--concurrency 8] [--requests 400] [--mix chat=3,rag=3,site=1,location=3]
+                                     [--tokens-per-second 50] [--tokens 40] [--db-delay-ms 20]
+                                     [--seed 1] [--output report.json] [--compare baseline.json]
+
+Runs fully offline: benchmarks.standins replaces Ollama, the embedding
+model, Nominatim, PostGIS and the species model, and api_server is served
+in-process on an ephemeral port. Worker threads post the messages of a
+seeded schedule to /chat/stream, so two runs with the same arguments send
+the same traffic. Route classes:
+
+  chat      small talk, answered by Ollama directly
+  rag       species questions, answered through retrieval + Ollama
+  site      clone recommendations for a productivity site (Lagoa Rica)
+  location  species for a named place or coordinates (geocoding, features, model, then RAG)
+
+For every route the report gives throughput, error count and p50/p95/p99
+of time to first byte and total latency; for every stage (see tracing.py)
+p50/p95/p99 of its duration. --compare prints the change against an
+earlier report. The load generator shares the process with the server, so
+compare reports from the same machine and settings.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+MESSAGES = {
+    "chat": [
+        "Hello, how are you today?",
+        "Thanks, that was helpful.",
+        "Can you summarise what we talked about?",
+        "Good morning!",
+    ],
+    "rag": [
+        "What is the frost tolerance of P. taeda compared to P. elliottii?",
+        "Which pine species are most tolerant of cold?",
+        "What are the genetic parameters for growth in P. patula?",
+        "How does P. tecunumanii from low elevation sources perform?",
+        "What is the heritability of volume in P. maximinoi?",
+    ],
+    "site": [
+        "Which clones are best for Lagoa Rica?",
+        "Top clones at Lagoa Rica?",
+    ],
+    "location": [
+        "Which species grow near Curitiba?",
+        "What species should I plant in Pietermaritzburg?",
+        "Which species grow in Belo Horizonte?",
+        "Recommend species at coordinates -25.43, -49.27",
+        "Which species grow near Raleigh?",
+        "What forest species grow around Concordia?",
+        "Recommend species at coordinates {coordinates}",
+    ],
+}
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3)}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        route, _, weight = part.partition("=")
+        if route not in MESSAGES:
+            raise SystemExit(f"Unknown route {route!r}; choose from {', '.join(MESSAGES)}")
+        mix[route] = float(weight or 1)
+    return mix
+
+
+def schedule(mix, count, seed):
+    """Deterministic list of (route, message, session_id)."""
+    rng = random.Random(seed)
+    routes = list(mix)
+    weights = [mix[r] for r in routes]
+    sessions = [f"load-{i}" for i in range(max(count // 5, 1))]
+    plan = []
+    for _ in range(count):
+        route = rng.choices(routes, weights)[0]
+        # random points miss the feature cache, so the PostGIS stand-in is exercised too
+        message = rng.choice(MESSAGES[route]).format(
+            coordinates=f"{rng.uniform(-33, -15):.3f}, {rng.uniform(-55, -40):.3f}")
+        plan.append((route, message, rng.choice(sessions)))
+    return plan
+
+
+class TraceCollector(logging.Handler):
+    """Keeps the span durations from the trace records api_server logs."""
+
+    def __init__(self):
+        super().__init__()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        trace = getattr(record, "trace_record", None)
+        if trace is None:
+            return
+        with self._lock:
+            for span in trace["spans"]:
+                self.stages.setdefault(span["stage"], []).append(span["duration_s"])
+
+
+def send(session, base, route, message, session_id):
+    started = time.perf_counter()
+    first = None
+    error = None
+    try:
+        with session.post(f"{base}/chat/stream?session_id={session_id}", json={"message": message},
+                          stream=True, timeout=120) as response:
+            for chunk in response.iter_content(chunk_size=None):
+                if chunk and first is None:
+                    first = time.perf_counter() - started
+                if b"event: error" in chunk:
+                    error = "stream error"
+            if response.status_code != 200:
+                error = f"HTTP {response.status_code}"
+    except requests.RequestException as e:
+        error = type(e).__name__
+    return route, first, time.perf_counter() - started, error
+
+
+def run(args):
+    os.environ["TRACE_LOG"] = "1"
+    from benchmarks.standins import install_standins
+
+    api_server, handles = install_standins(args.tokens_per_second, args.tokens,
+                                           args.first_token_delay_ms / 1000, args.db_delay_ms / 1000)
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    collector = TraceCollector()
+    trace_logger = logging.getLogger("trace")
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+    trace_logger.addHandler(collector)
+
+    from werkzeug.serving import make_server
+
+    started = time.perf_counter()
+    api_server.get_rag_services()
+    setup_s = time.perf_counter() - started
+
+    server = make_server("127.0.0.1", 0, api_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    plan = schedule(parse_mix(args.mix), args.requests, args.seed)
+    local = threading.local()
+
+    def worker(item):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return send(local.session, base, *item)
+
+    # one untimed pass over every message warms lazy loads (router, gazetteer, model)
+    warm = requests.Session()
+    for route, messages in MESSAGES.items():
+        for message in messages:
+            send(warm, base, route, message.format(coordinates="-25.43, -49.27"), f"warm-{uuid.uuid4().hex[:8]}")
+    collector.stages.clear()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(worker, plan))
+    wall_s = time.perf_counter() - started
+    server.shutdown()
+    handles["stub"].shutdown()
+    shutil.rmtree(handles["workdir"], ignore_errors=True)
+
+    routes = {}
+    for route in sorted({r for r, *_ in results}):
+        rows = [r for r in results if r[0] == route]
+        ok = [r for r in rows if r[3] is None]
+        routes[route] = {
+            "requests": len(rows),
+            "errors": len(rows) - len(ok),
+            "throughput_rps": round(len(rows) / wall_s, 3),
+            "ttfb_ms": percentiles([r[1] for r in ok if r[1] is not None]),
+            "latency_ms": percentiles([r[2] for r in ok]),
+        }
+    stages = {
+        stage: {"count": len(values), "ms": percentiles(values)}
+        for stage, values in sorted(collector.stages.items())
+    }
+    return {
+        "version": git_version(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "setup_s": round(setup_s, 3),
+        "overall": {
+            "requests": len(results),
+            "errors": sum(1 for r in results if r[3] is not None),
+            "wall_s": round(wall_s, 3),
+            "throughput_rps": round(len(results) / wall_s, 3),
+            "latency_ms": percentiles([r[2] for r in results if r[3] is None]),
+        },
+        "routes": routes,
+        "stages": stages,
+        "feature_queries": handles["features"].calls,
+    }
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(report):
+    overall = report["overall"]
+    print(f"{report['version']}: {overall['requests']} requests in {overall['wall_s']:.1f}s "
+          f"({overall['throughput_rps']:.1f} req/s, {overall['errors']} errors)\n")
+    print(f"{'route':<10} {'req':>5} {'err':>4} {'req/s':>7}  {'TTFB p50/p95/p99 ms':>24}  {'total p50/p95/p99 ms':>24}")
+    for route, r in report["routes"].items():
+        ttfb, lat = r["ttfb_ms"], r["latency_ms"]
+        print(f"{route:<10} {r['requests']:>5} {r['errors']:>4} {r['throughput_rps']:>7.2f}  "
+              f"{fmt3(ttfb):>24}  {fmt3(lat):>24}")
+    print(f"\n{'stage':<22} {'count':>6}  {'p50/p95/p99 ms':>24}")
+    for stage, s in report["stages"].items():
+        print(f"{stage:<22} {s['count']:>6}  {fmt3(s['ms']):>24}")
+
+
+def fmt3(p):
+    if p["p50"] is None:
+        return "-"
+    return f"{p['p50']:.1f}/{p['p95']:.1f}/{p['p99']:.1f}"
+
+
+def print_comparison(baseline, report):
+    """p50 and p95 of every route and stage, baseline -> current."""
+    print(f"\nchange from {baseline.get('version')} ({baseline.get('created')}):")
+
+    def line(name, old, new):
+        if not old or not new or old["p50"] is None or new["p50"] is None:
+            return
+        deltas = "  ".join(
+            f"{q} {old[q]:.1f} -> {new[q]:.1f} ms ({(new[q] - old[q]) / old[q] * 100 if old[q] else 0:+.0f}%)"
+            for q in ("p50", "p95")
+        )
+        print(f"  {name:<28} {deltas}")
+
+    for route, r in report["routes"].items():
+        line(f"route {route}", baseline.get("routes", {}).get(route, {}).get("latency_ms"), r["latency_ms"])
+    for stage, s in report["stages"].items():
+        line(f"stage {stage}", baseline.get("stages", {}).get(stage, {}).get("ms"), s["ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--mix", default="chat=3,rag=3,site=1,location=3")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--first-token-delay-ms", type=float, default=50.0)
+    parser.add_argument("--db-delay-ms", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nreport written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Per-request model cost before and after the load-once registry.
+
+Usage: python -m benchmarks.model_loading [--requests 50]
+
+"before" repeats what get_species_for_location used to do on every call
+(joblib.load of the booster and encoder plus reading DataCollection.sql);
+"after" goes through model_registry. Both run one prediction on a zero
+vector so only the model path is timed, not PostGIS.
+"""
+import argparse
+import os
+import statistics
+import time
+
+import joblib
+import numpy as np
+
+from model_registry import MODEL_DIR, BASE_DIR, ModelRegistry
+
+
+def per_request_reload(vector):
+    model = joblib.load(os.path.join(MODEL_DIR, "xgb_model.joblib"))
+    le = joblib.load(os.path.join(MODEL_DIR, "label_encoder.joblib"))
+    with open(os.path.join(BASE_DIR, "DataCollection.sql")) as f:
+        f.read()
+    return le.inverse_transform(model.predict(vector))[0]
+
+
+def per_request_registry(registry, vector):
+    registry.query
+    model, encoder = registry.classifier
+    return encoder.inverse_transform(model.predict(vector))[0]
+
+
+def summarize(name, samples):
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95 = samples_ms[int(len(samples_ms) * 0.95) - 1]
+    print(f"{name:<10} mean {statistics.mean(samples_ms):8.2f} ms   "
+          f"p50 {statistics.median(samples_ms):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(
+        os.path.join(MODEL_DIR, "xgb_model.joblib"),
+        os.path.join(MODEL_DIR, "label_encoder.joblib"),
+        os.path.join(BASE_DIR, "DataCollection.sql"),
+    )
+    started = time.perf_counter()
+    registry.warm_up()
+    print(f"registry warm-up: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    vector = np.zeros((1, registry.model.n_features_in_))
+
+    before, after = [], []
+    for _ in range(args.requests):
+        t0 = time.perf_counter()
+        per_request_reload(vector)
+        before.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        per_request_registry(registry, vector)
+        after.append(time.perf_counter() - t0)
+
+    summarize("before", before)
+    summarize("after", after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Routing accuracy and per-message cost: keyword scans versus the compiled query router.
+
+Usage: python -m benchmarks.query_router [--iterations 2000]
+
+Runs the labelled messages in benchmarks/routing_cases.json through both
+routers. A case passes when the intent matches and, where the case gives
+them, the location slot and the recognised terms (e.g. site, species_code)
+match too; the keyword scans have no term slots, so only intent and
+location are checked for them. "before" repeats what api_server did:
+is_species_query, the Lagoa Rica regex, is_location_query and the five
+extract_location_from_question patterns.
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from query_router import build_router
+
+CASES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing_cases.json")
+
+
+def keyword_route(text):
+    keywords = ["species", "clone", "plant", "forest", "recommend", "region", "genetic", "plantation"]
+    if not any(word in text.lower() for word in keywords):
+        return {"intent": "general", "location": None, "terms": {}}
+    if re.search(r"clones.*lagoa rica", text, re.IGNORECASE):
+        return {"intent": "site_clones", "location": None, "terms": {}}
+
+    triggers = ['grow in', 'plant in', 'species in', 'near', 'around', 'at coordinates', 'in region']
+    if any(trigger in text.lower() for trigger in triggers):
+        patterns = [
+            r'(?:in|near|around|for)\s+(.+?)(?:\?|$)',
+            r'at\s+(.+?)(?:\?|$)',
+            r'coordinates\s+(.+?)(?:\?|$)',
+            r'in\s+(.+?)\s*,\s*(.+?)(?:\?|$)',
+            r'near\s+(.+?)\s*,\s*(.+?)(?:\?|$)'
+        ]
+        location = None
+        for pattern in patterns:
+            match = re.search(pattern, text.lower())
+            if match:
+                location = ', '.join([g.strip() for g in match.groups() if g.strip()])
+                break
+        return {"intent": "location", "location": location, "terms": {}}
+    return {"intent": "species", "location": None, "terms": {}}
+
+
+def passes(case, route, check_terms):
+    if route["intent"] != case["intent"]:
+        return False
+    if "location" in case and (route["location"] or "").lower() != case["location"].lower():
+        return False
+    if check_terms:
+        for kind, values in case.get("terms", {}).items():
+            if not set(values) <= set(route["terms"].get(kind, [])):
+                return False
+    return True
+
+
+def run(name, route, cases, iterations, check_terms):
+    failures = [case for case in cases if not passes(case, route(case["text"]), check_terms)]
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for case in cases:
+            route(case["text"])
+    per_message_us = (time.perf_counter() - started) / (iterations * len(cases)) * 1e6
+    print(f"{name:<8} accuracy {len(cases) - len(failures)}/{len(cases)}   {per_message_us:7.2f} us/message")
+    for case in failures:
+        print(f"    miss: {case['text']!r} -> {route(case['text'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(CASES, encoding="utf-8") as f:
+        cases = json.load(f)
+
+    started = time.perf_counter()
+    router = build_router()
+    print(f"router build: {(time.perf_counter() - started) * 1000:.1f} ms, {len(cases)} labelled messages\n")
+
+    run("before", keyword_route, cases, args.iterations, check_terms=False)
+    run("after", router.route, cases, args.iterations, check_terms=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Per-stage timing of the RAG path: per-request chain construction vs. the shared pipeline.
+
+Usage: python -m benchmarks.rag_stages [--requests 10]
+
+Uses the persisted chroma_db and the real embedding model; the LLM is
+benchmarks.stub_ollama so generation time is fixed and only our own
+overhead differs. "before" repeats the old request flow: a throwaway
+retriever.invoke, a second retriever.invoke to check for results, then
+setup_chain + RunnableWithMessageHistory built for the message.
+"""
+import argparse
+import os
+import statistics
+import time
+
+from benchmarks.stub_ollama import start_stub_ollama
+from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.runnables.history import RunnableWithMessageHistory
+from rag_functions.create_chain import setup_chain, RagPipeline
+from rag_functions.database import init_db
+from rag_functions.docs_preprocess import call_embed_model
+
+QUESTION = "What is the frost tolerance of P. taeda compared to P. elliottii?"
+MODEL = "llama3.2:1b"
+
+
+def before(vectorstore, base_url):
+    stages = {}
+    t0 = time.perf_counter()
+    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 5})
+    retriever.invoke(QUESTION)
+    retriever.invoke(QUESTION)
+    stages["extra_retrievals"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    history = ChatMessageHistory()
+    chain = RunnableWithMessageHistory(
+        setup_chain(MODEL, retriever, base_url),
+        lambda _: history,
+        input_messages_key="input",
+        history_messages_key="chat_history",
+        output_messages_key="answer",
+    )
+    stages["build_chain"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for _ in chain.stream({"input": QUESTION}, config={"configurable": {"session_id": "bench"}}):
+        pass
+    stages["retrieve_and_answer"] = time.perf_counter() - t0
+    return stages
+
+
+def after(pipeline):
+    timings = {}
+    _, _, docs = pipeline.retrieve(QUESTION, [], timings)
+    for _ in pipeline.stream_answer(QUESTION, [], docs, timings):
+        pass
+    return timings
+
+
+def report(name, runs):
+    print(name)
+    for stage in runs[0]:
+        values = [run[stage] * 1000 for run in runs]
+        print(f"  {stage:<22} p50 {statistics.median(values):8.1f} ms")
+    totals = [sum(v for k, v in run.items() if k != "first_token_s") * 1000 for run in runs]
+    print(f"  {'total':<22} p50 {statistics.median(totals):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    stub, base_url = start_stub_ollama(tokens_per_second=0, tokens=50)
+    embeddings = call_embed_model("sentence-transformers/all-MiniLM-L12-v2")
+    vectorstore = init_db([], embeddings, os.path.join(os.path.dirname(os.path.dirname(__file__)), "chroma_db"))
+
+    t0 = time.perf_counter()
+    pipeline = RagPipeline(MODEL, vectorstore, 5, base_url)
+    print(f"one-time pipeline build: {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    report("before (per-request chain)", [before(vectorstore, base_url) for _ in range(args.requests)])
+    report("after (shared pipeline)", [after(pipeline) for _ in range(args.requests)])
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Retrieval quality and latency: vector-only, BM25-only, hybrid and hybrid + cross-encoder.
+
+Usage: python -m benchmarks.retrieval [--k 5] [--candidates 20] [--rerank-candidates 20]
+                                      [--no-rerank] [--repeats 5]
+
+Builds an in-memory Chroma collection from the PDFs in data/ with the real
+embedding model and runs the questions in benchmarks/retrieval_questions.json.
+A retrieved chunk is relevant when it contains one of the question's
+"relevant" phrases (case-insensitive, whitespace-normalized); recall@k is the
+share of questions with a relevant chunk in the top k. Latency covers the
+query embedding plus search, over --repeats runs of the question set.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import time
+
+from rag_functions.database import load_documents
+from rag_functions.docs_preprocess import call_embed_model, chunk_documents
+from rag_functions.hybrid_search import HybridRetriever
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_questions.json")
+MODEL = "sentence-transformers/all-MiniLM-L12-v2"
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", text).lower()
+
+
+def is_relevant(text, phrases):
+    text = normalize(text)
+    return any(phrase in text for phrase in phrases)
+
+
+def run(name, retrieve, questions, embeddings, k, repeats):
+    hits = 0
+    latencies = []
+    for repeat in range(repeats):
+        for item in questions:
+            started = time.perf_counter()
+            texts = retrieve(item["question"], embeddings.embed_query(item["question"]))
+            latencies.append(time.perf_counter() - started)
+            if repeat == 0 and any(is_relevant(text, item["relevant"]) for text in texts[:k]):
+                hits += 1
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    print(f"{name:<24} recall@{k} {hits / len(questions):5.2f}   "
+          f"p50 {statistics.median(latencies_ms):7.1f} ms   "
+          f"p95 {latencies_ms[int(len(latencies_ms) * 0.95) - 1]:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default=os.path.join(BASE_DIR, "data"))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=20, help="vector and BM25 candidates before fusion")
+    parser.add_argument("--rerank-candidates", type=int, default=20)
+    parser.add_argument("--no-rerank", action="store_true", help="skip the cross-encoder configuration")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    from langchain_chroma import Chroma
+
+    with open(QUESTIONS) as f:
+        questions = json.load(f)
+    for item in questions:
+        item["relevant"] = [normalize(phrase) for phrase in item["relevant"]]
+
+    embeddings = call_embed_model(MODEL)
+    chunks = chunk_documents(load_documents(args.data))
+    vectorstore = Chroma.from_documents(chunks, embeddings, collection_name="retrieval-benchmark")
+    print(f"{len(chunks)} chunks, {len(questions)} questions\n")
+
+    def vector_only(question, query_vector):
+        return [doc.page_content for doc in vectorstore.similarity_search_by_vector(query_vector, k=args.k)]
+
+    hybrid = HybridRetriever(vectorstore, k=args.k, vector_candidates=args.candidates,
+                             keyword_candidates=args.candidates, rerank=False)
+    hybrid.keyword_index()
+
+    def bm25_only(question, query_vector):
+        return [text for _, text, _ in hybrid.keyword_search(question, args.k)]
+
+    def hybrid_fused(question, query_vector):
+        return [doc.page_content for doc in hybrid.search(question, query_vector)]
+
+    run("vector", vector_only, questions, embeddings, args.k, args.repeats)
+    run("bm25", bm25_only, questions, embeddings, args.k, args.repeats)
+    run("hybrid (rrf)", hybrid_fused, questions, embeddings, args.k, args.repeats)
+
+    if not args.no_rerank:
+        hybrid.rerank = True
+        hybrid.rerank_candidates = args.rerank_candidates
+        run(f"hybrid + rerank@{args.rerank_candidates}", hybrid_fused, questions, embeddings, args.k, args.repeats)
+
+    vectorstore.delete_collection()
+
+
+if __name__ == "__main__":
+    main()
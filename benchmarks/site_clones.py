@@ -0,0 +1,99 @@
+"""Site clone answers: per-request Excel read and map render versus the in-memory dataset and map cache.
+
+Usage: python -m benchmarks.site_clones [--requests 20] [--sites 2000] [--clones 500] [--k 3]
+
+"before" repeats what api_server did for "clones ... Lagoa Rica": read
+data/productivity.xlsx with pandas, sort the first row's scores and draw
+the annotated map with PIL. "after" asks productivity.site_recommendation,
+which reads the sheet once and reuses the map rendered for the same
+recommendation. Maps are written to a temporary directory.
+
+The second table times only the top-k selection on a synthetic sheet of
+--sites rows by --clones clones: sorting a {clone: score} dict as before
+versus np.argpartition over the score row.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from productivity import PRODUCTIVITY_PATH, SITE_MAP_DIR, ProductivityData, SiteMapCache
+
+
+def before(output_dir, k):
+    import pandas as pd
+    from PIL import Image, ImageDraw
+
+    df = pd.read_excel(PRODUCTIVITY_PATH)
+    clone_scores = df.drop(columns=["longitude", "latitude", "project"]).iloc[0].to_dict()
+    top_clones = sorted(clone_scores.items(), key=lambda x: x[1], reverse=True)[:k]
+    base_image = Image.open(os.path.join(SITE_MAP_DIR, "LagoaRica.png")).convert("RGBA")
+    overlay = Image.new("RGBA", base_image.size, (255, 255, 255, 0))
+    draw = ImageDraw.Draw(overlay)
+    draw.text((20, 30), "Top Recommended Clones:", fill=(255, 0, 0, 255))
+    for i, (clone, score) in enumerate(top_clones):
+        draw.text((20, 65 + i * 35), f"{i+1}. {clone} - Score {score:.2f}", fill=(255, 0, 0, 255))
+    Image.alpha_composite(base_image, overlay).save(os.path.join(output_dir, "Lagoa_Rica_Annotated.png"))
+    return top_clones
+
+
+def timed(fn, requests):
+    times = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return result, times
+
+
+def report(name, times):
+    print(f"{name:<22} first {times[0] * 1000:8.2f} ms   p50 {statistics.median(times) * 1000:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--sites", type=int, default=2000)
+    parser.add_argument("--clones", type=int, default=500)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        data = ProductivityData(PRODUCTIVITY_PATH)
+        maps = SiteMapCache(output_dir=output_dir)
+
+        def after():
+            top = data.top_clones("Lagoa Rica", args.k)
+            maps.get("Lagoa Rica", top)
+            return top
+
+        old, before_times = timed(lambda: before(output_dir, args.k), args.requests)
+        new, after_times = timed(after, args.requests)
+        print(f"Lagoa Rica, {args.requests} requests (same top {args.k}: "
+              f"{[c for c, _ in old] == [c for c, _ in new]})")
+        report("before (read + render)", before_times)
+        report("after (memory + cache)", after_times)
+
+    rng = np.random.default_rng(0)
+    scores = rng.uniform(10, 50, size=(args.sites, args.clones))
+    clones = [f"C{i:05d}" for i in range(args.clones)]
+    rows = rng.integers(0, args.sites, size=1000)
+
+    started = time.perf_counter()
+    for row in rows:
+        sorted(dict(zip(clones, scores[row])).items(), key=lambda x: x[1], reverse=True)[:args.k]
+    sort_us = (time.perf_counter() - started) / len(rows) * 1e6
+
+    started = time.perf_counter()
+    for row in rows:
+        best = np.argpartition(scores[row], -args.k)[-args.k:]
+        best[np.argsort(scores[row][best])[::-1]]
+    partition_us = (time.perf_counter() - started) / len(rows) * 1e6
+    print(f"\ntop-{args.k} of {args.clones} clones: sorted dict {sort_us:.1f} us, argpartition {partition_us:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
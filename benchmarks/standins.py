@@ -0,0 +1,190 @@
+"""Offline stand-ins for the services api_server depends on, for load tests.
+
+install_standins() points the app at local replacements, with all state
+under one temporary directory:
+
+- Ollama: benchmarks.stub_ollama at a fixed token rate.
+- Embedding model: HashingEmbeddings, a deterministic bag-of-words hash,
+  so the RAG path (Chroma, BM25, answer cache) runs without HuggingFace.
+- Geocoding: a small GeoNames-format gazetteer of the cities in the
+  traffic mix, with Nominatim off.
+- PostGIS: RecordedFeatures returns a deterministic feature row per point
+  with the width of DataCollection.sql's SELECT, after a configurable
+  delay, in place of species_data_handler.fetch_features.
+- Species model: a logistic regression fitted on those rows over the
+  species codes in data/species_metadata.csv.
+- Sessions, the feature cache, feature tiles and site maps are kept in
+  the temporary directory so the working tree is untouched.
+"""
+import csv
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.stub_ollama import start_stub_ollama
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, country, lat, lon, population) for the gazetteer stand-in
+CITIES = [
+    ("Curitiba", "BR", -25.4284, -49.2733, 1948626),
+    ("Belo Horizonte", "BR", -19.9208, -43.9378, 2373224),
+    ("Pietermaritzburg", "ZA", -29.6168, 30.3928, 750845),
+    ("Raleigh", "US", 35.7721, -78.6386, 474069),
+    ("Concordia", "AR", -31.3929, -58.0209, 145210),
+    ("Bogota", "CO", 4.6097, -74.0818, 7674366),
+    ("Nelspruit", "ZA", -25.4753, 30.9694, 110159),
+    ("Sao Paulo", "BR", -23.5475, -46.6361, 10021295),
+]
+
+
+class HashingEmbeddings:
+    """Deterministic embeddings from hashed word counts (LangChain Embeddings interface)."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "little")
+            vector[h % self.dim] += 1.0 if h & 1 << 31 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+def feature_columns(sql_path=os.path.join(BASE_DIR, "DataCollection.sql")):
+    """Output columns of the feature query's final SELECT."""
+    with open(sql_path) as f:
+        sql = f.read()
+    final_select = sql[sql.rindex("\nSELECT"):]
+    return re.findall(r"\bAS\s+(\w+)\s*,?\s*$", final_select, re.MULTILINE)
+
+
+class RecordedFeatures:
+    """Replaces species_data_handler.fetch_features: one smooth, deterministic
+    row per point, returned after delay + per_point * len(points) seconds."""
+
+    def __init__(self, n_features, delay=0.02, per_point=0.0005):
+        self.n_features = n_features
+        self.delay = delay
+        self.per_point = per_point
+        self.calls = 0
+        self._phases = np.random.default_rng(7).uniform(0, 2 * np.pi, size=(2, n_features))
+
+    def rows(self, points):
+        lat = np.array([p[0] for p in points], dtype=np.float64)[:, None]
+        lon = np.array([p[1] for p in points], dtype=np.float64)[:, None]
+        return np.sin(np.radians(lat) * 3 + self._phases[0]) + np.cos(np.radians(lon) * 2 + self._phases[1])
+
+    def __call__(self, points):
+        from tracing import span
+
+        self.calls += 1
+        with span("postgis_query", points=len(points)):
+            time.sleep(self.delay + self.per_point * len(points))
+            return self.rows(points)
+
+
+def species_codes(path=os.path.join(BASE_DIR, "data", "species_metadata.csv")):
+    with open(path, encoding="utf-8-sig") as f:
+        return [row["Code"] for row in csv.DictReader(f)]
+
+
+def fit_species_model(features, directory):
+    """Fit a small classifier on synthetic points and save it as the registry expects."""
+    import joblib
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import LabelEncoder
+
+    rng = np.random.default_rng(11)
+    points = np.column_stack([rng.uniform(-35, 40, 600), rng.uniform(-80, 35, 600)])
+    x = features.rows(points)
+    codes = species_codes()
+    encoder = LabelEncoder().fit(codes)
+    y = encoder.transform([codes[i] for i in np.argmax(x[:, :len(codes)], axis=1)])
+    model = LogisticRegression(max_iter=300).fit(x, y)
+
+    model_path = os.path.join(directory, "xgb_model.joblib")
+    encoder_path = os.path.join(directory, "label_encoder.joblib")
+    joblib.dump(model, model_path)
+    joblib.dump(encoder, encoder_path)
+    return model_path, encoder_path
+
+
+def write_gazetteer(directory, cities=CITIES):
+    dump = os.path.join(directory, "cities.txt")
+    with open(dump, "w", encoding="utf-8") as f:
+        for i, (name, country, lat, lon, population) in enumerate(cities):
+            fields = [str(i), name, name, "", str(lat), str(lon), "P", "PPL", country,
+                      "", "", "", "", "", str(population), "", "", "", ""]
+            f.write("\t".join(fields) + "\n")
+    return dump
+
+
+def install_standins(tokens_per_second=50.0, tokens=40, first_token_delay=0.05, db_delay=0.02):
+    """Start the stub Ollama and swap every external dependency for a local one.
+
+    Must run before api_server is imported. Returns (api_server module,
+    handles) where handles holds the stub server, the feature source and
+    the temporary directory.
+    """
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    stub, stub_url = start_stub_ollama(tokens_per_second=tokens_per_second, tokens=tokens,
+                                       first_token_delay=first_token_delay)
+    os.environ["OLLAMA_BASE_URL"] = stub_url
+    os.environ["WARM_UP_ON_START"] = "0"
+    os.environ["GEOCODE_ONLINE"] = "0"
+    os.environ.pop("EMBEDDING_SERVER_URL", None)
+
+    import geocoding
+    import feature_tiles
+    import model_registry
+    import productivity
+    import species_data_handler
+    import suitability_map
+    from feature_cache import FeatureCache
+    from rag_functions import chat_history
+
+    geocoding.geocoder.gazetteer = geocoding.Gazetteer(write_gazetteer(workdir),
+                                                       os.path.join(workdir, "gazetteer.npz"))
+    geocoding.geocoder.cache = geocoding.GeocodeCache(os.path.join(workdir, "geocode.sqlite"))
+    geocoding.geocoder.online = False
+
+    features = RecordedFeatures(len(feature_columns()), delay=db_delay)
+    model_path, encoder_path = fit_species_model(features, workdir)
+    species_data_handler.registry = model_registry.ModelRegistry(
+        model_path, encoder_path, os.path.join(BASE_DIR, "DataCollection.sql"),
+        os.path.join(BASE_DIR, "DataCollectionBatch.sql"))
+    suitability_map.registry = species_data_handler.registry
+    species_data_handler.fetch_features = features
+    species_data_handler._source_version = lambda: "standin"
+    species_data_handler.feature_cache = FeatureCache(path=os.path.join(workdir, "features.sqlite"))
+    species_data_handler.tile_store = feature_tiles.TileStore(root=os.path.join(workdir, "tiles"))
+
+    os.makedirs(os.path.join(workdir, "sessions"))
+    chat_history.session_store = chat_history.SessionStore(root=os.path.join(workdir, "sessions"))
+    productivity.site_maps.output_dir = os.path.join(workdir, "maps")
+
+    import api_server
+
+    api_server.session_store = chat_history.session_store
+    api_server.call_embed_model = lambda model_name: HashingEmbeddings()
+    api_server.db_path = os.path.join(workdir, "chroma_db")
+    return api_server, {"stub": stub, "features": features, "workdir": workdir}
@@ -0,0 +1,104 @@
+"""Local stand-in for the Ollama HTTP API.
+
+Streams NDJSON from /api/generate and /api/chat at a fixed token rate so
+benchmarks can measure time-to-first-byte and throughput without a model.
+With --prompt-tokens-per-second the first token is also delayed in
+proportion to the prompt length (about 4 characters per token), like a
+real model's prompt evaluation.
+
+Usage: python -m benchmarks.stub_ollama [--port 11434] [--tokens-per-second 30] [--tokens 200]
+                                        [--prompt-tokens-per-second 0]
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    tokens_per_second = 30.0
+    tokens = 200
+    first_token_delay = 0.0
+    prompt_tokens_per_second = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        model = body.get("model", "stub")
+        chat = self.path.startswith("/api/chat")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        delay = self.first_token_delay
+        if self.prompt_tokens_per_second > 0:
+            prompt = body.get("prompt") or "".join(m.get("content", "") for m in body.get("messages", []))
+            delay += len(prompt) / 4 / self.prompt_tokens_per_second
+        time.sleep(delay)
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        for i in range(self.tokens):
+            token = f"tok{i} "
+            if chat:
+                line = {"model": model, "message": {"role": "assistant", "content": token}, "done": False}
+            else:
+                line = {"model": model, "response": token, "done": False}
+            self._write_chunk(json.dumps(line) + "\n")
+            if interval:
+                time.sleep(interval)
+
+        final = {"model": model, "done": True, "done_reason": "stop"}
+        if chat:
+            final["message"] = {"role": "assistant", "content": ""}
+        else:
+            final["response"] = ""
+        self._write_chunk(json.dumps(final) + "\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_stub_ollama(port=0, tokens_per_second=30.0, tokens=200, first_token_delay=0.0,
+                      prompt_tokens_per_second=0.0):
+    """Start the stub in a background thread; returns (server, base_url)."""
+    handler = type("Handler", (StubOllamaHandler,), {
+        "tokens_per_second": tokens_per_second,
+        "tokens": tokens,
+        "first_token_delay": first_token_delay,
+        "prompt_tokens_per_second": prompt_tokens_per_second,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, url = start_stub_ollama(args.port, args.tokens_per_second, args.tokens, args.first_token_delay,
+                                    args.prompt_tokens_per_second)
+    print(f"Stub Ollama listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
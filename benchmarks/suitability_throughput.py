@@ -0,0 +1,52 @@
+"""Vectorized suitability inference throughput in cells/second.
+
+Usage: python -m benchmarks.suitability_throughput [--cells 200000] [--chunk 50000] [--nthread N]
+
+Feeds a random feature grid through suitability_map.predict_grid with the
+registry model, so only XGBoost inference is measured (no PostGIS, no
+rendering). Compares against the old one-cell-at-a-time predict loop on a
+small sample.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from model_registry import registry
+from suitability_map import predict_grid
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cells", type=int, default=200_000)
+    parser.add_argument("--chunk", type=int, default=50_000)
+    parser.add_argument("--nthread", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--single-sample", type=int, default=200)
+    args = parser.parse_args()
+
+    model = registry.model
+    n_features = model.n_features_in_
+    side = int(np.sqrt(args.cells))
+    rng = np.random.default_rng(0)
+    grid = rng.normal(size=(side, side, n_features))
+
+    predict_grid(grid[:1, :1])  # warm-up
+
+    t0 = time.perf_counter()
+    predict_grid(grid, chunk=args.chunk, nthread=args.nthread)
+    elapsed = time.perf_counter() - t0
+    cells = side * side
+    print(f"vectorized: {cells} cells in {elapsed:.2f}s -> {cells / elapsed:,.0f} cells/s "
+          f"(chunk={args.chunk}, nthread={args.nthread})")
+
+    sample = grid.reshape(-1, n_features)[:args.single_sample]
+    t0 = time.perf_counter()
+    for row in sample:
+        model.predict_proba(row.reshape(1, -1))
+    elapsed = time.perf_counter() - t0
+    print(f"per-cell:   {len(sample)} cells in {elapsed:.2f}s -> {len(sample) / elapsed:,.0f} cells/s")
+
+
+if __name__ == "__main__":
+    main()
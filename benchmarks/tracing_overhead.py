@@ -0,0 +1,62 @@
+"""Per-call cost of spans and disabled log calls, next to the print they replace.
+
+Usage: python -m benchmarks.tracing_overhead [--calls 200000]
+
+Times an empty span with tracing on (histogram only), on with TRACE_LOG
+(histogram plus the per-request span list), and off (TRACING=0); a
+logger.debug call below the configured level; and print() of a short
+message to /dev/null, which is what the hot path did before.
+"""
+import argparse
+import logging
+import os
+import time
+
+import tracing
+
+
+def per_call_ns(fn, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+
+    def empty_span():
+        with tracing.span("bench"):
+            pass
+
+    def span_in_trace():
+        with tracing.Trace("bench_request"):
+            with tracing.span("bench"):
+                pass
+
+    results = {}
+    tracing.TRACING, tracing.TRACE_LOG = True, False
+    results["span (metrics only)"] = per_call_ns(empty_span, args.calls)
+    tracing.TRACE_LOG = True
+    tracing.logger.disabled = True
+    results["trace + span (TRACE_LOG=1)"] = per_call_ns(span_in_trace, args.calls)
+    tracing.TRACING = False
+    results["span (TRACING=0)"] = per_call_ns(empty_span, args.calls)
+
+    logger = logging.getLogger("bench")
+    logger.setLevel(logging.INFO)
+    lat, lon = -25.43, -49.27
+    results["logger.debug, disabled"] = per_call_ns(
+        lambda: logger.debug("Predicting species for: %s, %s", lat, lon), args.calls)
+    with open(os.devnull, "w") as devnull:
+        results["print to /dev/null"] = per_call_ns(
+            lambda: print("Predicting species for:", lat, lon, file=devnull), args.calls)
+
+    for name, ns in results.items():
+        print(f"{name:<28} {ns:8.0f} ns/call")
+
+
+if __name__ == "__main__":
+    main()
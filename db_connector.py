@@ -1,35 +1,299 @@
 import psycopg2
-import sshtunnel
+import psycopg2.pool
 import os
+import time
 import logging
+import threading
+from contextlib import contextmanager
 
-def get_db_connection():
-    tunnel = sshtunnel.SSHTunnelForwarder(
-        (os.getenv("SSH_HOST"), 22),
-        ssh_username=os.getenv("SSH_USER"),
-        ssh_password=os.getenv("SSH_PASSWORD"),
-        remote_bind_address=('127.0.0.1', 5432),
-        local_bind_address=('127.0.0.1', 5433),
-        logger=logging.getLogger("sshtunnel"),
-    )
-    print("Tunnel object created. Starting now…")
-    try:
+from tracing import record
+
+# One tunnel and one bounded pool per process. When SSH_HOST is not set the
+# pool connects straight to DB_HOST:DB_PORT, which is how a local Postgres is used.
+POOL_MIN_CONN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX", "8"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# A pooled connection idle for longer than this (seconds) gets a SELECT 1
+# before it is handed out; fresher ones are used as they are. After an
+# OperationalError the next borrow also checks the tunnel.
+HEALTH_CHECK_IDLE = float(os.getenv("DB_HEALTH_CHECK_IDLE", "30"))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionManager:
+    """Process-wide tunnel and connection pool.
+
+    When the tunnel or the database goes away, a new tunnel and pool are
+    swapped in and the old pool is retired: connections borrowed from it go
+    back to it, and it is closed (with its tunnel) once the last one returns.
+    """
+
+    def __init__(self, minconn=POOL_MIN_CONN, maxconn=POOL_MAX_CONN, timeout=POOL_TIMEOUT,
+                 idle_check=HEALTH_CHECK_IDLE):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._tunnel = None
+        self._pool = None
+        self._in_use = {}       # pool -> connections currently borrowed from it
+        self._retired = {}      # replaced pool -> its tunnel, closed when its in-use count reaches 0
+        self._last_used = {}    # pooled connection -> time.monotonic() it was returned
+        self._suspect = False   # set by an OperationalError; the next borrow checks the tunnel
+        self._stats = {
+            "borrowed": 0,
+            "in_use": 0,
+            "timeouts": 0,
+            "reconnects": 0,
+            "discarded": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+        }
+
+    def _start_tunnel(self):
+        if not os.getenv("SSH_HOST"):
+            return None
+        import sshtunnel  # pulls in paramiko; only needed when tunnelling
+
+        tunnel = sshtunnel.SSHTunnelForwarder(
+            (os.getenv("SSH_HOST"), int(os.getenv("SSH_PORT", "22"))),
+            ssh_username=os.getenv("SSH_USER"),
+            ssh_password=os.getenv("SSH_PASSWORD"),
+            remote_bind_address=('127.0.0.1', 5432),
+            # port 0 lets the OS pick a free port so workers never race for 5433
+            local_bind_address=('127.0.0.1', 0),
+            logger=logging.getLogger("sshtunnel"),
+        )
         tunnel.start()
-        print("Tunnel started successfully")
-    except Exception as e:
-        print(e)
-        raise
-    tunnel.start()
-
-    conn = psycopg2.connect(
-        dbname=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        host="localhost",
-        port=5433,
-        connect_timeout=5,
-    )
-
-
-    print("Connected!!!")
-    return conn, tunnel
\ No newline at end of file
+        return tunnel
+
+    def _tunnel_alive(self):
+        tunnel = self._tunnel
+        if tunnel is None:
+            return not os.getenv("SSH_HOST")
+        try:
+            tunnel.check_tunnels()
+            return tunnel.is_active and all(tunnel.tunnel_is_up.values())
+        except Exception:
+            return False
+
+    def _connect_kwargs(self):
+        if self._tunnel is not None:
+            host, port = "127.0.0.1", self._tunnel.local_bind_port
+        else:
+            host, port = os.getenv("DB_HOST", "localhost"), int(os.getenv("DB_PORT", "5432"))
+        return dict(
+            dbname=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=host,
+            port=port,
+            connect_timeout=5,
+        )
+
+    # The helpers below run with self._lock held.
+
+    def _open(self):
+        self._tunnel = self._start_tunnel()
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            self.minconn, self.maxconn, **self._connect_kwargs()
+        )
+        self._in_use[self._pool] = 0
+
+    def _close(self, pool, tunnel):
+        self._in_use.pop(pool, None)
+        self._retired.pop(pool, None)
+        try:
+            pool.closeall()
+        except Exception:
+            pass
+        if tunnel is not None:
+            try:
+                tunnel.stop()
+            except Exception:
+                pass
+        self._last_used = {conn: t for conn, t in self._last_used.items() if not conn.closed}
+
+    def _retire(self, pool, tunnel):
+        if self._in_use.get(pool):
+            self._retired[pool] = tunnel
+        else:
+            self._close(pool, tunnel)
+
+    def _reconnect(self, stale):
+        """Replace the pool unless another thread already replaced `stale`."""
+        if self._pool is stale:
+            self._stats["reconnects"] += 1
+            pool, tunnel = self._pool, self._tunnel
+            self._pool = self._tunnel = None
+            self._retire(pool, tunnel)
+            self._open()
+        return self._pool
+
+    def _release(self, pool):
+        self._in_use[pool] -= 1
+        if pool in self._retired and not self._in_use[pool]:
+            self._close(pool, self._retired[pool])
+
+    # ---
+
+    def _acquire(self):
+        """Pick the current pool and count a borrow against it, so it is not closed under us."""
+        with self._lock:
+            if self._pool is None:
+                self._open()
+            pool = self._pool
+            self._in_use[pool] += 1
+            suspect, self._suspect = self._suspect, False
+        if suspect and not self._tunnel_alive():
+            with self._lock:
+                fresh = self._reconnect(pool)
+                self._in_use[fresh] += 1
+                self._release(pool)
+            pool = fresh
+        return pool, suspect
+
+    @staticmethod
+    def _healthy(conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self):
+        pool, suspect = self._acquire()
+        try:
+            conn = pool.getconn()
+            with self._lock:
+                returned_at = self._last_used.get(conn)
+            stale = returned_at is not None and time.monotonic() - returned_at > self.idle_check
+            if (suspect or stale or conn.closed) and not self._healthy(conn):
+                pool.putconn(conn, close=True)
+                with self._lock:
+                    self._stats["discarded"] += 1
+                    self._last_used.pop(conn, None)
+                if not self._tunnel_alive():
+                    with self._lock:
+                        fresh = self._reconnect(pool)
+                        self._in_use[fresh] += 1
+                        self._release(pool)
+                    pool = fresh
+                conn = pool.getconn()
+        except Exception:
+            with self._lock:
+                self._release(pool)
+            raise
+        return pool, conn
+
+    def _checkin(self, pool, conn, close):
+        if not close and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                close = True
+        try:
+            pool.putconn(conn, close=close)
+        finally:
+            with self._lock:
+                if close:
+                    self._last_used.pop(conn, None)
+                else:
+                    self._last_used[conn] = time.monotonic()
+                self._stats["in_use"] -= 1
+                self._release(pool)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection and return it to the pool it came from on exit."""
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+        try:
+            pool, conn = self._checkout()
+            waited = time.perf_counter() - started
+            record("db_connection", waited)
+            with self._lock:
+                self._stats["borrowed"] += 1
+                self._stats["in_use"] += 1
+                self._stats["wait_total"] += waited
+                self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+
+            broken = False
+            try:
+                yield conn
+                conn.commit()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+                with self._lock:
+                    self._suspect = True
+                raise
+            except Exception:
+                if not conn.closed:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        broken = True
+                raise
+            finally:
+                self._checkin(pool, conn, close=broken or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["retired_pools"] = len(self._retired)
+        stats["max_conn"] = self.maxconn
+        stats["wait_avg"] = stats["wait_total"] / stats["borrowed"] if stats["borrowed"] else 0.0
+        stats["tunnel"] = self._tunnel is not None
+        return stats
+
+    def close(self):
+        with self._lock:
+            for pool, tunnel in list(self._retired.items()):
+                self._close(pool, tunnel)
+            if self._pool is not None:
+                self._close(self._pool, self._tunnel)
+            self._pool = self._tunnel = None
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_connection_manager():
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ConnectionManager()
+    return _manager
+
+
+def db_connection():
+    return get_connection_manager().connection()
+
+
+def pool_stats():
+    return get_connection_manager().stats()
+
+
+def close_db():
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+            _manager = None
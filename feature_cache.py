@@ -0,0 +1,208 @@
+import os
+import sys
+import math
+import time
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+# Features only change from one raster cell to the next, so points are snapped
+# to a grid of this size (degrees) and the cell centre is what gets queried.
+CELL_DEG = float(os.getenv("FEATURE_CACHE_CELL_DEG", str(1 / 120)))
+# Aggregation window hard-coded in DataCollection.sql / DataCollectionBatch.sql.
+DATE_WINDOW = "2020-01-01/2023-12-31"
+MEMORY_SIZE = int(os.getenv("FEATURE_CACHE_SIZE", "10000"))
+TTL_SECONDS = float(os.getenv("FEATURE_CACHE_TTL", str(30 * 24 * 3600)))
+CACHE_PATH = os.getenv("FEATURE_CACHE_PATH", os.path.join(BASE_DIR, "cache", "features.sqlite"))
+# How often (seconds) to ask PostGIS whether the raster tables changed; 0 disables.
+VERSION_CHECK_INTERVAL = float(os.getenv("FEATURE_CACHE_VERSION_CHECK", "300"))
+
+SOURCE_TABLES = ("era5_data", "terraclim_data", "spei_data", "elev_data")
+SOURCE_VERSION_SQL = """
+SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0)::text
+FROM pg_stat_user_tables
+WHERE relname = ANY(%s)
+"""
+
+
+def snap(lat, lon, cell_deg=CELL_DEG):
+    """Return the integer grid cell containing (lat, lon)."""
+    return math.floor(lat / cell_deg), math.floor(lon / cell_deg)
+
+
+def cell_center(cell, cell_deg=CELL_DEG):
+    row, col = cell
+    return (row + 0.5) * cell_deg, (col + 0.5) * cell_deg
+
+
+class FeatureCache:
+    """Two-tier (in-memory LRU + SQLite) cache of feature vectors keyed by grid cell."""
+
+    def __init__(self, path=CACHE_PATH, memory_size=MEMORY_SIZE, ttl=TTL_SECONDS,
+                 cell_deg=CELL_DEG, window=DATE_WINDOW):
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.cell_deg = cell_deg
+        self.window = window
+        self.source_version = None
+        self._version_checked_at = 0.0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS features ("
+                " cell_row INTEGER, cell_col INTEGER, cell_deg REAL, window TEXT,"
+                " created REAL, vector BLOB,"
+                " PRIMARY KEY (cell_row, cell_col, cell_deg, window))"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.commit()
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'source_version'").fetchone()
+            self.source_version = row[0] if row else None
+
+    def key(self, lat, lon):
+        return snap(lat, lon, self.cell_deg)
+
+    def _fresh(self, created):
+        return self.ttl <= 0 or time.time() - created < self.ttl
+
+    def get(self, cell):
+        with self._lock:
+            entry = self._memory.get(cell)
+            if entry is not None:
+                created, vector = entry
+                if self._fresh(created):
+                    self._memory.move_to_end(cell)
+                    self._stats["memory_hits"] += 1
+                    return vector
+                del self._memory[cell]
+                self._stats["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, vector FROM features"
+                    " WHERE cell_row = ? AND cell_col = ? AND cell_deg = ? AND window = ?",
+                    (cell[0], cell[1], self.cell_deg, self.window),
+                ).fetchone()
+                if row is not None and self._fresh(row[0]):
+                    vector = np.frombuffer(row[1], dtype=np.float64)
+                    self._remember(cell, row[0], vector)
+                    self._stats["disk_hits"] += 1
+                    return vector
+                if row is not None:
+                    self._stats["expired"] += 1
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, cell, vector):
+        self.put_many([(cell, vector)])
+
+    def put_many(self, items):
+        """Store (cell, vector) pairs, written to SQLite in one transaction."""
+        created = time.time()
+        rows = []
+        with self._lock:
+            for cell, vector in items:
+                vector = np.asarray(vector, dtype=np.float64)
+                self._remember(cell, created, vector)
+                rows.append((cell[0], cell[1], self.cell_deg, self.window, created, vector.tobytes()))
+            if self._db is not None and rows:
+                with self._db:
+                    self._db.executemany("INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def _remember(self, cell, created, vector):
+        self._memory[cell] = (created, vector)
+        self._memory.move_to_end(cell)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, source_version=None):
+        """Drop every cached vector, e.g. after the raster tables were reloaded."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM features")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('source_version', ?)", (source_version,)
+                )
+                self._db.commit()
+            self.source_version = source_version
+
+    def check_source_version(self, fetch_version):
+        """Invalidate when fetch_version() reports a change in the source tables.
+
+        Only asks at most once every VERSION_CHECK_INTERVAL seconds. If the
+        source cannot be reached, cached vectors keep being served.
+        """
+        if VERSION_CHECK_INTERVAL <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._version_checked_at and now - self._version_checked_at < VERSION_CHECK_INTERVAL:
+                return
+            self._version_checked_at = now
+        try:
+            version = fetch_version()
+        except Exception as e:
+            logger.warning("Could not check the raster tables for changes, serving cached features: %s", e)
+            return
+        if version != self.source_version:
+            if self.source_version is not None:
+                logger.info("Raster tables changed (%s -> %s), clearing feature cache", self.source_version, version)
+            self.invalidate(version)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+feature_cache = FeatureCache()
+
+
+def main(argv):
+    """python -m feature_cache warm <csv of lat,lon> | invalidate | stats"""
+    if not argv or argv[0] not in ("warm", "invalidate", "stats"):
+        print(main.__doc__)
+        return 1
+
+    if argv[0] == "invalidate":
+        feature_cache.invalidate()
+        print("Feature cache cleared")
+    elif argv[0] == "stats":
+        print(feature_cache.stats())
+    else:
+        import csv
+        from species_data_handler import prewarm_feature_cache
+
+        points = []
+        with open(argv[1]) as f:
+            for row in csv.reader(f):
+                try:
+                    points.append((float(row[0]), float(row[1])))
+                except (IndexError, ValueError):
+                    continue  # header or blank line
+        fetched = prewarm_feature_cache(points)
+        print(f"Warmed {fetched} cells for {len(points)} sites")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import shutil
+import threading
+import numpy as np
+
+from feature_cache import CELL_DEG, DATE_WINDOW, snap, cell_center
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+TILES_DIR = os.getenv("FEATURE_TILES_DIR", os.path.join(BASE_DIR, "tiles"))
+BUILD_BATCH = int(os.getenv("FEATURE_TILES_BATCH", "500"))
+# How often (seconds) the store stats the tile directory for new or rebuilt
+# regions; 0 disables the check (regions are then read once per process).
+CHECK_INTERVAL = float(os.getenv("FEATURE_TILES_CHECK_INTERVAL", "30"))
+
+
+def _region_names(root):
+    # builds in progress live in hidden ".<name>.building" directories
+    return [name for name in sorted(os.listdir(root)) if not name.startswith(".")]
+
+
+class Region:
+    """One precomputed bounding box: a (rows, cols, n_features) memory-mapped array
+    indexed by grid cell, plus a mask of the cells that have been filled."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.row0 = self.meta["row0"]
+        self.col0 = self.meta["col0"]
+        self.rows = self.meta["rows"]
+        self.cols = self.meta["cols"]
+        self.features = np.load(os.path.join(path, "features.npy"), mmap_mode="r")
+        self.filled = np.load(os.path.join(path, "filled.npy"), mmap_mode="r")
+
+    def lookup(self, cell):
+        r = cell[0] - self.row0
+        c = cell[1] - self.col0
+        if 0 <= r < self.rows and 0 <= c < self.cols and self.filled[r, c]:
+            return self.features[r, c]
+        return None
+
+
+class TileStore:
+    def __init__(self, root=TILES_DIR, cell_deg=CELL_DEG, window=DATE_WINDOW, check_interval=CHECK_INTERVAL):
+        self.root = root
+        self.cell_deg = cell_deg
+        self.window = window
+        self.check_interval = check_interval
+        self._regions = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _due(self, now):
+        if self._regions is None:
+            return True
+        return self.check_interval > 0 and now - self._checked_at >= self.check_interval
+
+    @property
+    def regions(self):
+        now = time.monotonic()
+        if self._due(now):
+            with self._lock:
+                if self._due(now):
+                    signature = self._scan()
+                    if self._regions is None or signature != self._signature:
+                        if self._regions is not None:
+                            logger.info("Tile regions changed on disk, reloading")
+                        self._regions = self._load()
+                        self._signature = signature
+                    self._checked_at = time.monotonic()
+        return self._regions
+
+    def _scan(self):
+        """(name, meta.json mtime) of every built region. A new region adds an
+        entry and a rebuild swaps in a directory with a new meta.json."""
+        if not os.path.isdir(self.root):
+            return ()
+        signature = []
+        for name in _region_names(self.root):
+            meta_path = os.path.join(self.root, name, "meta.json")
+            if os.path.exists(meta_path):
+                signature.append((name, os.path.getmtime(meta_path)))
+        return tuple(signature)
+
+    def _load(self):
+        regions = []
+        if not os.path.isdir(self.root):
+            return regions
+        for name in _region_names(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.exists(os.path.join(path, "meta.json")):
+                continue
+            region = Region(path)
+            if region.meta["cell_deg"] == self.cell_deg and region.meta["window"] == self.window:
+                regions.append(region)
+            else:
+                logger.warning("Skipping tile region %s: built for a different grid or date window", name)
+        return regions
+
+    def reload(self):
+        with self._lock:
+            self._regions = None
+
+    def lookup(self, cell):
+        """Feature vector for a grid cell as a read-only view into the tile file, or None."""
+        for region in self.regions:
+            vector = region.lookup(cell)
+            if vector is not None:
+                return vector
+        return None
+
+
+tile_store = TileStore()
+
+
+def build_region(name, min_lon, min_lat, max_lon, max_lat, fetch_features,
+                 root=TILES_DIR, cell_deg=CELL_DEG, batch=BUILD_BATCH):
+    """Extract features for every grid cell in the bounding box into tiles/<name>.
+
+    The region is built in tiles/.<name>.building and swapped in once every
+    cell is filled, so servers that have the previous version memory-mapped
+    keep reading its (unlinked) files. meta.json is written last; re-running
+    with the same arguments resumes an interrupted build.
+    """
+    if max_lon < min_lon or max_lat < min_lat:
+        raise ValueError(f"Inverted bounding box: expected MIN_LON <= MAX_LON and MIN_LAT <= MAX_LAT, "
+                         f"got {min_lon} {min_lat} {max_lon} {max_lat}")
+    row0, col0 = snap(min_lat, min_lon, cell_deg)
+    row1, col1 = snap(max_lat, max_lon, cell_deg)
+    rows, cols = row1 - row0 + 1, col1 - col0 + 1
+    path = os.path.join(root, name)
+    building = os.path.join(root, f".{name}.building")
+    meta = {
+        "name": name,
+        "bbox": [min_lon, min_lat, max_lon, max_lat],
+        "cell_deg": cell_deg,
+        "window": DATE_WINDOW,
+        "row0": row0,
+        "col0": col0,
+        "rows": rows,
+        "cols": cols,
+    }
+
+    existing = _read_meta(os.path.join(path, "meta.json"))
+    if (existing is not None and all(existing.get(k) == v for k, v in meta.items())
+            and np.load(os.path.join(path, "filled.npy"), mmap_mode="r").all()):
+        logger.info("Region %s is already built", name)
+        return path
+
+    # build.json holds the target meta while the build is in progress
+    progress_path = os.path.join(building, "build.json")
+    features_path = os.path.join(building, "features.npy")
+    filled_path = os.path.join(building, "filled.npy")
+    features = None
+    in_progress = _read_meta(progress_path)
+    if in_progress is not None and all(in_progress.get(k) == v for k, v in meta.items()):
+        features = np.load(features_path, mmap_mode="r+")
+        filled = np.load(filled_path, mmap_mode="r+")
+    else:
+        shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building, exist_ok=True)
+
+    todo = [(r, c) for r in range(rows) for c in range(cols)]
+    if features is not None:
+        todo = [(r, c) for r, c in todo if not filled[r, c]]
+    logger.info("Region %s: %dx%d cells, %d to extract", name, rows, cols, len(todo))
+
+    started = time.perf_counter()
+    done = 0
+    for start in range(0, len(todo), batch):
+        chunk = todo[start:start + batch]
+        centers = [cell_center((row0 + r, col0 + c), cell_deg) for r, c in chunk]
+        values = fetch_features(centers)
+
+        if features is None:
+            features = np.lib.format.open_memmap(
+                features_path, mode="w+", dtype=np.float64, shape=(rows, cols, values.shape[1])
+            )
+            features[:] = np.nan
+            filled = np.lib.format.open_memmap(filled_path, mode="w+", dtype=np.bool_, shape=(rows, cols))
+            _write_json(progress_path, dict(meta, n_features=int(values.shape[1])))
+
+        idx_r = np.array([r for r, _ in chunk])
+        idx_c = np.array([c for _, c in chunk])
+        features[idx_r, idx_c] = values
+        filled[idx_r, idx_c] = True
+        features.flush()
+        filled.flush()
+
+        done += len(chunk)
+        elapsed = time.perf_counter() - started
+        logger.info("  %d/%d cells (%.1f cells/s)", done, len(todo), done / elapsed)
+
+    del features, filled
+    os.replace(progress_path, os.path.join(building, "meta.json"))
+    if os.path.exists(path):
+        previous = os.path.join(root, f".{name}.previous")
+        shutil.rmtree(previous, ignore_errors=True)
+        os.replace(path, previous)
+        os.replace(building, path)
+        shutil.rmtree(previous, ignore_errors=True)
+    else:
+        os.replace(building, path)
+
+    tile_store.reload()
+    return path
+
+
+def _read_meta(meta_path):
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def _write_json(target, data):
+    tmp_path = target + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, target)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Precompute climate/elevation feature tiles for a region")
+    parser.add_argument("name", help="region name, used as the directory under tiles/")
+    parser.add_argument("--bbox", type=float, nargs=4, required=True,
+                        metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"))
+    parser.add_argument("--batch", type=int, default=BUILD_BATCH, help="cells per PostGIS query")
+    args = parser.parse_args(argv)
+
+    from species_data_handler import fetch_features
+    from tracing import configure_logging
+
+    configure_logging()
+    try:
+        build_region(args.name, *args.bbox, fetch_features=fetch_features, batch=args.batch)
+    except ValueError as exc:
+        parser.error(str(exc))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,456 @@
+import os
+import re
+import sys
+import time
+import logging
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+
+from spatial import PointIndex
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+# Place names are resolved from the geocode cache first, then from a local GeoNames
+# dump (e.g. cities15000.txt from https://download.geonames.org/export/dump/,
+# optionally with countryInfo.txt and admin1CodesASCII.txt in the same folder), and
+# only then from Nominatim, which gets GEOCODE_DEADLINE seconds in total. Gazetteer
+# and Nominatim results (and definitive Nominatim misses) are written to the cache.
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(BASE_DIR, "data", "gazetteer", "cities15000.txt"))
+GAZETTEER_INDEX_PATH = os.getenv("GAZETTEER_INDEX_PATH", os.path.join(BASE_DIR, "cache", "gazetteer.npz"))
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", os.path.join(BASE_DIR, "cache", "geocode.sqlite"))
+GEOCODE_ONLINE = os.getenv("GEOCODE_ONLINE", "1") != "0"
+GEOCODE_DEADLINE = float(os.getenv("GEOCODE_DEADLINE", "5"))
+NEGATIVE_TTL = float(os.getenv("GEOCODE_NEGATIVE_TTL", str(24 * 3600)))
+REVERSE_MAX_KM = float(os.getenv("GEOCODE_REVERSE_MAX_KM", "50"))
+# Reverse lookups are cached per cell of this size (degrees), roughly 1 km.
+REVERSE_CELL_DEG = 0.01
+# Nominatim's usage policy allows one request per second.
+NOMINATIM_INTERVAL = 1.0
+
+
+def normalize_name(name):
+    """Lower-case ASCII form of a place name used as the lookup key ("São Paulo" -> "sao paulo")."""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c)).lower()
+    name = re.sub(r"\bst\.?\s+", "saint ", name)
+    return re.sub(r"[^a-z0-9]+", " ", name).strip()
+
+
+def name_hash(normalized):
+    return int.from_bytes(hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def parse_coordinates(text):
+    """(lat, lon) when the text is a "lat, lon" pair, else None."""
+    parts = [p.strip() for p in text.split(",")]
+    if len(parts) != 2:
+        return None
+    try:
+        lat, lon = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
+def _read_qualifiers(folder):
+    """Normalized country / first-level region names -> (country code, admin1 code or "")."""
+    qualifiers = {}
+    country_path = os.path.join(folder, "countryInfo.txt")
+    if os.path.exists(country_path):
+        with open(country_path, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+                p = line.rstrip("\n").split("\t")
+                if len(p) > 4:
+                    qualifiers[normalize_name(p[4])] = (p[0], "")
+                    qualifiers[normalize_name(p[1])] = (p[0], "")
+    admin1_path = os.path.join(folder, "admin1CodesASCII.txt")
+    if os.path.exists(admin1_path):
+        with open(admin1_path, encoding="utf-8") as f:
+            for line in f:
+                p = line.rstrip("\n").split("\t")
+                if len(p) > 2 and "." in p[0]:
+                    country, admin1 = p[0].split(".", 1)
+                    for name in (p[1], p[2]):
+                        qualifiers.setdefault(normalize_name(name), (country, admin1))
+    return qualifiers
+
+
+def compile_gazetteer(dump_path, index_path=GAZETTEER_INDEX_PATH):
+    """Parse a GeoNames dump into the compact .npz index that Gazetteer loads."""
+    names, countries, admin1s, lats, lons, populations = [], [], [], [], [], []
+    keys = []
+    with open(dump_path, encoding="utf-8") as f:
+        for line in f:
+            p = line.rstrip("\n").split("\t")
+            if len(p) < 15:
+                continue
+            row = len(names)
+            names.append(p[1])
+            lats.append(float(p[4]))
+            lons.append(float(p[5]))
+            countries.append(p[8])
+            admin1s.append(p[10])
+            populations.append(int(p[14] or 0))
+            variants = {normalize_name(p[1]), normalize_name(p[2])}
+            variants.update(normalize_name(alt) for alt in p[3].split(",") if alt)
+            keys.extend((name_hash(v), row) for v in variants if v)
+
+    populations = np.array(populations, dtype=np.int64)
+    key_hashes = np.array([k for k, _ in keys], dtype=np.uint64)
+    key_rows = np.array([r for _, r in keys], dtype=np.int32)
+    # by hash, then most populous first, so a lookup's first row is the likeliest match
+    order = np.lexsort((-populations[key_rows], key_hashes))
+
+    qualifiers = _read_qualifiers(os.path.dirname(dump_path))
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp = index_path + ".tmp.npz"
+    np.savez(
+        tmp,
+        names=np.array(names), countries=np.array(countries), admin1s=np.array(admin1s),
+        lats=np.array(lats, dtype=np.float32), lons=np.array(lons, dtype=np.float32),
+        populations=populations, hashes=key_hashes[order], rows=key_rows[order],
+        qualifier_names=np.array(list(qualifiers), dtype=str),
+        qualifier_codes=np.array([f"{c}.{a}" for c, a in qualifiers.values()], dtype=str),
+    )
+    os.replace(tmp, index_path)
+    return len(names)
+
+
+class Gazetteer:
+    """Offline place index: a sorted table of name hashes for forward lookups
+    and a spatial.PointIndex for nearest-place lookups.
+
+    Compiled from the GeoNames dump on first use (and again when the dump is
+    newer than the compiled index). Empty when no dump is available.
+    """
+
+    def __init__(self, dump_path=GAZETTEER_PATH, index_path=GAZETTEER_INDEX_PATH):
+        self.dump_path = dump_path
+        self.index_path = index_path
+        self._data = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self._load()
+        return self._data
+
+    def _load(self):
+        if os.path.exists(self.dump_path) and (
+                not os.path.exists(self.index_path)
+                or os.path.getmtime(self.index_path) < os.path.getmtime(self.dump_path)):
+            started = time.perf_counter()
+            count = compile_gazetteer(self.dump_path, self.index_path)
+            logger.info("Compiled gazetteer of %d places in %.1fs", count, time.perf_counter() - started)
+        if not os.path.exists(self.index_path):
+            logger.warning("No gazetteer at %s: place names will only be resolved from the cache and Nominatim. "
+                           "Download a GeoNames dump and run `python -m geocoding build` (see README).",
+                           self.dump_path)
+            return {}
+
+        with np.load(self.index_path) as f:
+            data = {key: f[key] for key in f.files}
+        data["index"] = PointIndex(data["lats"], data["lons"])
+        data["qualifiers"] = {
+            name: tuple(code.split(".", 1))
+            for name, code in zip(data.pop("qualifier_names"), data.pop("qualifier_codes"))
+        }
+        return data
+
+    def __len__(self):
+        data = self.load()
+        return len(data["names"]) if data else 0
+
+    def _rows(self, normalized):
+        data = self.load()
+        h = np.uint64(name_hash(normalized))
+        lo = np.searchsorted(data["hashes"], h, side="left")
+        hi = np.searchsorted(data["hashes"], h, side="right")
+        return data["rows"][lo:hi]
+
+    def lookup(self, query):
+        """(lat, lon) of the most populous place matching the query, or None.
+
+        "Name, Qualifier" prefers places in that country or first-level region
+        when the qualifier is known.
+        """
+        data = self.load()
+        if not data:
+            return None
+        parts = [normalize_name(p) for p in query.split(",")]
+        parts = [p for p in parts if p]
+        if not parts:
+            return None
+
+        rows = self._rows(" ".join(parts))
+        if len(rows) == 0:
+            rows = self._rows(parts[0])
+        if len(rows) == 0:
+            return None
+
+        for qualifier in parts[1:]:
+            country, admin1 = data["qualifiers"].get(qualifier, (qualifier.upper(), ""))
+            match = data["countries"][rows] == country
+            if admin1:
+                match &= data["admin1s"][rows] == admin1
+            if match.any():
+                rows = rows[match]
+        row = rows[0]
+        return float(data["lats"][row]), float(data["lons"][row])
+
+    def reverse(self, lat, lon, max_km=REVERSE_MAX_KM):
+        """Name of the nearest place within max_km, or None."""
+        data = self.load()
+        if not data:
+            return None
+        row, distance_km = data["index"].nearest(lat, lon)
+        if distance_km > max_km:
+            return None
+        return str(data["names"][row])
+
+
+class GeocodeCache:
+    """SQLite cache of forward (name -> coordinates) and reverse (cell -> name) results."""
+
+    def __init__(self, path=GEOCODE_CACHE_PATH, negative_ttl=NEGATIVE_TTL):
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS forward ("
+                " query TEXT PRIMARY KEY, lat REAL, lon REAL, source TEXT, created REAL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS reverse ("
+                " cell TEXT PRIMARY KEY, name TEXT, source TEXT, created REAL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def cell(lat, lon):
+        return f"{round(lat / REVERSE_CELL_DEG)}:{round(lon / REVERSE_CELL_DEG)}"
+
+    def get_forward(self, key):
+        """(found, coords): found is False on a miss; coords is None for a cached "not found"."""
+        if self._db is None:
+            return False, None
+        with self._lock:
+            row = self._db.execute("SELECT lat, lon, created FROM forward WHERE query = ?", (key,)).fetchone()
+        if row is None:
+            return False, None
+        if row[0] is None:
+            if time.time() - row[2] > self.negative_ttl:
+                return False, None
+            return True, None
+        return True, (row[0], row[1])
+
+    def put_forward(self, key, coords, source):
+        if self._db is None:
+            return
+        lat, lon = coords if coords else (None, None)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO forward VALUES (?, ?, ?, ?, ?)",
+                             (key, lat, lon, source, time.time()))
+            self._db.commit()
+
+    def get_reverse(self, lat, lon):
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT name FROM reverse WHERE cell = ?", (self.cell(lat, lon),)).fetchone()
+        return row[0] if row else None
+
+    def put_reverse(self, lat, lon, name, source):
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO reverse VALUES (?, ?, ?, ?)",
+                             (self.cell(lat, lon), name, source, time.time()))
+            self._db.commit()
+
+    def clear(self):
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM forward")
+            self._db.execute("DELETE FROM reverse")
+            self._db.commit()
+
+
+class Geocoder:
+    """Forward and reverse geocoding: cache, then the offline gazetteer, then Nominatim.
+
+    Nominatim is only asked when the local sources have no answer, at most
+    once per NOMINATIM_INTERVAL, and all attempts for one lookup share a
+    single deadline, so a lookup never blocks for more than `deadline` seconds.
+    """
+
+    def __init__(self, gazetteer=None, cache=None, online=GEOCODE_ONLINE, deadline=GEOCODE_DEADLINE):
+        self.gazetteer = gazetteer or Gazetteer()
+        self.cache = cache or GeocodeCache()
+        self.online = online
+        self.deadline = deadline
+        self._nominatim = None
+        self._nominatim_lock = threading.Lock()
+        self._last_request = 0.0
+        self._stats_lock = threading.Lock()
+        self._stats = {"cache": 0, "gazetteer": 0, "nominatim": 0, "not_found": 0, "deadline_exceeded": 0}
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _geolocator(self):
+        # geopy is slow to import and only needed for the online fallback
+        if self._nominatim is None:
+            from geopy.geocoders import Nominatim
+            self._nominatim = Nominatim(user_agent="species_locator_app")
+        return self._nominatim
+
+    def _ask_nominatim(self, method, queries):
+        """Try each query until one answers; returns (result, definitive).
+
+        definitive is False when the deadline or a network error cut the attempts short.
+        """
+        from geopy.exc import GeopyError
+
+        deadline = time.monotonic() + self.deadline
+        definitive = True
+        for query in queries:
+            slot = self._reserve_slot(deadline)
+            if slot is None:
+                self._count("deadline_exceeded")
+                return None, False
+            time.sleep(max(slot - time.monotonic(), 0))
+            try:
+                result = getattr(self._geolocator(), method)(
+                    query, exactly_one=True, timeout=max(deadline - time.monotonic(), 0.1))
+            except (GeopyError, OSError):
+                definitive = False
+                continue
+            if result:
+                return result, True
+        return None, definitive
+
+    def _reserve_slot(self, deadline):
+        """Book the next request time allowed by NOMINATIM_INTERVAL, or None if it is past the deadline.
+
+        Only the booking holds the lock; the request itself runs outside it, so
+        one slow Nominatim call does not hold up other lookups.
+        """
+        with self._nominatim_lock:
+            slot = max(time.monotonic(), self._last_request + NOMINATIM_INTERVAL)
+            if slot >= deadline:
+                return None
+            self._last_request = slot
+            return slot
+
+    def geocode(self, query):
+        """(lat, lon) for a place name or a "lat, lon" string, or None."""
+        coords = parse_coordinates(query)
+        if coords:
+            return coords
+
+        key = normalize_name(query)
+        found, coords = self.cache.get_forward(key)
+        if found:
+            self._count("cache")
+            return coords
+
+        coords = self.gazetteer.lookup(query)
+        if coords:
+            self._count("gazetteer")
+            self.cache.put_forward(key, coords, "gazetteer")
+            return coords
+
+        if self.online:
+            attempts = [query, query.title(), re.sub(r"\bSt\.?\s+", "Saint ", query)]
+            if "," in query:
+                attempts.append(query.split(",")[0].strip())
+            location, definitive = self._ask_nominatim("geocode", list(dict.fromkeys(attempts)))
+            if location:
+                self._count("nominatim")
+                coords = (location.latitude, location.longitude)
+                self.cache.put_forward(key, coords, "nominatim")
+                return coords
+            if definitive:
+                self.cache.put_forward(key, None, "nominatim")
+
+        self._count("not_found")
+        return None
+
+    def reverse(self, lat, lon):
+        """Name of the place at (lat, lon), or None."""
+        name = self.cache.get_reverse(lat, lon)
+        if name:
+            self._count("cache")
+            return name
+
+        name = self.gazetteer.reverse(lat, lon)
+        source = "gazetteer"
+        if name is None and self.online:
+            location, _ = self._ask_nominatim("reverse", [f"{lat},{lon}"])
+            name = location.address.split(",")[0] if location else None
+            source = "nominatim"
+        if name:
+            self._count(source)
+            self.cache.put_reverse(lat, lon, name, source)
+        else:
+            self._count("not_found")
+        return name
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        return dict(stats, gazetteer_places=len(self.gazetteer))
+
+
+geocoder = Geocoder()
+
+
+def geocode(query):
+    return geocoder.geocode(query)
+
+
+def reverse_geocode(lat, lon):
+    return geocoder.reverse(lat, lon)
+
+
+def main(argv):
+    """python -m geocoding build [dump] | lookup <place> | reverse <lat> <lon> | clear-cache"""
+    if not argv or argv[0] not in ("build", "lookup", "reverse", "clear-cache"):
+        print(main.__doc__)
+        return 1
+
+    if argv[0] == "build":
+        dump = argv[1] if len(argv) > 1 else GAZETTEER_PATH
+        started = time.perf_counter()
+        count = compile_gazetteer(dump)
+        print(f"Indexed {count} places into {GAZETTEER_INDEX_PATH} in {time.perf_counter() - started:.1f}s")
+    elif argv[0] == "lookup":
+        print(geocode(" ".join(argv[1:])))
+    elif argv[0] == "reverse":
+        print(reverse_geocode(float(argv[1]), float(argv[2])))
+    else:
+        geocoder.cache.clear()
+        print("Geocode cache cleared")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,132 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+import joblib
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(BASE_DIR, "XGBModel")
+
+logger = logging.getLogger(__name__)
+
+# How often (seconds) the registry stats the files to look for a newer version.
+RELOAD_CHECK_INTERVAL = float(os.getenv("MODEL_RELOAD_CHECK_INTERVAL", "5"))
+
+
+def _read_text(path):
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _load_classifier(model_path, encoder_path):
+    model = joblib.load(model_path)
+    encoder = joblib.load(encoder_path)
+    class_ids = np.asarray(getattr(model, "classes_", []))
+    # the model predicts encoded class ids; each must be a class of this encoder
+    if np.issubdtype(class_ids.dtype, np.integer) and len(class_ids) and class_ids.max() >= len(encoder.classes_):
+        raise ValueError(f"{os.path.basename(encoder_path)} has {len(encoder.classes_)} classes, "
+                         f"{os.path.basename(model_path)} predicts {len(class_ids)}")
+    return model, encoder
+
+
+class _Artifact:
+    """A value loaded from one or more files, reloaded as a whole when any of them changes."""
+
+    def __init__(self, paths, loader):
+        self.paths = tuple(paths)
+        self.loader = loader
+        self.value = None
+        self.mtime = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self, check_interval):
+        now = time.monotonic()
+        if self.value is not None and now - self.checked_at < check_interval:
+            return self.value
+
+        with self.lock:
+            if self.value is not None and now - self.checked_at < check_interval:
+                return self.value
+            mtime = tuple(os.path.getmtime(path) for path in self.paths)
+            if self.value is None or mtime != self.mtime:
+                names = ", ".join(os.path.basename(path) for path in self.paths)
+                try:
+                    value = self.loader(*self.paths)
+                except Exception:
+                    if self.value is None:
+                        raise
+                    # e.g. a deploy that has replaced only one file so far; retried at the next check
+                    logger.warning("Keeping the loaded %s: reload failed", names, exc_info=True)
+                else:
+                    if self.value is not None:
+                        logger.info("Reloaded %s", names)
+                    self.value, self.mtime = value, mtime
+            self.checked_at = time.monotonic()
+            return self.value
+
+
+class ModelRegistry:
+    """Loads the species classifier and label encoder (as one pair) and the
+    feature SQL once, and reloads each when its files change on disk."""
+
+    def __init__(self, model_path, encoder_path, sql_path, batch_sql_path=None,
+                 check_interval=RELOAD_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._artifacts = {
+            "classifier": _Artifact([model_path, encoder_path], _load_classifier),
+            "query": _Artifact([sql_path], _read_text),
+        }
+        if batch_sql_path:
+            self._artifacts["batch_query"] = _Artifact([batch_sql_path], _read_text)
+
+    @property
+    def classifier(self):
+        """(model, encoder) from the same load. Take both from one call: reading
+        .model and .encoder separately can straddle a reload and decode the new
+        model's predictions with the old encoder."""
+        return self._artifacts["classifier"].get(self.check_interval)
+
+    @property
+    def model(self):
+        return self.classifier[0]
+
+    @property
+    def encoder(self):
+        return self.classifier[1]
+
+    @property
+    def query(self):
+        return self._artifacts["query"].get(self.check_interval)
+
+    @property
+    def batch_query(self):
+        return self._artifacts["batch_query"].get(self.check_interval)
+
+    def warm_up(self):
+        """Load every artifact and run one prediction so the first request is not the slow one."""
+        started = time.perf_counter()
+        for artifact in self._artifacts.values():
+            artifact.get(self.check_interval)
+        model, encoder = self.classifier
+
+        n_features = getattr(model, "n_features_in_", None)
+        if n_features:
+            y_pred = model.predict(np.zeros((1, n_features)))
+            encoder.inverse_transform(y_pred)
+        return time.perf_counter() - started
+
+
+registry = ModelRegistry(
+    os.path.join(MODEL_DIR, "xgb_model.joblib"),
+    os.path.join(MODEL_DIR, "label_encoder.joblib"),
+    os.path.join(BASE_DIR, "DataCollection.sql"),
+    os.path.join(BASE_DIR, "DataCollectionBatch.sql"),
+)
+
+
+def warm_up():
+    """Warm the species model; errors propagate so the caller can report them."""
+    elapsed = registry.warm_up()
+    logger.info("Species model warmed up in %.2fs", elapsed)
@@ -0,0 +1,228 @@
+import os
+import re
+import sys
+import uuid
+import hashlib
+import threading
+import numpy as np
+
+from spatial import PointIndex
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PRODUCTIVITY_PATH = os.getenv("PRODUCTIVITY_PATH", os.path.join(BASE_DIR, "data", "productivity.xlsx"))
+# Base images are looked up as <SITE_MAP_DIR>/<site name without spaces>.png ("LagoaRica.png").
+SITE_MAP_DIR = os.getenv("SITE_MAP_DIR", os.path.join(BASE_DIR, "data"))
+MAP_OUTPUT_DIR = os.getenv("MAP_OUTPUT_DIR", os.path.join(BASE_DIR, "static", "maps"))
+MAP_URL_PREFIX = "/static/maps/"
+# A location question with a clone word is answered from the nearest site within this distance.
+SITE_RADIUS_KM = float(os.getenv("PRODUCTIVITY_SITE_RADIUS_KM", "25"))
+META_COLUMNS = ("longitude", "latitude", "project")
+
+# Site facts that are not in the sheet.
+SITE_NOTES = {
+    "Lagoa Rica": [
+        "Located in Cluster 2",
+        "Water Deficit Historic: 66 mm",
+        "Precipitation Historic: 1343 mm",
+        "Water Deficit Forecast: 153 mm",
+    ],
+}
+
+
+def site_key(name):
+    return " ".join(str(name).lower().split())
+
+
+def site_slug(name):
+    return re.sub(r"[^A-Za-z0-9]+", "", str(name))
+
+
+class ProductivityData:
+    """The productivity sheet held as columns: one score matrix (rows x clones)
+    plus coordinate and project arrays, an index from site name to its rows
+    and a KD-tree over the row coordinates.
+
+    Loaded on first use and again when the file changes. Missing scores are NaN.
+    """
+
+    def __init__(self, path=PRODUCTIVITY_PATH):
+        self.path = path
+        self._data = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+        if self._data is None or mtime != self._mtime:
+            with self._lock:
+                if self._data is None or mtime != self._mtime:
+                    self._data = self._load() if mtime is not None else {}
+                    self._mtime = mtime
+        return self._data
+
+    def _load(self):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(self.path, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h) for h in next(rows)]
+        rows = [row for row in rows if any(v is not None for v in row)]
+        workbook.close()
+
+        clone_columns = [i for i, h in enumerate(header) if h not in META_COLUMNS]
+        project = header.index("project")
+        scores = np.array([[np.nan if row[i] is None else row[i] for i in clone_columns] for row in rows],
+                          dtype=np.float64).reshape(len(rows), len(clone_columns))
+        lons = np.array([row[header.index("longitude")] for row in rows], dtype=np.float64)
+        lats = np.array([row[header.index("latitude")] for row in rows], dtype=np.float64)
+        projects = [str(row[project]) if row[project] is not None else "" for row in rows]
+
+        site_rows = {}
+        names = {}
+        for i, name in enumerate(projects):
+            if name:
+                site_rows.setdefault(site_key(name), []).append(i)
+                names.setdefault(site_key(name), name)
+        located = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+        return {
+            "clones": [header[i] for i in clone_columns],
+            "scores": scores,
+            "lats": lats,
+            "lons": lons,
+            "projects": projects,
+            "site_rows": {key: np.array(r) for key, r in site_rows.items()},
+            "site_names": names,
+            "located": located,
+            "index": PointIndex(lats[located], lons[located]) if len(located) else None,
+        }
+
+    @property
+    def clones(self):
+        return list(self.load().get("clones", []))
+
+    def sites(self):
+        return sorted(self.load().get("site_names", {}).values())
+
+    def site_scores(self, site):
+        """{clone: score} for a site, averaged over its rows; None for an unknown site."""
+        data = self.load()
+        rows = data.get("site_rows", {}).get(site_key(site))
+        if rows is None:
+            return None
+        return dict(zip(data["clones"], self._site_vector(data, rows).tolist()))
+
+    @staticmethod
+    def _site_vector(data, rows):
+        if len(rows) == 1:
+            return data["scores"][rows[0]]
+        return np.nanmean(data["scores"][rows], axis=0)
+
+    def top_clones(self, site, k=3):
+        """[(clone, score)] of the k best-scoring clones at a site, best first."""
+        data = self.load()
+        rows = data.get("site_rows", {}).get(site_key(site))
+        if rows is None:
+            return []
+        scores = np.nan_to_num(self._site_vector(data, rows), nan=-np.inf)
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        best = np.argpartition(scores, -k)[-k:]
+        best = best[np.argsort(scores[best])[::-1]]
+        return [(data["clones"][i], float(scores[i])) for i in best]
+
+    def nearest_site(self, lat, lon, max_km=SITE_RADIUS_KM):
+        """Name of the site with a row nearest to (lat, lon) within max_km, or None."""
+        data = self.load()
+        if not data or data["index"] is None:
+            return None
+        i, distance_km = data["index"].nearest(lat, lon)
+        if distance_km > max_km:
+            return None
+        return data["projects"][data["located"][i]] or None
+
+
+class SiteMapCache:
+    """Annotated site maps stored under a name derived from their content.
+
+    The name hashes the base image, the site and the clones drawn on it, so
+    the same recommendation is rendered once and concurrent requests never
+    write to a file someone else is reading.
+    """
+
+    def __init__(self, map_dir=SITE_MAP_DIR, output_dir=MAP_OUTPUT_DIR, url_prefix=MAP_URL_PREFIX):
+        self.map_dir = map_dir
+        self.output_dir = output_dir
+        self.url_prefix = url_prefix
+        self._base_digests = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "renders": 0}
+
+    def base_path(self, site):
+        return os.path.join(self.map_dir, f"{site_slug(site)}.png")
+
+    def _base_digest(self, path):
+        mtime = os.path.getmtime(path)
+        cached = self._base_digests.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, "rb") as f:
+            digest = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+        self._base_digests[path] = (mtime, digest)
+        return digest
+
+    def get(self, site, top_clones):
+        """URL of the site map annotated with top_clones; None when the site has no base image."""
+        base_path = self.base_path(site)
+        if not os.path.exists(base_path):
+            return None
+        key = "|".join([self._base_digest(base_path), site] + [f"{c}={s:.2f}" for c, s in top_clones])
+        filename = f"{site_slug(site)}-{hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()}.png"
+        path = os.path.join(self.output_dir, filename)
+        if os.path.exists(path):
+            with self._lock:
+                self._stats["hits"] += 1
+        else:
+            self._render(base_path, top_clones, path)
+            with self._lock:
+                self._stats["renders"] += 1
+        return self.url_prefix + filename
+
+    def _render(self, base_path, top_clones, path):
+        from PIL import Image, ImageDraw
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base_image = Image.open(base_path).convert("RGBA")
+        overlay = Image.new("RGBA", base_image.size, (255, 255, 255, 0))
+        draw = ImageDraw.Draw(overlay)
+        draw.text((20, 30), "Top Recommended Clones:", fill=(255, 0, 0, 255))
+        for i, (clone, score) in enumerate(top_clones):
+            draw.text((20, 65 + i * 35), f"{i+1}. {clone} - Score {score:.2f}", fill=(255, 0, 0, 255))
+
+        # written under a private name and renamed, so readers only ever see a complete file
+        tmp_path = os.path.join(self.output_dir, f".{uuid.uuid4().hex}.png")
+        try:
+            Image.alpha_composite(base_image, overlay).save(tmp_path, format="PNG")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+productivity = ProductivityData()
+site_maps = SiteMapCache()
+
+
+def site_recommendation(site, k=3):
+    """(top clones, map URL or None) for a site in the productivity sheet."""
+    top = productivity.top_clones(site, k)
+    return top, site_maps.get(site, top) if top else None
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or productivity.sites():
+        print(name, productivity.top_clones(name))
@@ -0,0 +1,237 @@
+import os
+import re
+import csv
+import sys
+import threading
+from collections import defaultdict
+
+from productivity import PRODUCTIVITY_PATH, ProductivityData, productivity
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SPECIES_METADATA_PATH = os.path.join(BASE_DIR, "data", "species_metadata.csv")
+
+# Built-in vocabulary. Prefix terms also match longer words ("plant" matches
+# "plantation", "near" matches "nearby"); exact terms need a word boundary.
+PREFIX_TERMS = {
+    "species_word": ["species", "clone", "plant", "forest", "recommend", "region", "genetic"],
+    "clone_word": ["clone"],
+    "location_trigger": ["grow in", "plant in", "species in", "near", "around", "at coordinates", "in region"],
+}
+EXACT_TERMS = {
+    "preposition": ["in", "near", "around", "for", "at"],
+}
+# The location phrase starts after the first location trigger, or after the first
+# preposition when there is no trigger, and runs to the next of these words or [?!;].
+LOCATION_END_WORDS = ["in", "near", "around", "for", "at", "during", "with", "on", "under", "over", "within",
+                      "from", "between", "if", "when", "where", "which", "that", "because", "since", "but",
+                      "while", "using"]
+
+# First intent whose every requirement is met wins. A requirement is a term kind,
+# or several kinds separated by "|" when any of them will do.
+INTENTS = [
+    {"name": "site_clones", "requires": ["clone_word", "site"]},
+    {"name": "location", "requires": ["species_word|species_code|clone_code", "location_trigger|coordinates"]},
+    {"name": "species", "requires": ["species_word|species_code|clone_code"]},
+]
+DEFAULT_INTENT = "general"
+
+COORDINATES_RE = r"(?P<coordinates>[-+]?\d{1,2}(?:\.\d+)?\s*,\s*[-+]?\d{1,3}(?:\.\d+)?)"
+# the location phrase: skip a leading "the", stop before an end word or [?!;]
+LOCATION_RE = re.compile(
+    r"\s*(?:the\s+)?(.*?)(?=[?!;]|\s(?:" + "|".join(LOCATION_END_WORDS) + r")\b|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+WORD_TAIL_RE = re.compile(r"\w*")
+
+
+def _trie_pattern(terms):
+    """Regex matching any of the terms, factored into a trie so shared prefixes are tested once.
+
+    terms maps each term to True when it may be followed by more word
+    characters (prefix term) or False when it must end on a word boundary.
+    Longer terms are tried before shorter ones that they extend.
+    """
+    root = {}
+    for term, is_prefix in terms.items():
+        node = root
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[None] = is_prefix
+
+    def build(node):
+        alternatives = [re.escape(ch) + build(child) for ch, child in sorted(
+            ((ch, child) for ch, child in node.items() if ch is not None))]
+        if None in node:
+            alternatives.append("" if node[None] else r"\b")
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return "(?:" + "|".join(alternatives) + ")"
+
+    return build(root)
+
+
+class QueryRouter:
+    """Routes a message to an intent and its slots with one scan of a combined regex.
+
+    Terms are registered by kind (e.g. "site" with the value "Lagoa Rica");
+    intents are rules over kinds (see INTENTS). route() returns a dict with
+    the intent, every recognised term grouped by kind, and the location and
+    coordinates slots.
+    """
+
+    def __init__(self, intents=INTENTS, default_intent=DEFAULT_INTENT):
+        self.intents = [(intent["name"], [frozenset(r.split("|")) for r in intent["requires"]])
+                        for intent in intents]
+        self.default_intent = default_intent
+        self._exact = defaultdict(list)
+        self._prefix = defaultdict(list)
+        self._pattern = None
+        self._pattern_ignorecase = None
+        self._lookup = {}
+        self._intent_for = {}
+
+    def register(self, kind, terms, prefix=False):
+        """Add terms of a kind. terms is a list of strings or a {term: value} dict."""
+        table = self._prefix if prefix else self._exact
+        items = terms.items() if isinstance(terms, dict) else ((t, t) for t in terms)
+        for term, value in items:
+            term = term.strip()
+            if term and (kind, value) not in table[term.lower()]:
+                table[term.lower()].append((kind, value))
+        self._pattern = None
+        return self
+
+    def compile(self):
+        terms = {t: t in self._prefix for t in set(self._exact) | set(self._prefix)}
+        # per term: its (kind, value) registrations and whether it is a location trigger / preposition
+        self._lookup = {}
+        for term in terms:
+            matches = self._prefix.get(term, []) + self._exact.get(term, [])
+            kinds = {kind for kind, _ in matches}
+            self._lookup[term] = (matches, "location_trigger" in kinds, "preposition" in kinds)
+        pattern = COORDINATES_RE
+        if terms:
+            pattern += rf"|\b(?P<term>{_trie_pattern(terms)})"
+        # Terms are stored lower-case and messages are lower-cased once before
+        # the scan; the case-insensitive twin is for the rare text whose length
+        # changes when lower-cased, so match positions still index the original.
+        self._pattern = re.compile(pattern)
+        self._pattern_ignorecase = re.compile(pattern, re.IGNORECASE)
+        return self
+
+    def _match_intent(self, kinds):
+        for name, requires in self.intents:
+            if all(not kinds.isdisjoint(options) for options in requires):
+                return name
+        return self.default_intent
+
+    def route(self, text):
+        if self._pattern is None:
+            self.compile()
+
+        found = {}
+        trigger_end = None
+        preposition_end = None
+        coordinates = None
+        cue_end = None
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            matches_found = self._pattern.finditer(lowered)
+        else:
+            matches_found = self._pattern_ignorecase.finditer(text)
+        for m in matches_found:
+            term = m.group("term")
+            if term is None:
+                lat_text, lon_text = m.group("coordinates").split(",")
+                lat, lon = float(lat_text), float(lon_text)
+                # "3,5" is only a position right after a trigger or preposition ("near 25,49");
+                # elsewhere both numbers need decimals ("-25.43, -49.27")
+                cued = cue_end is not None and not text[cue_end:m.start()].strip()
+                if (cued or "." in lat_text and "." in lon_text) and -90 <= lat <= 90 and -180 <= lon <= 180:
+                    coordinates = (lat, lon)
+                    found.setdefault("coordinates", []).append(coordinates)
+                continue
+            matches, is_trigger, is_preposition = self._lookup[term.lower()]
+            for kind, value in matches:
+                values = found.setdefault(kind, [])
+                if value not in values:
+                    values.append(value)
+            if is_trigger:
+                cue_end = WORD_TAIL_RE.match(text, m.end()).end()
+                if trigger_end is None:
+                    trigger_end = cue_end
+            elif is_preposition:
+                cue_end = m.end()
+            if is_preposition and preposition_end is None:
+                preposition_end = m.end()
+
+        location = None
+        location_start = trigger_end if trigger_end is not None else preposition_end
+        if coordinates is not None:
+            location = f"{coordinates[0]}, {coordinates[1]}"
+        elif location_start is not None:
+            location = LOCATION_RE.match(text, location_start).group(1).strip(" \t.,") or None
+
+        kinds = frozenset(found)
+        intent = self._intent_for.get(kinds)
+        if intent is None:
+            intent = self._intent_for[kinds] = self._match_intent(kinds)
+
+        return {
+            "intent": intent,
+            "location": location,
+            "coordinates": coordinates,
+            "terms": found,
+        }
+
+
+def productivity_terms(path=PRODUCTIVITY_PATH):
+    """Site names (the "project" column) and clone codes (the score columns) of the productivity sheet."""
+    data = productivity if path == productivity.path else ProductivityData(path)
+    return data.sites(), data.clones
+
+
+def species_terms(path=SPECIES_METADATA_PATH):
+    """{code or species name: code} from the species metadata table."""
+    terms = {}
+    if not os.path.exists(path):
+        return terms
+    with open(path, encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            terms[row["Code"]] = row["Code"]
+            terms[row["Genetic material"]] = row["Code"]
+    return terms
+
+
+def build_router(productivity_path=PRODUCTIVITY_PATH, species_path=SPECIES_METADATA_PATH):
+    router = QueryRouter()
+    for kind, terms in PREFIX_TERMS.items():
+        router.register(kind, terms, prefix=True)
+    for kind, terms in EXACT_TERMS.items():
+        router.register(kind, terms)
+    sites, clones = productivity_terms(productivity_path)
+    router.register("site", sites)
+    router.register("clone_code", clones)
+    router.register("species_code", species_terms(species_path))
+    return router.compile()
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = build_router()
+    return _router
+
+
+def route_query(text):
+    return get_router().route(text)
+
+
+if __name__ == "__main__":
+    print(route_query(" ".join(sys.argv[1:])))
@@ -0,0 +1,99 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from rag_functions.database import get_collection_version
+
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+
+
+def doc_key(docs):
+    """Order-insensitive identity of a retrieved document set."""
+    digests = []
+    for doc in docs:
+        source = f"{doc.metadata.get('source')}:{doc.metadata.get('page')}:{doc.page_content}"
+        digests.append(hashlib.sha1(source.encode("utf-8")).hexdigest())
+    return frozenset(digests)
+
+
+class SemanticAnswerCache:
+    """LRU cache of RAG answers keyed on the embedding of the standalone question.
+
+    A stored answer is served when a new question's embedding has cosine
+    similarity >= threshold with a cached one, retrieval returned the same
+    documents and the exact context (data substituted into the prompt, such as
+    a location and its predicted species) is equal. All entries are dropped when the Chroma collection changes.
+    """
+
+    def __init__(self, vectorstore, threshold=SIMILARITY_THRESHOLD, max_entries=MAX_ENTRIES):
+        self.vectorstore = vectorstore
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "latency_saved_s": 0.0}
+
+    def _check_version(self):
+        version = get_collection_version(self.vectorstore)
+        if version != self._version:
+            if self._entries:
+                self._stats["invalidations"] += 1
+            self._entries.clear()
+            self._version = version
+
+    def lookup(self, query_vector, docs, context=None):
+        """Return the cached answer for this question/doc set/context, or None."""
+        key = doc_key(docs)
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+
+        with self._lock:
+            self._check_version()
+            candidates = [(entry_id, e) for entry_id, e in self._entries.items() if e["docs"] == key and e["context"] == context]
+            if candidates:
+                matrix = np.stack([e["vector"] for _, e in candidates])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self._stats["hits"] += 1
+                    self._stats["latency_saved_s"] += entry["generation_s"]
+                    return entry["answer"]
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, query_vector, docs, answer, generation_s, context=None):
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self._lock:
+            self._check_version()
+            self._entries[self._next_id] = {
+                "vector": vector,
+                "docs": doc_key(docs),
+                "context": context,
+                "answer": answer,
+                "generation_s": generation_s,
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
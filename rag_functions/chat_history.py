@@ -1,52 +1,223 @@
 import os
+import re
+import sys
 import json
-from langchain_core.messages import AIMessage, HumanMessage
-from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_community.chat_message_histories import ChatMessageHistory
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from langchain_core.chat_history import BaseChatMessageHistory
 
 current_directory = os.path.dirname(os.path.abspath(__file__))
 history_dir = os.path.join(current_directory, "sessions")
 os.makedirs(history_dir, exist_ok=True)
 
-store = {}
+logger = logging.getLogger(__name__)
+
+# Sessions are append-only JSONL logs, sessions/<id>.jsonl, one message per
+# line. Only the most recently used histories are kept in memory; an evicted
+# session is simply re-read from its log on next use.
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "256"))
+LOCK_STRIPES = 64
+
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+def is_valid_session_id(session_id):
+    return bool(session_id) and SESSION_ID_RE.match(session_id) is not None
+
+
+class _CachedSession:
+    __slots__ = ("history", "offset")
+
+    def __init__(self, history):
+        self.history = history
+        self.offset = 0
+
 
-def get_session_history(session_id: str) -> BaseChatMessageHistory:
-    if session_id in store:
-        return store[session_id]
+class SessionStore:
+    """Chat sessions stored as append-only logs with an LRU cache of loaded histories.
 
-    history_file = os.path.join(history_dir, f"{session_id}.json")
-    history = ChatMessageHistory()
+    Each turn is one append to the session's log. Cached histories remember
+    how far into the log they have read and pick up lines appended since
+    (including by other worker processes) on the next access. Work on one
+    session is serialized by a lock chosen from a fixed set of stripes.
+    """
 
-    if os.path.exists(history_file):
-        try:
-            with open(history_file, "r", encoding="utf-8") as f:
-                messages = json.load(f)
+    def __init__(self, root=history_dir, max_sessions=SESSION_CACHE_SIZE):
+        self.root = root
+        self.max_sessions = max_sessions
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._stats = {"hits": 0, "loads": 0, "evictions": 0, "appends": 0, "migrated": 0}
+
+    def path(self, session_id):
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        return os.path.join(self.root, f"{session_id}.jsonl")
+
+    def legacy_path(self, session_id):
+        return os.path.join(self.root, f"{session_id}.json")
+
+    def lock(self, session_id):
+        return self._locks[hash(session_id) % LOCK_STRIPES]
+
+    def _migrate(self, session_id):
+        """Convert sessions/<id>.json (a JSON list rewritten on every turn) to the JSONL log."""
+        legacy = self.legacy_path(session_id)
+        if not os.path.exists(legacy):
+            return False
+        path = self.path(session_id)
+        if not os.path.exists(path):
+            try:
+                with open(legacy, "r", encoding="utf-8") as f:
+                    messages = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                logger.warning("Error migrating session %s: %s", session_id, e)
+                return False
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
                 for msg in messages:
-                    if msg.get("role") == "human":
-                        history.add_user_message(msg.get("content", ""))
-                    elif msg.get("role") == "ai":
-                        history.add_ai_message(msg.get("content", ""))
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error loading session {session_id}: {e}")
-
-    store[session_id] = history
-    return history
-
-def save_session_history(session_id: str):
-    if session_id not in store:
-        return
-
-    history = store[session_id]
-    messages = [
-        {"role": "human", "content": msg.content} if isinstance(msg, HumanMessage)
-        else {"role": "ai", "content": msg.content}
-        for msg in history.messages
-    ]
-
-    history_file = os.path.join(history_dir, f"{session_id}.json")
-
-    try:
-        with open(history_file, "w", encoding="utf-8") as f:
-            json.dump(messages, f, indent=2)
-    except IOError as e:
-        print(f"Error saving session {session_id}: {e}")
+                    f.write(json.dumps({"role": msg.get("role"), "content": msg.get("content", "")}) + "\n")
+            os.replace(tmp, path)
+            self._stats["migrated"] += 1
+        os.remove(legacy)
+        return True
+
+    def migrate_all(self):
+        migrated = 0
+        for name in os.listdir(self.root):
+            session_id, ext = os.path.splitext(name)
+            if ext == ".json" and is_valid_session_id(session_id):
+                with self.lock(session_id):
+                    migrated += self._migrate(session_id)
+        return migrated
+
+    @staticmethod
+    def _read_lines(path, offset):
+        """Records appended after offset, and the offset just past the last complete line."""
+        if not os.path.exists(path):
+            return [], offset
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        records = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                logger.warning("Skipping unreadable line in %s: %s", path, e)
+        return records, offset + end
+
+    def _refresh(self, session_id, cached):
+        path = self.path(session_id)
+        if os.path.exists(path) and os.path.getsize(path) < cached.offset:
+            cached.history.clear()
+            cached.offset = 0
+        records, cached.offset = self._read_lines(path, cached.offset)
+        for record in records:
+            if record.get("role") == "human":
+                cached.history.add_user_message(record.get("content", ""))
+            elif record.get("role") == "ai":
+                cached.history.add_ai_message(record.get("content", ""))
+
+    def history(self, session_id) -> "BaseChatMessageHistory":
+        """The session's ChatMessageHistory, loaded from its log or the cache."""
+        with self.lock(session_id):
+            with self._cache_lock:
+                cached = self._cache.get(session_id)
+                if cached is not None:
+                    self._cache.move_to_end(session_id)
+                    self._stats["hits"] += 1
+
+            if cached is None:
+                from langchain_community.chat_message_histories import ChatMessageHistory
+
+                self._migrate(session_id)
+                cached = _CachedSession(ChatMessageHistory())
+                self._stats["loads"] += 1
+                with self._cache_lock:
+                    self._cache[session_id] = cached
+                    while len(self._cache) > self.max_sessions:
+                        self._cache.popitem(last=False)
+                        self._stats["evictions"] += 1
+
+            self._refresh(session_id, cached)
+            return cached.history
+
+    def append_turn(self, session_id, user_message, ai_message):
+        """Append one question/answer turn to the session log and to its cached history."""
+        now = time.time()
+        lines = (
+            json.dumps({"role": "human", "content": user_message, "ts": now}) + "\n"
+            + json.dumps({"role": "ai", "content": ai_message, "ts": now}) + "\n"
+        )
+        with self.lock(session_id):
+            self._migrate(session_id)
+            with open(self.path(session_id), "a", encoding="utf-8") as f:
+                f.write(lines)
+            self._stats["appends"] += 1
+            with self._cache_lock:
+                cached = self._cache.get(session_id)
+            if cached is not None:
+                self._refresh(session_id, cached)
+
+    def create(self, session_id):
+        with self.lock(session_id):
+            self._migrate(session_id)
+            open(self.path(session_id), "a").close()
+
+    def messages(self, session_id):
+        """All messages of the session as {"role", "content"} dicts, oldest first."""
+        with self.lock(session_id):
+            self._migrate(session_id)
+            records, _ = self._read_lines(self.path(session_id), 0)
+        return [{"role": r.get("role"), "content": r.get("content", "")} for r in records]
+
+    def list_sessions(self):
+        """Session ids, most recently active first."""
+        sessions = {}
+        for name in os.listdir(self.root):
+            session_id, ext = os.path.splitext(name)
+            if ext in (".jsonl", ".json") and is_valid_session_id(session_id):
+                mtime = os.path.getmtime(os.path.join(self.root, name))
+                sessions[session_id] = max(mtime, sessions.get(session_id, 0))
+        return sorted(sessions, key=sessions.get, reverse=True)
+
+    def stats(self):
+        with self._cache_lock:
+            return dict(self._stats, cached=len(self._cache), max_sessions=self.max_sessions)
+
+
+session_store = SessionStore()
+
+
+def get_session_history(session_id: str) -> "BaseChatMessageHistory":
+    return session_store.history(session_id)
+
+def append_turn(session_id: str, user_message: str, ai_message: str):
+    session_store.append_turn(session_id, user_message, ai_message)
+
+
+def main(argv):
+    """python -m rag_functions.chat_history migrate | stats"""
+    if not argv or argv[0] not in ("migrate", "stats"):
+        print(main.__doc__)
+        return 1
+
+    if argv[0] == "migrate":
+        print(f"Migrated {session_store.migrate_all()} sessions to JSONL")
+    else:
+        print(session_store.stats())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,30 +1,52 @@
-from langchain_ollama import ChatOllama
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import create_retrieval_chain, create_history_aware_retriever
-from langchain.chains.combine_documents import create_stuff_documents_chain
+import threading
+import time
+from rag_functions.ollama_client import get_ollama_client, OLLAMA_BASE_URL
+from rag_functions.hybrid_search import HybridRetriever, RETRIEVAL_MODE
+
+# LangChain modules are imported inside the setup functions: they are only
+# needed once, when the pipeline is built, and are slow to import.
 
 def format_docs(docs):
     """Format retrieved documents for easy consumption."""
     return "\n\n".join(doc.page_content for doc in docs)
 
-def setup_llm(model_name, base_url="http://127.0.0.1:11434"):
-    """Initialize the chat model."""
-    return ChatOllama(model=model_name, base_url=base_url, keep_alive=-1)
+def setup_llm(model_name, base_url=OLLAMA_BASE_URL):
+    """Initialize the chat model on the shared Ollama connection settings."""
+    from langchain_ollama import ChatOllama
+
+    return ChatOllama(model=model_name, base_url=base_url, keep_alive=-1,
+                      client_kwargs=get_ollama_client().httpx_kwargs())
+
+def setup_contextualize_prompt():
+    """Prompt that turns the latest question plus chat history into a standalone query."""
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
-def setup_history_aware_retriever(llm, retriever):
-    """Create a history-aware retriever to improve question context handling."""
     system_prompt = (
         "Reformulate the latest user question into a standalone query, "
         "taking into account previous chat history. "
         "Do NOT answer the question, only rephrase it if needed."
     )
-    contextualize_q_prompt = ChatPromptTemplate.from_messages(
+    return ChatPromptTemplate.from_messages(
         [("system", system_prompt), MessagesPlaceholder("chat_history"), ("human", "{input}")]
     )
-    return create_history_aware_retriever(llm, retriever, contextualize_q_prompt)
+
+def setup_history_aware_retriever(llm, retriever):
+    """Create a history-aware retriever to improve question context handling."""
+    from langchain.chains import create_history_aware_retriever
+
+    return create_history_aware_retriever(llm, retriever, setup_contextualize_prompt())
+
+def setup_question_reformulator(llm):
+    """Chain returning the standalone question as a string."""
+    from langchain_core.output_parsers import StrOutputParser
+
+    return setup_contextualize_prompt() | llm | StrOutputParser()
 
 def setup_question_answer_chain(llm):
     """Create the RAG-based question-answering chain."""
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+
     system_prompt = (
         "You are an AI assistant. Use the provided context to answer the question accurately. "
         "If the answer is unknown, tell the user to search the web. Keep responses concise.\n\n"
@@ -35,11 +57,113 @@ def setup_question_answer_chain(llm):
     )
     return create_stuff_documents_chain(llm, qa_prompt)
 
-def setup_chain(model_name, retriever, base_url="http://127.0.0.1:11434"):
+def setup_chain(model_name, retriever, base_url=OLLAMA_BASE_URL):
     """Create the full retrieval-augmented generation (RAG) pipeline."""
+    from langchain.chains import create_retrieval_chain
+
     llm = setup_llm(model_name, base_url)
     history_aware_retriever = setup_history_aware_retriever(llm, retriever)
     question_answer_chain = setup_question_answer_chain(llm)
 
 
     return create_retrieval_chain(history_aware_retriever, question_answer_chain)
+
+
+class RagPipeline:
+    """History-aware RAG pipeline built once per model configuration and reused across requests.
+
+    Retrieval and answering are separate steps so the caller searches the
+    vector store once and passes the documents on to the answer chain. The
+    standalone question is embedded once and that vector is used both for the
+    similarity search and by the caller (e.g. the semantic answer cache).
+    With retrieval_mode "hybrid" the vector results are fused with BM25
+    keyword results (see hybrid_search).
+    """
+
+    def __init__(self, model_name, vector_store, similar_docs_count=5, base_url=OLLAMA_BASE_URL,
+                 retrieval_mode=RETRIEVAL_MODE):
+        self.llm = setup_llm(model_name, base_url)
+        self.vector_store = vector_store
+        self.similar_docs_count = similar_docs_count
+        self.hybrid_retriever = None
+        if retrieval_mode == "hybrid":
+            self.hybrid_retriever = HybridRetriever(vector_store, k=similar_docs_count)
+        self.reformulator = setup_question_reformulator(self.llm)
+        self.question_answer_chain = setup_question_answer_chain(self.llm)
+
+    def retrieve(self, question, chat_history, timings=None):
+        """Reformulate the question against the history (if any) and retrieve documents once.
+
+        Returns (standalone_question, query_vector, docs).
+        """
+        started = time.perf_counter()
+        standalone = self.reformulate(question, chat_history)
+        if timings is not None:
+            timings["reformulate_s"] = time.perf_counter() - started
+        query_vector, docs = self.search(standalone, timings)
+        return standalone, query_vector, docs
+
+    def reformulate(self, question, chat_history):
+        """Standalone form of the question; an LLM call, so only made when there is history."""
+        if not chat_history:
+            return question
+        return self.reformulator.invoke({"input": question, "chat_history": chat_history})
+
+    def search(self, standalone, timings=None):
+        """Embed the standalone question and retrieve documents with it. Returns (query_vector, docs)."""
+        started = time.perf_counter()
+        query_vector = self.vector_store.embeddings.embed_query(standalone)
+        embedded = time.perf_counter()
+
+        if self.hybrid_retriever is not None:
+            docs = self.hybrid_retriever.search(standalone, query_vector, timings)
+        else:
+            docs = self.vector_store.similarity_search_by_vector(query_vector, k=self.similar_docs_count)
+        if timings is not None:
+            timings["embed_s"] = embedded - started
+            timings["retrieve_s"] = time.perf_counter() - embedded
+        return query_vector, docs
+
+    def stream_answer(self, question, chat_history, docs, timings=None):
+        """Yield answer tokens generated from already-retrieved documents.
+
+        Goes through the shared Ollama client, so it counts against the
+        parallel-slot limit and identical in-flight questions share one answer.
+        """
+        started = time.perf_counter()
+        key = (
+            "rag",
+            self.llm.model,
+            question,
+            tuple((m.type, m.content) for m in chat_history),
+            tuple(doc.page_content for doc in docs),
+        )
+        stream = get_ollama_client().shared_stream(
+            key,
+            lambda: self.question_answer_chain.stream(
+                {"input": question, "chat_history": chat_history, "context": docs}
+            ),
+        )
+        for chunk in stream:
+            if timings is not None and "first_token_s" not in timings:
+                timings["first_token_s"] = time.perf_counter() - started
+            yield chunk
+        if timings is not None:
+            timings["answer_s"] = time.perf_counter() - started
+
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+
+def get_rag_pipeline(model_name, vector_store, similar_docs_count=5, base_url=OLLAMA_BASE_URL):
+    """Return the shared RagPipeline for this model and vector store, building it on first use."""
+    key = (model_name, id(vector_store), similar_docs_count, base_url)
+    pipeline = _pipelines.get(key)
+    if pipeline is None:
+        with _pipelines_lock:
+            pipeline = _pipelines.get(key)
+            if pipeline is None:
+                pipeline = RagPipeline(model_name, vector_store, similar_docs_count, base_url)
+                _pipelines[key] = pipeline
+    return pipeline
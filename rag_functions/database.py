@@ -1,33 +1,284 @@
 import hashlib
+import json
+import logging
 import os
-from rag_functions.docs_preprocess import chunk_documents
-from langchain_community.document_loaders import DirectoryLoader
-from langchain_chroma import Chroma
-from langchain_community.document_loaders.pdf import PyPDFLoader
+import threading
+import time
+import weakref
+from rag_functions.docs_preprocess import chunk_documents, CHUNK_SIZE, CHUNK_OVERLAP
+
+logger = logging.getLogger(__name__)
+
+# Caches built on top of retrieval results (see answer_cache, hybrid_search)
+# drop their entries when the collection version changes. The version is the
+# stat of the store's ingest manifest, which sync_documents rewrites after every
+# write batch, so ingests by other workers or by python -m rag_functions.ingest
+# are noticed too; collection_version covers in-process writes that leave the
+# manifest alone (init_db building a fresh store).
+collection_version = 0
+VERSION_CHECK_INTERVAL = float(os.getenv("COLLECTION_VERSION_CHECK_INTERVAL", "5"))
+
+MANIFEST_NAME = "ingest_manifest.json"
+WRITE_BATCH = 1000
+
+_manifest_paths = weakref.WeakKeyDictionary()  # vectorstore -> its ingest manifest
+_manifest_stamps = {}  # manifest path -> (checked_at, stamp)
+_version_lock = threading.Lock()
+
+
+def mark_collection_changed():
+    global collection_version
+    with _version_lock:
+        collection_version += 1
+        _manifest_stamps.clear()
+
+
+def _register(vectorstore, folder_path):
+    _manifest_paths[vectorstore] = os.path.join(folder_path, MANIFEST_NAME)
+    return vectorstore
+
+
+def _manifest_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def get_collection_version(vectorstore):
+    """Version of the collection behind vectorstore; the manifest is stat'ed at most
+    once per VERSION_CHECK_INTERVAL seconds."""
+    path = _manifest_paths.get(vectorstore)
+    if path is None:
+        return collection_version, None
+    now = time.monotonic()
+    with _version_lock:
+        checked = _manifest_stamps.get(path)
+        if checked is None or now - checked[0] >= VERSION_CHECK_INTERVAL:
+            checked = _manifest_stamps[path] = (now, _manifest_stamp(path))
+        return collection_version, checked[1]
 
 
 def load_documents(data_folder):
     if not os.path.exists(data_folder):
         os.makedirs(data_folder)
 
+    from langchain_community.document_loaders import DirectoryLoader
+    from langchain_community.document_loaders.pdf import PyPDFLoader
+
     loader = DirectoryLoader(data_folder, glob="*.pdf", loader_cls = PyPDFLoader)
     return loader.load()
 
 def init_db(chunks, embeddings_model, folder_path):
+    from langchain_chroma import Chroma
+
     chroma_path = folder_path
     if os.path.exists(chroma_path):
         vectorstore = Chroma(persist_directory=chroma_path, embedding_function=embeddings_model)
     else:
         vectorstore = Chroma.from_documents(documents=chunks, embedding=embeddings_model, persist_directory=chroma_path)
+        mark_collection_changed()
+    return _register(vectorstore, chroma_path)
+
+def open_db(embeddings_model, folder_path):
+    from langchain_chroma import Chroma
+
+    return _register(Chroma(persist_directory=folder_path, embedding_function=embeddings_model), folder_path)
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_ids(relpath, chunks):
+    """Stable ids from each chunk's content; repeated content within a file gets an occurrence suffix."""
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        content_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+        occurrence = seen.get(content_hash, 0)
+        seen[content_hash] = occurrence + 1
+        chunk.metadata["chunk_hash"] = content_hash
+        ids.append(hashlib.sha256(f"{relpath}:{content_hash}:{occurrence}".encode("utf-8")).hexdigest())
+    return ids
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+def save_manifest(manifest_path, manifest):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def parse_pdf(name, path):
+    """Parse one PDF page by page into chunks with stable ids; runs in a worker process."""
+    from langchain_community.document_loaders.pdf import PyPDFLoader
+
+    chunks = []
+    for page in PyPDFLoader(path).lazy_load():
+        chunks.extend(chunk_documents([page]))
+    return chunks, chunk_ids(name, chunks)
+
+def _delete_batches(vectorstore, ids):
+    for start in range(0, len(ids), WRITE_BATCH):
+        vectorstore.delete(ids=ids[start:start + WRITE_BATCH])
+
+class _BatchWriter:
+    """Buffers chunks and embeds/writes them to Chroma in fixed-size batches."""
+
+    def __init__(self, vectorstore, batch_size, on_flush=None):
+        self.vectorstore = vectorstore
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.buffer = []
+        self.added = 0
+        self.written = 0
+
+    def add(self, chunk_id, chunk):
+        self.buffer.append((chunk_id, chunk))
+        self.added += 1
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            ids = [chunk_id for chunk_id, _ in self.buffer]
+            texts = [chunk.page_content for _, chunk in self.buffer]
+            metadatas = [chunk.metadata for _, chunk in self.buffer]
+            # add_texts embeds the whole batch in one embed_documents call and upserts by id
+            self.vectorstore.add_texts(texts, metadatas=metadatas, ids=ids)
+            self.written += len(ids)
+            self.buffer = []
+        if self.on_flush:
+            self.on_flush(self.written)
+
+def _parsed_files(jobs, workers):
+    """Yield (name, digest, entry, chunks, ids) per job, parsing in up to `workers` processes.
+
+    At most 2 * workers files are in flight, so memory stays bounded no matter
+    how many PDFs there are.
+    """
+    if workers <= 1:
+        for name, path, digest, entry in jobs:
+            yield (name, digest, entry) + parse_pdf(name, path)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+    jobs = iter(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        while True:
+            while len(pending) < workers * 2:
+                job = next(jobs, None)
+                if job is None:
+                    break
+                name, path, digest, entry = job
+                pending[pool.submit(parse_pdf, name, path)] = (name, digest, entry)
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future) + future.result()
+
+def sync_documents(vectorstore, data_folder, manifest_path, workers=1, batch_size=WRITE_BATCH, progress=None):
+    """Bring the vector store in line with the PDFs in data_folder.
+
+    A manifest records the content hash of every PDF and the ids of its
+    chunks. Unchanged files are skipped without parsing; new or changed files
+    are parsed (in `workers` processes) and chunked, and only chunks whose
+    content is new get embedded, in batches of `batch_size`; vectors of
+    removed files and of chunks that disappeared are deleted. A file is
+    recorded in the manifest once all of its chunks are written. Returns a
+    summary of what changed.
+    """
+    os.makedirs(data_folder, exist_ok=True)
+    chunking = {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}
+    manifest = load_manifest(manifest_path)
+
+    if manifest is None or manifest.get("chunking") != chunking:
+        existing = vectorstore.get(include=[])["ids"]
+        if existing:
+            logger.warning("No usable ingestion manifest, re-indexing %d existing vectors", len(existing))
+            _delete_batches(vectorstore, existing)
+        manifest = {"chunking": chunking, "files": {}}
+
+    summary = {"unchanged": 0, "added": [], "updated": [], "removed": [], "embedded": 0, "deleted": 0}
+    present = set()
+    jobs = []
+
+    for name in sorted(os.listdir(data_folder)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        path = os.path.join(data_folder, name)
+        present.add(name)
+        digest = file_hash(path)
+        entry = manifest["files"].get(name)
+        if entry and entry["sha256"] == digest:
+            summary["unchanged"] += 1
+        else:
+            jobs.append((name, path, digest, entry))
+
+    # Files whose chunks are buffered but not yet written: (chunks added so far, name, entry)
+    waiting = []
+
+    def commit_written(written):
+        while waiting and waiting[0][0] <= written:
+            _, name, entry = waiting.pop(0)
+            manifest["files"][name] = entry
+        save_manifest(manifest_path, manifest)
+        if progress:
+            progress(summary, written)
+
+    writer = _BatchWriter(vectorstore, batch_size, on_flush=commit_written)
+    for name, digest, entry, chunks, ids in _parsed_files(jobs, workers):
+        old_ids = set(entry["chunk_ids"]) if entry else set()
+        new_count = 0
+        for chunk_id, chunk in zip(ids, chunks):
+            if chunk_id not in old_ids:
+                writer.add(chunk_id, chunk)
+                new_count += 1
+        stale = sorted(old_ids - set(ids))
+        if stale:
+            _delete_batches(vectorstore, stale)
+
+        summary["embedded"] += new_count
+        summary["deleted"] += len(stale)
+        summary["updated" if entry else "added"].append(name)
+        waiting.append((writer.added, name, {"sha256": digest, "chunk_ids": ids}))
+        if writer.added == writer.written:
+            commit_written(writer.written)
+    writer.flush()
+
+    for name in sorted(set(manifest["files"]) - present):
+        stale = manifest["files"].pop(name)["chunk_ids"]
+        _delete_batches(vectorstore, stale)
+        summary["removed"].append(name)
+        summary["deleted"] += len(stale)
+
+    save_manifest(manifest_path, manifest)
+    if summary["embedded"] or summary["deleted"]:
+        mark_collection_changed()
+    return summary
+
+def sync_db(data_folder, embeddings_model, folder_path):
+    """Open the persisted Chroma store and incrementally ingest data_folder into it."""
+    vectorstore = open_db(embeddings_model, folder_path)
+    summary = sync_documents(vectorstore, data_folder, os.path.join(folder_path, MANIFEST_NAME))
+    logger.info(
+        "Document index: %d unchanged, %d added, %d updated, %d removed (%d chunks embedded, %d deleted)",
+        summary["unchanged"], len(summary["added"]), len(summary["updated"]), len(summary["removed"]),
+        summary["embedded"], summary["deleted"],
+    )
     return vectorstore
 
-def add_db_docs(vectorstore, data_path, embeddings_model):
-    documents = load_documents(data_path)
-    for document in documents:
-        content = document.page_content
-        embedding = embeddings_model.embed_query(content)
-        result = vectorstore.similarity_search_by_vector(embedding, k=3)
-        if not result:
-            print("This content does not exist in vector database. Adding the content.")
-            chunks = chunk_documents(content)
-            vectorstore.add_texts(chunks)
\ No newline at end of file
+def add_db_docs(vectorstore, data_path, folder_path):
+    """Add new or changed PDFs from data_path to the store persisted in folder_path (see sync_documents)."""
+    return sync_documents(vectorstore, data_path, os.path.join(folder_path, MANIFEST_NAME))
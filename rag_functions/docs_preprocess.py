@@ -1,25 +1,204 @@
+import os
 import re
+import json
+import logging
+from typing import TYPE_CHECKING
 
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.schema.document import Document
+from langchain_core.embeddings import Embeddings
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# LangChain integrations, sentence-transformers and torch are imported inside the
+# functions that need them so that importing this module (and api_server) stays
+# cheap; only langchain_core, for the Embeddings base class, is loaded up front.
+
+# Set to the shared embedding server (python -m rag_functions.embedding_server)
+# so that workers borrow its model instead of each loading their own copy.
+EMBEDDING_SERVER_URL = os.getenv("EMBEDDING_SERVER_URL")
+EMBEDDING_SERVER_TIMEOUT = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "30"))
+
+# Backend for locally loaded embedding models: "torch" (HuggingFaceEmbeddings),
+# "onnx" or "onnx-int8" (the same model exported with export-onnx, run on ONNX Runtime).
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                        "cache", "onnx"))
+ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))  # 0 lets ONNX Runtime use every core
+ONNX_BATCH = 32
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteEmbeddings(Embeddings):
+    """LangChain Embeddings backed by the shared embedding server."""
+
+    def __init__(self, base_url, model_name=None, timeout=EMBEDDING_SERVER_TIMEOUT):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url.rstrip("/")
+        self.model_name = model_name
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=32))
+
+    def embed_documents(self, texts):
+        response = self.session.post(f"{self.base_url}/embed", json={"texts": list(texts)}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def onnx_model_dir(model_name, root=ONNX_DIR):
+    return os.path.join(root, model_name.replace("/", "--"))
+
+
+class OnnxEmbeddings(Embeddings):
+    """LangChain Embeddings for a sentence-transformers model exported by export_onnx().
+
+    Needs only onnxruntime and tokenizers, not torch.
+    """
+
+    def __init__(self, model_dir, quantized=False, threads=ONNX_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, "model_int8.onnx" if quantized else "model.onnx")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found; export it with "
+                                    f"python -m rag_functions.docs_preprocess export-onnx")
+        with open(os.path.join(model_dir, "embedding_config.json")) as f:
+            self.config = json.load(f)
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+    def _embed(self, texts):
+        import numpy as np
+
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+        if self.config["pooling"] == "cls":
+            vectors = hidden[:, 0]
+        else:
+            mask = inputs["attention_mask"][:, :, None].astype(hidden.dtype)
+            vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.config["normalize"]:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.tolist()
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = []
+        for start in range(0, len(texts), ONNX_BATCH):
+            vectors.extend(self._embed(texts[start:start + ONNX_BATCH]))
+        return vectors
+
+    def embed_query(self, text):
+        return self._embed([text])[0]
+
+
+def export_onnx(model_name, output_dir=None, quantize=True):
+    """Export a sentence-transformers model to ONNX (plus an int8 dynamically quantized copy).
+
+    Needs torch, sentence-transformers and onnx; the exported model does not.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    output_dir = output_dir or onnx_model_dir(model_name)
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    pooling = [m for m in model if type(m).__name__ == "Pooling"]
+    pooling_mode = pooling[0].get_pooling_mode_str() if pooling else "mean"
+    if pooling_mode not in ("mean", "cls"):
+        raise ValueError(f"Unsupported pooling mode {pooling_mode!r} for {model_name}")
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    model_path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=14,
+        )
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, "tokenizer.json"))
+    with open(os.path.join(output_dir, "embedding_config.json"), "w") as f:
+        json.dump({
+            "model_name": model_name,
+            "max_seq_length": model.max_seq_length,
+            "pooling": pooling_mode,
+            "normalize": any(type(m).__name__ == "Normalize" for m in model),
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+            "dimension": model.get_sentence_embedding_dimension(),
+        }, f, indent=2)
+    logger.info("Exported %s to %s", model_name, model_path)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+
+        prepared_path = os.path.join(output_dir, "model_prepared.onnx")
+        quant_pre_process(model_path, prepared_path)
+        quantize_dynamic(prepared_path, os.path.join(output_dir, "model_int8.onnx"), weight_type=QuantType.QInt8)
+        os.remove(prepared_path)
+        logger.info("Wrote int8 quantized copy to %s", os.path.join(output_dir, "model_int8.onnx"))
+    return output_dir
+
+
+def load_local_embed_model(model_name, backend=EMBEDDING_BACKEND):
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(model_name=model_name)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbeddings(onnx_model_dir(model_name), quantized=backend == "onnx-int8")
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}; use torch, onnx or onnx-int8")
 
 def call_embed_model(model_name):
-    embeddings_model = HuggingFaceEmbeddings(model_name=model_name)
-    return embeddings_model
+    if EMBEDDING_SERVER_URL:
+        return RemoteEmbeddings(EMBEDDING_SERVER_URL, model_name)
+    return load_local_embed_model(model_name)
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 80
 
-def chunk_documents(docs: list[Document]):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000,
-                                                   chunk_overlap=80)
+def chunk_documents(docs: list["Document"]):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE,
+                                                   chunk_overlap=CHUNK_OVERLAP)
     return text_splitter.split_documents(docs)
 
 def retrieve_docs(question, vector_store, similar_docs_count, see_content:False):
     retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": similar_docs_count})
-    retrieved_docs = retriever.invoke(question)
 
     if see_content:
-        for i in range(similar_docs_count):
-            print(retrieved_docs[i].page_content)
+        retrieved_docs = retriever.invoke(question)
+        for doc in retrieved_docs:
+            logger.debug("%s", doc.page_content)
 
     return retriever
 
@@ -39,4 +218,26 @@ def structure_answer(answer):
             structured_lines.append(f"- {line}")
 
     structured_answer = '\n'.join(structured_lines)
-    return structured_answer
\ No newline at end of file
+    return structured_answer
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Embedding model tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export-onnx", help="export a model for EMBEDDING_BACKEND=onnx / onnx-int8")
+    export.add_argument("--model", default="sentence-transformers/all-MiniLM-L12-v2")
+    export.add_argument("--output", help=f"directory (default {ONNX_DIR}/<model>)")
+    export.add_argument("--no-quantize", action="store_true", help="skip the int8 copy")
+    args = parser.parse_args()
+
+    from tracing import configure_logging
+
+    configure_logging()
+    if args.command == "export-onnx":
+        print(export_onnx(args.model, args.output, quantize=not args.no_quantize))
+
+
+if __name__ == "__main__":
+    main()
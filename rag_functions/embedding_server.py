@@ -0,0 +1,144 @@
+"""Shared embedding service: one process owns the model and serves every worker.
+
+    python -m rag_functions.embedding_server [--model ...] [--host 127.0.0.1] [--port 8765]
+                                             [--max-batch 64] [--max-wait-ms 5]
+
+Workers point at it with EMBEDDING_SERVER_URL=http://127.0.0.1:8765 and
+call_embed_model() then returns a RemoteEmbeddings adapter instead of loading
+the model themselves. Concurrent requests are micro-batched: the batcher
+waits at most --max-wait-ms for more texts (up to --max-batch) and runs them
+through the model in one call.
+"""
+import argparse
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collects embed requests from many threads and runs them through the model together."""
+
+    def __init__(self, embeddings_model, max_batch=64, max_wait=0.005):
+        self.embeddings_model = embeddings_model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self.stats = {"requests": 0, "texts": 0, "batches": 0}
+        threading.Thread(target=self._run, name="embed-batcher", daemon=True).start()
+
+    def embed(self, texts):
+        future = Future()
+        self._queue.put((texts, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in pending for text in item_texts]
+            try:
+                vectors = self.embeddings_model.embed_documents(texts) if texts else []
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            self.stats["requests"] += len(pending)
+            self.stats["texts"] += len(texts)
+            self.stats["batches"] += 1
+            offset = 0
+            for item_texts, future in pending:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+
+def make_handler(batcher, model_name):
+    class EmbeddingHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "model": model_name, **batcher.stats})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/embed":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                texts = json.loads(self.rfile.read(length))["texts"]
+                vectors = batcher.embed([str(text) for text in texts])
+            except (KeyError, ValueError, TypeError) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, {"embeddings": [list(map(float, v)) for v in vectors]})
+
+    return EmbeddingHandler
+
+
+def serve(model_name, host="127.0.0.1", port=8765, max_batch=64, max_wait_ms=5.0):
+    from rag_functions.docs_preprocess import load_local_embed_model
+
+    embeddings_model = load_local_embed_model(model_name)
+    batcher = MicroBatcher(embeddings_model, max_batch=max_batch, max_wait=max_wait_ms / 1000)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher, model_name))
+    server.daemon_threads = True
+    logger.info("Embedding server for %s listening on http://%s:%d", model_name, host, server.server_address[1])
+    return server
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L12-v2")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    server = serve(args.model, args.host, args.port, args.max_batch, args.max_wait_ms)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,173 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from rag_functions.ollama_client import get_ollama_client
+
+logger = logging.getLogger(__name__)
+
+# Prompts carry only the most recent turns verbatim, within a token budget;
+# older turns are folded into a per-session summary that is updated in the
+# background, so prompt size stays flat however long a session gets.
+MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "8"))
+TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "llama3.2:1b")
+SUMMARY_BATCH = int(os.getenv("HISTORY_SUMMARY_BATCH", "40"))
+SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "256"))
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def message_role(message):
+    return message.get("role") if isinstance(message, dict) else message.type
+
+
+def message_content(message):
+    return message.get("content", "") if isinstance(message, dict) else message.content
+
+
+def format_lines(messages):
+    lines = []
+    for message in messages:
+        role = message_role(message)
+        if role == "human":
+            lines.append(f"User: {message_content(message)}")
+        elif role == "ai":
+            lines.append(f"AI: {message_content(message)}")
+    return "\n".join(lines)
+
+
+def summarize_with_ollama(summary, messages, model=SUMMARY_MODEL, max_tokens=SUMMARY_TOKENS):
+    """Fold messages into the running summary with one Ollama generation."""
+    prompt = (
+        "Condense the conversation below into a short summary that keeps the facts, locations, "
+        f"species and preferences the user mentioned. Use at most {max_tokens * 3 // 4} words.\n\n"
+    )
+    if summary:
+        prompt += f"Summary so far:\n{summary}\n\n"
+    prompt += f"New conversation:\n{format_lines(messages)}\n\nUpdated summary:"
+    return "".join(get_ollama_client().generate_stream(model, prompt)).strip()
+
+
+class _Summary:
+    __slots__ = ("text", "covered")
+
+    def __init__(self):
+        self.text = ""
+        self.covered = 0
+
+
+class HistoryWindow:
+    """Splits a session's messages into a rolling summary plus the recent turns.
+
+    window() keeps the newest turns (a user message and the replies after
+    it) while there are at most max_turns of them and they fit in
+    token_budget. Messages before that are summarized by summarize(summary,
+    messages) on a background thread; until it finishes, prompts use the
+    previous summary.
+    """
+
+    def __init__(self, max_turns=MAX_TURNS, token_budget=TOKEN_BUDGET, summary_tokens=SUMMARY_TOKENS,
+                 summarize=summarize_with_ollama, batch=SUMMARY_BATCH, max_sessions=SUMMARY_CACHE_SIZE):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.summarize = summarize
+        self.batch = batch
+        self.max_sessions = max_sessions
+        self._summaries = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+        self._stats = {"summaries": 0, "summary_errors": 0}
+
+    def recent_start(self, messages):
+        """Index of the first message kept verbatim."""
+        start = len(messages)
+        used = 0
+        turns = 0
+        while start > 0 and turns < self.max_turns:
+            turn_start = start - 1
+            while turn_start > 0 and message_role(messages[turn_start]) != "human":
+                turn_start -= 1
+            cost = sum(estimate_tokens(message_content(m)) for m in messages[turn_start:start])
+            if used + cost > self.token_budget:
+                break
+            used += cost
+            turns += 1
+            start = turn_start
+        return start
+
+    def _summary(self, session_id):
+        summary = self._summaries.get(session_id)
+        if summary is None:
+            summary = _Summary()
+            self._summaries[session_id] = summary
+            while len(self._summaries) > self.max_sessions:
+                self._summaries.popitem(last=False)
+        else:
+            self._summaries.move_to_end(session_id)
+        return summary
+
+    def window(self, session_id, messages):
+        """(summary text, recent messages) for the session's history."""
+        messages = list(messages)
+        start = self.recent_start(messages)
+        with self._lock:
+            summary = self._summary(session_id)
+            if summary.covered > len(messages):
+                summary.text, summary.covered = "", 0
+            text = summary.text
+            if start > summary.covered and session_id not in self._pending:
+                self._pending.add(session_id)
+                self._executor.submit(self._fold, session_id, summary, messages[:start])
+        return text, messages[start:]
+
+    def _fold(self, session_id, summary, older):
+        try:
+            while summary.covered < len(older):
+                batch = older[summary.covered:summary.covered + self.batch]
+                text = self.summarize(summary.text, batch)
+                limit = self.summary_tokens * CHARS_PER_TOKEN
+                with self._lock:
+                    summary.text = text[:limit]
+                    summary.covered += len(batch)
+                    self._stats["summaries"] += 1
+        except Exception as e:
+            logger.warning("History summary for %s failed: %s", session_id, e)
+            with self._lock:
+                self._stats["summary_errors"] += 1
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
+
+    def prompt_text(self, session_id, messages, user_input):
+        """Plain-text prompt for /api/generate: summary, recent turns, then the new question."""
+        summary, recent = self.window(session_id, messages)
+        prompt = f"Summary of the earlier conversation: {summary}\n" if summary else ""
+        if recent:
+            prompt += format_lines(recent) + "\n"
+        return prompt + f"User: {user_input}\nAI:"
+
+    def chain_messages(self, session_id, messages):
+        """chat_history for the LangChain prompts: the summary as a system message plus the recent turns."""
+        summary, recent = self.window(session_id, messages)
+        if not summary:
+            return recent
+        from langchain_core.messages import SystemMessage
+
+        return [SystemMessage(content=f"Summary of the earlier conversation: {summary}")] + recent
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, sessions=len(self._summaries), pending=len(self._pending))
+
+
+history_window = HistoryWindow()
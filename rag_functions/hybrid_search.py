@@ -0,0 +1,184 @@
+import os
+import re
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+import numpy as np
+
+from rag_functions.database import get_collection_version
+
+# "vector" is plain similarity search; "hybrid" adds BM25 keyword search over
+# the same chunks so exact terms (clone codes, trait abbreviations) are found
+# even when the embedding model does not place them near the question.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+VECTOR_CANDIDATES = int(os.getenv("RETRIEVAL_VECTOR_CANDIDATES", "20"))
+KEYWORD_CANDIDATES = int(os.getenv("RETRIEVAL_KEYWORD_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+RERANK = os.getenv("RETRIEVAL_RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RETRIEVAL_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RETRIEVAL_RERANK_CANDIDATES", "20"))
+
+TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """In-memory inverted index over chunk texts, scored with Okapi BM25.
+
+    Each posting list stores the precomputed BM25 weight of the term in every
+    chunk that contains it, so a search is one scatter-add per query term.
+    """
+
+    def __init__(self, ids, texts, metadatas, k1=1.5, b=0.75):
+        self.ids = list(ids)
+        self.texts = list(texts)
+        self.metadatas = list(metadatas)
+
+        counts = [Counter(tokenize(text)) for text in self.texts]
+        lengths = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+        avg_length = float(lengths.mean()) if len(lengths) else 0.0
+
+        postings = defaultdict(lambda: ([], []))
+        for doc, c in enumerate(counts):
+            for term, tf in c.items():
+                postings[term][0].append(doc)
+                postings[term][1].append(tf)
+
+        n = len(self.texts)
+        self.postings = {}
+        for term, (docs, tfs) in postings.items():
+            docs = np.array(docs, dtype=np.int32)
+            tfs = np.array(tfs, dtype=np.float32)
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = tfs + k1 * (1 - b + b * lengths[docs] / (avg_length or 1.0))
+            self.postings[term] = (docs, (idf * tfs * (k1 + 1) / norm).astype(np.float32))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, k):
+        """Indices of the k best-scoring chunks, best first."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        return [int(i) for i in matched[np.argsort(-scores[matched], kind="stable")]]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merge ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class CrossEncoderReranker:
+    """Scores (query, passage) pairs with a local sentence-transformers cross-encoder."""
+
+    def __init__(self, model_name=RERANK_MODEL):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name)
+
+    def rerank(self, query, texts):
+        """Positions of texts ordered by relevance to the query, best first."""
+        if not texts:
+            return []
+        scores = self.model.predict([(query, text) for text in texts])
+        return [int(i) for i in np.argsort(-np.asarray(scores), kind="stable")]
+
+
+_rerankers = {}
+_rerankers_lock = threading.Lock()
+
+
+def get_reranker(model_name=RERANK_MODEL):
+    reranker = _rerankers.get(model_name)
+    if reranker is None:
+        with _rerankers_lock:
+            reranker = _rerankers.get(model_name)
+            if reranker is None:
+                reranker = CrossEncoderReranker(model_name)
+                _rerankers[model_name] = reranker
+    return reranker
+
+
+class HybridRetriever:
+    """Vector and BM25 search over one Chroma collection, fused with reciprocal rank fusion.
+
+    vector_candidates and keyword_candidates set how deep each search goes;
+    with rerank, the top rerank_candidates fused chunks are rescored by the
+    cross-encoder before the final k are returned. The BM25 index is built
+    from the collection on first use and rebuilt when the collection changes.
+    """
+
+    def __init__(self, vectorstore, k=5, vector_candidates=VECTOR_CANDIDATES,
+                 keyword_candidates=KEYWORD_CANDIDATES, rerank=RERANK,
+                 rerank_candidates=RERANK_CANDIDATES, rerank_model=RERANK_MODEL, rrf_k=RRF_K):
+        self.vectorstore = vectorstore
+        self.k = k
+        self.vector_candidates = vector_candidates
+        self.keyword_candidates = keyword_candidates
+        self.rerank = rerank
+        self.rerank_candidates = rerank_candidates
+        self.rerank_model = rerank_model
+        self.rrf_k = rrf_k
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def keyword_index(self):
+        version = get_collection_version(self.vectorstore)
+        if self._index is None or version != self._version:
+            with self._lock:
+                if self._index is None or version != self._version:
+                    data = self.vectorstore.get(include=["documents", "metadatas"])
+                    self._index = BM25Index(data["ids"], data["documents"], data["metadatas"])
+                    self._version = version
+        return self._index
+
+    def vector_search(self, query_vector, k):
+        docs = self.vectorstore.similarity_search_by_vector(list(query_vector), k=k)
+        return [(doc.id, doc.page_content, doc.metadata) for doc in docs]
+
+    def keyword_search(self, query, k):
+        index = self.keyword_index()
+        return [(index.ids[i], index.texts[i], index.metadatas[i]) for i in index.search(query, k)]
+
+    def search(self, query, query_vector, timings=None):
+        """The k best chunks for the query as LangChain Documents."""
+        from langchain_core.documents import Document
+
+        started = time.perf_counter()
+        vector_hits = self.vector_search(query_vector, self.vector_candidates)
+        vector_done = time.perf_counter()
+        keyword_hits = self.keyword_search(query, self.keyword_candidates)
+        keyword_done = time.perf_counter()
+
+        chunks = {chunk_id: (text, metadata) for chunk_id, text, metadata in vector_hits + keyword_hits}
+        fused = reciprocal_rank_fusion(
+            [[hit[0] for hit in vector_hits], [hit[0] for hit in keyword_hits]], self.rrf_k
+        )
+        if self.rerank:
+            candidates = fused[:self.rerank_candidates]
+            order = get_reranker(self.rerank_model).rerank(query, [chunks[c][0] for c in candidates])
+            fused = [candidates[i] for i in order]
+        if timings is not None:
+            timings["vector_search_s"] = vector_done - started
+            timings["keyword_search_s"] = keyword_done - vector_done
+            timings["fuse_s"] = time.perf_counter() - keyword_done
+
+        return [Document(page_content=chunks[c][0], metadata=chunks[c][1] or {}, id=c)
+                for c in fused[:self.k]]
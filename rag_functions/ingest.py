@@ -0,0 +1,59 @@
+"""Bulk, incremental ingestion of the PDF folder into Chroma.
+
+    python -m rag_functions.ingest [--data data] [--db chroma_db] [--workers N] [--batch 256]
+
+PDFs are parsed page by page in a process pool, their chunks are embedded
+in fixed-size batches and bulk-written to Chroma, and only new or changed
+files are touched (see database.sync_documents).
+"""
+import argparse
+import os
+import sys
+import time
+
+from rag_functions.database import open_db, sync_documents, MANIFEST_NAME
+from rag_functions.docs_preprocess import call_embed_model
+
+current_directory = os.path.dirname(os.path.abspath(__file__))
+project_directory = os.path.dirname(current_directory)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=os.path.join(project_directory, "data"))
+    parser.add_argument("--db", default=os.path.join(project_directory, "chroma_db"))
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L12-v2")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="PDF parsing processes")
+    parser.add_argument("--batch", type=int, default=256, help="chunks per embedding/write batch")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    embeddings_model = call_embed_model(args.model)
+    vectorstore = open_db(embeddings_model, args.db)
+    print(f"Loaded embedding model and store in {time.perf_counter() - started:.1f}s")
+
+    ingest_started = time.perf_counter()
+
+    def progress(summary, written):
+        elapsed = time.perf_counter() - ingest_started
+        files = len(summary["added"]) + len(summary["updated"])
+        print(f"  {files} files parsed, {written} chunks embedded "
+              f"({written / elapsed:.1f} chunks/s, {elapsed:.1f}s)")
+
+    summary = sync_documents(
+        vectorstore, args.data, os.path.join(args.db, MANIFEST_NAME),
+        workers=args.workers, batch_size=args.batch, progress=progress,
+    )
+    elapsed = time.perf_counter() - ingest_started
+
+    print(
+        f"Done in {elapsed:.1f}s: {summary['unchanged']} unchanged, {len(summary['added'])} added, "
+        f"{len(summary['updated'])} updated, {len(summary['removed'])} removed; "
+        f"{summary['embedded']} chunks embedded ({summary['embedded'] / elapsed if elapsed else 0:.1f} chunks/s), "
+        f"{summary['deleted']} deleted"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import asyncio
+import functools
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# Match Ollama's own OLLAMA_NUM_PARALLEL so we never queue more work than it has slots for.
+NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))
+RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+BACKOFF = float(os.getenv("OLLAMA_BACKOFF", "0.5"))
+
+# Failures worth retrying: the server was unreachable or timed out before answering.
+RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout, httpx.TransportError,
+                    ConnectionError, TimeoutError)
+
+
+class _InFlight:
+    """One generation whose tokens are shared by every request that asked for it."""
+
+    def __init__(self):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self.cond = threading.Condition()
+
+    def publish(self, token):
+        with self.cond:
+            self.tokens.append(token)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.cond.notify_all()
+
+    def follow(self):
+        index = 0
+        while True:
+            with self.cond:
+                while index >= len(self.tokens) and not self.done:
+                    self.cond.wait()
+                pending = self.tokens[index:]
+                finished, error = self.done, self.error
+            for token in pending:
+                yield token
+            index += len(pending)
+            if finished and index >= len(self.tokens):
+                if error is not None:
+                    raise error
+                return
+
+
+class OllamaClient:
+    """Shared Ollama access: keep-alive connection pool, timeouts, retry with
+    backoff, a limit of NUM_PARALLEL concurrent generations, and coalescing of
+    identical in-flight requests into one generation."""
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, num_parallel=NUM_PARALLEL,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 retries=RETRIES, backoff=BACKOFF):
+        self.base_url = base_url.rstrip("/")
+        self.num_parallel = num_parallel
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.slots = threading.BoundedSemaphore(num_parallel)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(num_parallel * 2, 10))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._in_flight = {}
+        self._async_client = None
+        self._slot_waiters = None
+        self._lock = threading.Lock()
+        self.stats = {"generations": 0, "coalesced": 0, "retries": 0}
+
+    def httpx_kwargs(self):
+        """Client settings for LangChain's ChatOllama, which talks to Ollama through httpx."""
+        return {
+            "timeout": httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+            "limits": httpx.Limits(max_connections=self.num_parallel * 2,
+                                   max_keepalive_connections=self.num_parallel),
+        }
+
+    def shared_stream(self, key, make_stream):
+        """Yield the tokens of make_stream(), sharing one run among concurrent callers with the same key.
+
+        make_stream is retried with backoff if it fails before producing a token.
+        """
+        with self._lock:
+            flight = self._in_flight.get(key)
+            if flight is None:
+                flight = _InFlight()
+                self._in_flight[key] = flight
+                leader = True
+            else:
+                leader = False
+                self.stats["coalesced"] += 1
+
+        if leader:
+            threading.Thread(target=self._produce, args=(key, flight, make_stream), daemon=True).start()
+        return flight.follow()
+
+    def _produce(self, key, flight, make_stream):
+        error = None
+        if not self.slots.acquire(timeout=self.timeout[1]):
+            error = TimeoutError(f"No free Ollama slot after {self.timeout[1]}s")
+        else:
+            try:
+                with self._lock:
+                    self.stats["generations"] += 1
+                for attempt in range(self.retries + 1):
+                    try:
+                        for token in make_stream():
+                            flight.publish(token)
+                        break
+                    except RETRYABLE_ERRORS:
+                        if flight.tokens or attempt == self.retries:
+                            raise
+                        with self._lock:
+                            self.stats["retries"] += 1
+                        time.sleep(self.backoff * (2 ** attempt))
+            except Exception as e:
+                error = e
+            finally:
+                self.slots.release()
+
+        with self._lock:
+            self._in_flight.pop(key, None)
+        flight.finish(error)
+
+    def _generate(self, model, prompt):
+        response = self.session.post(
+            f"{self.base_url}/api/generate",
+            json={"model": model, "prompt": prompt},
+            stream=True,
+            timeout=self.timeout,
+        )
+        if response.status_code >= 500:
+            response.close()
+            raise requests.ConnectionError(f"Ollama returned {response.status_code}")
+        response.raise_for_status()
+
+        with response:
+            for line in response.iter_lines():
+                if line:
+                    data = json.loads(line.decode('utf-8'))
+                    if data.get('response'):
+                        yield data['response']
+
+    def generate_stream(self, model, prompt):
+        """Yield tokens for a plain /api/generate call."""
+        return self.shared_stream(("generate", model, prompt), lambda: self._generate(model, prompt))
+
+    async def _acquire_slot(self):
+        """Wait for a parallel slot without blocking the event loop.
+
+        The slots are a threading semaphore shared with the sync callers, so the
+        wait happens on a waiter thread and is served in turn with them.
+        """
+        with self._lock:
+            if self._slot_waiters is None:
+                self._slot_waiters = ThreadPoolExecutor(max_workers=max(self.num_parallel * 8, 32),
+                                                        thread_name_prefix="ollama-slot")
+        waiter = asyncio.get_running_loop().run_in_executor(
+            self._slot_waiters, functools.partial(self.slots.acquire, timeout=self.timeout[1]))
+        try:
+            return await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # the waiter thread may still get the slot; hand it back when it does
+            waiter.add_done_callback(lambda f: f.result() and self.slots.release())
+            raise
+
+    async def agenerate_stream(self, model, prompt):
+        """Async form of generate_stream for the ASGI server.
+
+        Streams over an httpx.AsyncClient, so a running generation holds no
+        thread. It takes the same parallel slots and retries the same way,
+        but is not coalesced with identical in-flight requests.
+        """
+        if not await self._acquire_slot():
+            raise TimeoutError(f"No free Ollama slot after {self.timeout[1]}s")
+
+        try:
+            with self._lock:
+                self.stats["generations"] += 1
+                if self._async_client is None:
+                    self._async_client = httpx.AsyncClient(**self.httpx_kwargs())
+                client = self._async_client
+            produced = False
+            for attempt in range(self.retries + 1):
+                try:
+                    async with client.stream("POST", f"{self.base_url}/api/generate",
+                                             json={"model": model, "prompt": prompt}) as response:
+                        if response.status_code >= 500:
+                            raise ConnectionError(f"Ollama returned {response.status_code}")
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if line:
+                                data = json.loads(line)
+                                if data.get('response'):
+                                    produced = True
+                                    yield data['response']
+                    break
+                except RETRYABLE_ERRORS:
+                    if produced or attempt == self.retries:
+                        raise
+                    with self._lock:
+                        self.stats["retries"] += 1
+                    await asyncio.sleep(self.backoff * (2 ** attempt))
+        finally:
+            self.slots.release()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ollama_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OllamaClient()
+    return _client
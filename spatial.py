@@ -0,0 +1,25 @@
+"""Nearest-point lookups on the sphere, shared by the gazetteer and the productivity sites."""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def unit_vectors(lat, lon):
+    """(n, 3) positions on the unit sphere for arrays of latitudes and longitudes in degrees."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+class PointIndex:
+    """KD-tree over unit-sphere positions; nearest() returns (row, great-circle distance in km)."""
+
+    def __init__(self, lats, lons):
+        # scipy is slow to import and only needed once there are points to index
+        from scipy.spatial import cKDTree
+
+        self.tree = cKDTree(unit_vectors(lats, lons))
+
+    def nearest(self, lat, lon):
+        chord, row = self.tree.query(unit_vectors([lat], [lon])[0])
+        return int(row), 2 * EARTH_RADIUS_KM * float(np.arcsin(min(chord / 2, 1.0)))
@@ -1,53 +1,155 @@
-import os
+import csv
+import logging
 import numpy as np
-import joblib
-import xgboost 
-from sklearn.preprocessing import LabelEncoder
-from db_connector import get_db_connection
+from db_connector import db_connection
+from model_registry import registry
+from feature_cache import feature_cache, cell_center, SOURCE_TABLES, SOURCE_VERSION_SQL
+from feature_tiles import tile_store
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+def load_species_code_to_name(path):
+    species_code_to_name = {}
+    with open(path, 'r') as f:
+        reader = csv.reader(f)
+        for row in reader:
+            scientific_name = row[0]
+            species_code = row[1]
+            species_code_to_name[species_code] = scientific_name
+    return species_code_to_name
+
+
+def _source_version():
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(SOURCE_VERSION_SQL, (list(SOURCE_TABLES),))
+        return cursor.fetchone()[0]
+
+
+def fetch_features(points):
+    """Run the feature SQL against PostGIS for (lat, lon) points; one row per point, NaN where missing."""
+    with db_connection() as conn, conn.cursor() as cursor, span("postgis_query", points=len(points)):
+        if len(points) == 1:
+            lat, lon = points[0]
+            cursor.execute(registry.query, (lon, lat))
+            rows = [(1,) + tuple(row) for row in cursor.fetchall()[:1]]
+        else:
+            cursor.execute(
+                registry.batch_query,
+                ([float(lon) for _, lon in points], [float(lat) for lat, _ in points]),
+            )
+            rows = cursor.fetchall()
+
+    features = np.full((len(points), len(rows[0]) - 1 if rows else 0), np.nan)
+    for row in rows:
+        features[row[0] - 1] = np.array(row[1:], dtype=float)
+    return features
+
+
+def get_features(points):
+    """Feature matrix for (lat, lon) points.
+
+    Cells inside a precomputed tile region are read straight from the tile
+    store; the rest go through the grid-cell cache and, on a miss, PostGIS.
+    """
+    cells = [feature_cache.key(lat, lon) for lat, lon in points]
+    vectors = {}
+    for cell in cells:
+        if cell not in vectors:
+            vectors[cell] = tile_store.lookup(cell)
+
+    if any(vector is None for vector in vectors.values()):
+        feature_cache.check_source_version(_source_version)
+    for cell, vector in vectors.items():
+        if vector is None:
+            vectors[cell] = feature_cache.get(cell)
+
+    missing = [cell for cell, vector in vectors.items() if vector is None]
+    if missing:
+        fetched = fetch_features([cell_center(cell, feature_cache.cell_deg) for cell in missing])
+        feature_cache.put_many(zip(missing, fetched))
+        vectors.update(zip(missing, fetched))
+
+    width = max((len(v) for v in vectors.values()), default=0)
+    features = np.full((len(points), width), np.nan)
+    for i, cell in enumerate(cells):
+        if len(vectors[cell]):
+            features[i] = vectors[cell]
+    return features
+
+
+def prewarm_feature_cache(points):
+    """Fill the feature cache for known sites; returns how many cells had to be fetched."""
+    before = feature_cache.stats()["misses"]
+    get_features(points)
+    return feature_cache.stats()["misses"] - before
+
+
+def predict_species(vector):
+    """Species code for a one-row feature matrix, or None when the point has no raster coverage."""
+    if vector.shape[1] == 0 or np.isnan(vector).all():
+        return None
+
+    model, encoder = registry.classifier
+    with span("model_predict"):
+        # Predict the encoded class
+        y_pred = model.predict(vector)
+
+    # Convert to original label
+    return encoder.inverse_transform(y_pred)[0]
+
 
 def get_species_for_location(lat, lon):
     try:
-        print("Connecting SQL:", lat, lon)
-        sql_path = os.path.join(os.path.dirname(__file__), "DataCollection.sql")
-        print("SQL Path:", sql_path)
-        model_dir = os.path.join(os.path.dirname(__file__), "XGBModel")
-        print("Model directory:", model_dir)
-        xgb_model = joblib.load(os.path.join(os.path.dirname(__file__), 'XGBModel', 'xgb_model.joblib'))
-        print("XGB Model loaded")
-        le = joblib.load(os.path.join(os.path.dirname(__file__), 'XGBModel', 'label_encoder.joblib'))
-        print(le)
-
-        with open(sql_path, "r") as f:
-            query = f.read()
-
-        conn, tunnel = get_db_connection()
-        print("Back to handler")
-        
-        # try:
-        with conn.cursor() as cursor:
-            print(lon, lat)
-            cursor.execute(query, (lon, lat))
-            results = cursor.fetchall()
-            print("Results******", results)
-
-            if not results or len(results[0]) == 0:
-                return None
-
-            vector = np.array(results[0]).reshape(1, -1)
-            
-            # Predict the encoded class
-            y_pred = xgb_model.predict(vector)
-            
-            # Convert to original label
-            species = le.inverse_transform(y_pred)[0]
-            return species
-    
-    except Exception as e:
-        print("Exception occurred:", e)
-        import traceback
-        traceback.print_exc()
-        raise e  
-    
-    finally:
-            conn.close()
-            tunnel.close()
+        logger.debug("Predicting species for: %s, %s", lat, lon)
+        with span("features"):
+            vector = get_features([(lat, lon)])
+        return predict_species(vector)
+
+    except Exception:
+        logger.exception("Species prediction failed for %s, %s", lat, lon)
+        raise
+
+
+def predict_top_species(features, top_k=3):
+    """Score a feature matrix in one call and return the top-k (code, probability) per row."""
+    xgb_model, le = registry.classifier
+
+    with span("model_predict", points=len(features)):
+        probabilities = xgb_model.predict_proba(features)
+    class_ids = getattr(xgb_model, "classes_", np.arange(probabilities.shape[1]))
+    labels = le.inverse_transform(class_ids)
+
+    top_k = min(top_k, probabilities.shape[1])
+    top = np.argpartition(-probabilities, top_k - 1, axis=1)[:, :top_k]
+    top_probs = np.take_along_axis(probabilities, top, axis=1)
+    order = np.argsort(-top_probs, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_probs = np.take_along_axis(top_probs, order, axis=1)
+
+    return [
+        [(str(labels[j]), float(p)) for j, p in zip(row_ids, row_probs)]
+        for row_ids, row_probs in zip(top, top_probs)
+    ]
+
+
+def get_species_for_locations(points, top_k=3):
+    """Predict the top-k species for many (lat, lon) points with one query and one predict call.
+
+    Returns one list of (species_code, probability) per point, in input order.
+    Points with no raster coverage get an empty list.
+    """
+    if not points:
+        return []
+
+    with span("features", points=len(points)):
+        features = get_features(points)
+
+    has_data = ~np.isnan(features).all(axis=1) if features.shape[1] else np.zeros(len(points), dtype=bool)
+    results = [[] for _ in points]
+    if has_data.any():
+        predictions = predict_top_species(features[has_data], top_k)
+        for i, prediction in zip(np.flatnonzero(has_data), predictions):
+            results[i] = prediction
+    return results
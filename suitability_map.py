@@ -0,0 +1,251 @@
+import os
+import sys
+import copy
+import json
+import time
+import uuid
+import argparse
+import threading
+import numpy as np
+from PIL import Image, ImageDraw
+
+from feature_cache import CELL_DEG, snap, cell_center
+from feature_tiles import tile_store
+from model_registry import registry
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PREDICT_CHUNK = int(os.getenv("SUITABILITY_CHUNK", "50000"))
+NTHREAD = int(os.getenv("SUITABILITY_NTHREAD", str(os.cpu_count() or 1)))
+MAX_CELLS = int(os.getenv("SUITABILITY_MAX_CELLS", "250000"))
+# Boxes not covered by a tile region are queried cell by cell through the cache and PostGIS.
+MAX_QUERY_CELLS = int(os.getenv("SUITABILITY_MAX_QUERY_CELLS", "5000"))
+QUERY_BATCH = 1000
+
+PALETTE = [
+    (31, 119, 180), (255, 127, 14), (44, 160, 44), (214, 39, 40), (148, 103, 189),
+    (140, 86, 75), (227, 119, 194), (127, 127, 127), (188, 189, 34), (23, 190, 207),
+]
+
+
+def grid_shape(min_lon, min_lat, max_lon, max_lat, cell_deg=CELL_DEG):
+    """(row0, col0, rows, cols) of the grid cells covering the bounding box."""
+    if not (min_lon < max_lon and min_lat < max_lat):
+        raise ValueError(f"Empty or inverted bounding box: expected min_lon < max_lon and min_lat < max_lat, "
+                         f"got [{min_lon}, {min_lat}, {max_lon}, {max_lat}]")
+    row0, col0 = snap(min_lat, min_lon, cell_deg)
+    row1, col1 = snap(max_lat, max_lon, cell_deg)
+    return row0, col0, row1 - row0 + 1, col1 - col0 + 1
+
+
+def feature_grid(min_lon, min_lat, max_lon, max_lat, cell_deg=CELL_DEG):
+    """(rows, cols, n_features) features for the bounding box.
+
+    Read as a slice of a precomputed tile region when one covers the whole box,
+    otherwise assembled through get_features (cache, then PostGIS).
+    """
+    row0, col0, rows, cols = grid_shape(min_lon, min_lat, max_lon, max_lat, cell_deg)
+
+    for region in tile_store.regions:
+        r, c = row0 - region.row0, col0 - region.col0
+        if r >= 0 and c >= 0 and r + rows <= region.rows and c + cols <= region.cols \
+                and region.filled[r:r + rows, c:c + cols].all():
+            return region.features[r:r + rows, c:c + cols]
+
+    if rows * cols > MAX_QUERY_CELLS:
+        raise ValueError(f"Bounding box has {rows * cols} cells outside a precomputed tile region, limit is "
+                         f"{MAX_QUERY_CELLS}; build a region for it with python -m feature_tiles")
+
+    from species_data_handler import get_features
+
+    centers = [cell_center((row0 + r, col0 + c), cell_deg) for r in range(rows) for c in range(cols)]
+    blocks = [get_features(centers[start:start + QUERY_BATCH]) for start in range(0, len(centers), QUERY_BATCH)]
+    width = max(block.shape[1] for block in blocks)
+    features = np.full((len(centers), width), np.nan)
+    start = 0
+    for block in blocks:
+        features[start:start + len(block), :block.shape[1]] = block
+        start += len(block)
+    return features.reshape(rows, cols, -1)
+
+
+_grid_model = (None, None, None)
+_grid_model_lock = threading.Lock()
+
+
+def grid_model(nthread=NTHREAD):
+    """(model, encoder): a private copy of the registry model using nthread
+    threads, made once per loaded model, and the encoder loaded with it.
+
+    Setting n_jobs on registry.model itself would change it for every
+    concurrent /chat and /species/batch caller.
+    """
+    global _grid_model
+    model, encoder = registry.classifier
+    with _grid_model_lock:
+        source, threads, copied = _grid_model
+        if source is not model or threads != nthread:
+            copied = copy.deepcopy(model)
+            if hasattr(copied, "set_params"):
+                copied.set_params(n_jobs=nthread)
+            _grid_model = (model, nthread, copied)
+        return copied, encoder
+
+
+def predict_grid(features, chunk=PREDICT_CHUNK, nthread=NTHREAD):
+    """Class probabilities for every cell, predicted in fixed-size chunks.
+
+    Returns (probabilities[rows, cols, n_classes] as float32, class codes).
+    Cells without any feature data get NaN probabilities.
+    """
+    xgb_model, le = grid_model(nthread)
+
+    rows, cols, n_features = features.shape
+    flat = features.reshape(rows * cols, n_features)
+    has_data = ~np.isnan(flat).all(axis=1)
+
+    class_ids = getattr(xgb_model, "classes_", None)
+    probabilities = None
+    for start in range(0, len(flat), chunk):
+        block = np.asarray(flat[start:start + chunk], dtype=np.float64)
+        mask = has_data[start:start + chunk]
+        if not mask.any():
+            continue
+        block_probs = xgb_model.predict_proba(block[mask])
+        if probabilities is None:
+            probabilities = np.full((len(flat), block_probs.shape[1]), np.nan, dtype=np.float32)
+        probabilities[start:start + chunk][mask] = block_probs
+
+    if probabilities is None:
+        return np.full((rows, cols, 0), np.nan, dtype=np.float32), []
+    if class_ids is None:
+        class_ids = np.arange(probabilities.shape[1])
+    codes = [str(code) for code in le.inverse_transform(class_ids)]
+    return probabilities.reshape(rows, cols, -1), codes
+
+
+def _write_world_file(png_path, row0, col0, rows, scale, cell_deg):
+    # ESRI world file so GIS tools can place the PNG: pixel size, rotation, top-left pixel centre.
+    pixel = cell_deg / scale
+    top_lat = (row0 + rows) * cell_deg
+    left_lon = col0 * cell_deg
+    with open(os.path.splitext(png_path)[0] + ".pgw", "w") as f:
+        f.write(f"{pixel}\n0.0\n0.0\n{-pixel}\n{left_lon + pixel / 2}\n{top_lat - pixel / 2}\n")
+
+
+def _to_image(rgba, scale):
+    # Row 0 is the southernmost cell; images are drawn north-up.
+    image = Image.fromarray(np.ascontiguousarray(rgba[::-1]), "RGBA")
+    if scale > 1:
+        image = image.resize((image.width * scale, image.height * scale), Image.NEAREST)
+    return image
+
+
+def render_probability(probability, scale):
+    rgba = np.zeros(probability.shape + (4,), dtype=np.uint8)
+    valid = ~np.isnan(probability)
+    p = np.where(valid, probability, 0)
+    rgba[..., 0] = (255 * (1 - p)).astype(np.uint8)
+    rgba[..., 1] = (100 + 155 * p).astype(np.uint8)
+    rgba[..., 2] = 60
+    rgba[..., 3] = np.where(valid, 255, 0)
+    return _to_image(rgba, scale)
+
+
+def render_best_species(probabilities, names, scale):
+    rgba = np.zeros(probabilities.shape[:2] + (4,), dtype=np.uint8)
+    valid = ~np.isnan(probabilities).all(axis=2)
+    best = np.argmax(np.where(np.isnan(probabilities), -1, probabilities), axis=2)
+    colors = np.array([PALETTE[i % len(PALETTE)] for i in range(len(names))], dtype=np.uint8)
+    rgba[..., :3] = colors[best]
+    rgba[..., 3] = np.where(valid, 255, 0)
+    image = _to_image(rgba, scale)
+
+    present = np.unique(best[valid])
+    legend = Image.new("RGBA", (max(image.width, 320), 30 + 22 * len(present)), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(legend)
+    draw.text((10, 8), "Best species:", fill=(0, 0, 0, 255))
+    for i, class_idx in enumerate(present):
+        y = 28 + i * 22
+        draw.rectangle((10, y, 26, y + 14), fill=tuple(colors[class_idx]) + (255,))
+        draw.text((34, y), names[class_idx], fill=(0, 0, 0, 255))
+
+    canvas = Image.new("RGBA", (legend.width, image.height + legend.height), (255, 255, 255, 0))
+    canvas.paste(image, (0, 0))
+    canvas.paste(legend, (0, image.height))
+    return canvas
+
+
+def generate_suitability_maps(min_lon, min_lat, max_lon, max_lat, species_code_to_name=None,
+                              output_dir=os.path.join(BASE_DIR, "static", "maps"), scale=4,
+                              per_species=True, cell_deg=CELL_DEG):
+    """Predict every grid cell of the bounding box and write suitability PNGs.
+
+    Writes <id>_best.png (best species per cell, with legend) and, if per_species,
+    one <id>_<code>.png probability raster per species, each with a .pgw world
+    file. Returns a summary dict with /static/maps URLs and timing.
+    """
+    species_code_to_name = species_code_to_name or {}
+    row0, col0, rows, cols = grid_shape(min_lon, min_lat, max_lon, max_lat, cell_deg)
+    if rows * cols > MAX_CELLS:
+        raise ValueError(f"Bounding box has {rows * cols} cells, limit is {MAX_CELLS}")
+
+    started = time.perf_counter()
+    features = feature_grid(min_lon, min_lat, max_lon, max_lat, cell_deg)
+    features_done = time.perf_counter()
+    probabilities, codes = predict_grid(features)
+    predict_done = time.perf_counter()
+
+    os.makedirs(output_dir, exist_ok=True)
+    map_id = uuid.uuid4().hex[:12]
+    names = [species_code_to_name.get(code, code) for code in codes]
+    summary = {
+        "id": map_id,
+        "bbox": [min_lon, min_lat, max_lon, max_lat],
+        "shape": [rows, cols],
+        "species": codes,
+        "maps": {},
+    }
+
+    if codes:
+        best_path = os.path.join(output_dir, f"{map_id}_best.png")
+        render_best_species(probabilities, names, scale).save(best_path)
+        _write_world_file(best_path, row0, col0, rows, scale, cell_deg)
+        summary["maps"]["best"] = f"/static/maps/{map_id}_best.png"
+
+        if per_species:
+            for i, code in enumerate(codes):
+                path = os.path.join(output_dir, f"{map_id}_{code}.png")
+                render_probability(probabilities[..., i], scale).save(path)
+                _write_world_file(path, row0, col0, rows, scale, cell_deg)
+                summary["maps"][code] = f"/static/maps/{map_id}_{code}.png"
+
+    cells = rows * cols
+    summary["timing"] = {
+        "features_s": features_done - started,
+        "predict_s": predict_done - features_done,
+        "render_s": time.perf_counter() - predict_done,
+        "predict_cells_per_s": cells / (predict_done - features_done) if predict_done > features_done else None,
+    }
+    return summary
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Render species suitability maps for a bounding box")
+    parser.add_argument("--bbox", type=float, nargs=4, required=True,
+                        metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"))
+    parser.add_argument("--output", default=os.path.join(BASE_DIR, "static", "maps"))
+    parser.add_argument("--scale", type=int, default=4, help="pixels per grid cell")
+    parser.add_argument("--best-only", action="store_true", help="skip the per-species rasters")
+    args = parser.parse_args(argv)
+
+    from species_data_handler import load_species_code_to_name
+
+    names = load_species_code_to_name(os.path.join(BASE_DIR, "data", "species_metadata.csv"))
+    summary = generate_suitability_maps(*args.bbox, species_code_to_name=names, output_dir=args.output,
+                                        scale=args.scale, per_species=not args.best_only)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,20 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# Make the top-level modules (db_connector, feature_cache, ...) importable
+# when pytest is run as `pytest` rather than `python -m pytest`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def standins():
+    """(api_server, handles) on the offline stand-ins of benchmarks.standins, shared by the session."""
+    from benchmarks.standins import install_standins
+
+    api_server, handles = install_standins(tokens_per_second=500, tokens=5, first_token_delay=0.0, db_delay=0.0)
+    yield api_server, handles
+    handles["stub"].shutdown()
+    shutil.rmtree(handles["workdir"], ignore_errors=True)
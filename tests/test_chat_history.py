@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from rag_functions.chat_history import SessionStore
+
+
+def contents(history):
+    return [(m.type, m.content) for m in history.messages]
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path)
+
+
+def test_turns_are_appended_to_the_log(root):
+    store = SessionStore(root)
+    store.append_turn("s1", "hello", "hi there")
+    store.append_turn("s1", "and?", "that's all")
+    assert store.messages("s1") == [
+        {"role": "human", "content": "hello"}, {"role": "ai", "content": "hi there"},
+        {"role": "human", "content": "and?"}, {"role": "ai", "content": "that's all"},
+    ]
+    with open(store.path("s1")) as f:
+        assert len(f.readlines()) == 4
+    assert contents(store.history("s1")) == [("human", "hello"), ("ai", "hi there"),
+                                             ("human", "and?"), ("ai", "that's all")]
+
+
+def test_cached_history_picks_up_appends_from_another_worker(root):
+    store, other = SessionStore(root), SessionStore(root)
+    store.append_turn("s1", "q1", "a1")
+    history = store.history("s1")
+    other.append_turn("s1", "q2", "a2")
+    assert store.history("s1") is history
+    assert contents(history)[-2:] == [("human", "q2"), ("ai", "a2")]
+    assert store.stats()["hits"] == 1
+
+
+def test_partial_line_is_read_once_complete(root):
+    store = SessionStore(root)
+    store.append_turn("s1", "q1", "a1")
+    line = json.dumps({"role": "human", "content": "q2"}) + "\n"
+    with open(store.path("s1"), "a") as f:
+        f.write(line[:10])
+    assert len(store.history("s1").messages) == 2
+    with open(store.path("s1"), "a") as f:
+        f.write(line[10:])
+    assert contents(store.history("s1"))[-1] == ("human", "q2")
+
+
+def test_truncated_log_is_reloaded(root):
+    store = SessionStore(root)
+    store.append_turn("s1", "q1", "a1")
+    store.history("s1")
+    with open(store.path("s1"), "w") as f:
+        f.write(json.dumps({"role": "human", "content": "fresh"}) + "\n")
+    assert contents(store.history("s1")) == [("human", "fresh")]
+
+
+def test_legacy_json_session_is_migrated(root):
+    store = SessionStore(root)
+    with open(store.legacy_path("old"), "w") as f:
+        json.dump([{"role": "human", "content": "q"}, {"role": "ai", "content": "a"}], f)
+    with open(store.legacy_path("older"), "w") as f:
+        json.dump([{"role": "human", "content": "q"}], f)
+
+    assert contents(store.history("old")) == [("human", "q"), ("ai", "a")]
+    assert store.migrate_all() == 1
+    assert sorted(store.list_sessions()) == ["old", "older"]
+    assert store.messages("older") == [{"role": "human", "content": "q"}]
+    assert store.stats()["migrated"] == 2
+
+
+def test_least_recently_used_history_is_evicted(root):
+    store = SessionStore(root, max_sessions=2)
+    for session_id in ("a", "b"):
+        store.append_turn(session_id, "q", "a")
+        store.history(session_id)
+    store.history("a")
+    store.history("c")
+    assert store.stats()["evictions"] == 1 and store.stats()["cached"] == 2
+    assert contents(store.history("b")) == [("human", "q"), ("ai", "a")], "re-read from the log"
+
+
+@pytest.mark.parametrize("session_id", ["", "../etc/passwd", "a b", "x" * 129])
+def test_invalid_session_ids_are_rejected(root, session_id):
+    with pytest.raises(ValueError):
+        SessionStore(root).path(session_id)
@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+from benchmarks.standins import HashingEmbeddings
+from rag_functions import database
+
+
+@pytest.fixture
+def store(tmp_path):
+    db = tmp_path / "chroma_db"
+    vectorstore = database.open_db(HashingEmbeddings(dim=32), str(db))
+    yield vectorstore, str(db)
+    vectorstore.delete_collection()
+
+
+def test_version_follows_the_manifest_written_by_another_process(store, monkeypatch):
+    vectorstore, db = store
+    manifest_path = os.path.join(db, database.MANIFEST_NAME)
+    monkeypatch.setattr(database, "VERSION_CHECK_INTERVAL", 3600)
+    before = database.get_collection_version(vectorstore)
+
+    # what python -m rag_functions.ingest in another process leaves behind
+    database.save_manifest(manifest_path, {"chunking": {}, "files": {"a.pdf": {"sha256": "x", "chunk_ids": []}}})
+    assert database.get_collection_version(vectorstore) == before, "the manifest is only re-read after the TTL"
+
+    monkeypatch.setattr(database, "VERSION_CHECK_INTERVAL", 0)
+    after = database.get_collection_version(vectorstore)
+    assert after != before
+    assert database.get_collection_version(vectorstore) == after
+
+
+def test_in_process_changes_bump_the_version(store):
+    vectorstore, _ = store
+    before = database.get_collection_version(vectorstore)
+    database.mark_collection_changed()
+    assert database.get_collection_version(vectorstore) != before
+
+
+def parse_text(name, path):
+    """Stand-in for parse_pdf: the "PDFs" are text files with one chunk per paragraph."""
+    from langchain_core.documents import Document
+
+    with open(path) as f:
+        chunks = [Document(page_content=p, metadata={"source": name}) for p in f.read().split("\n\n") if p]
+    return chunks, database.chunk_ids(name, chunks)
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "parse_pdf", parse_text)
+    folder = tmp_path / "data"
+    folder.mkdir()
+
+    def write(name, *paragraphs):
+        (folder / name).write_text("\n\n".join(paragraphs))
+
+    return str(folder), write
+
+
+def stored(vectorstore):
+    return sorted(vectorstore.get()["documents"])
+
+
+def test_sync_adds_updates_and_removes(store, library):
+    vectorstore, db = store
+    folder, write = library
+    manifest_path = os.path.join(db, database.MANIFEST_NAME)
+    write("a.pdf", "alpha one", "alpha two")
+    write("b.pdf", "beta one")
+    write("notes.txt", "not a pdf")
+
+    summary = database.sync_documents(vectorstore, folder, manifest_path)
+    assert summary["added"] == ["a.pdf", "b.pdf"] and summary["embedded"] == 3
+    assert stored(vectorstore) == ["alpha one", "alpha two", "beta one"]
+
+    summary = database.sync_documents(vectorstore, folder, manifest_path)
+    assert summary["unchanged"] == 2 and summary["embedded"] == 0 and summary["deleted"] == 0
+
+    write("a.pdf", "alpha one", "alpha three")
+    os.remove(os.path.join(folder, "b.pdf"))
+    summary = database.sync_documents(vectorstore, folder, manifest_path)
+    assert summary["updated"] == ["a.pdf"] and summary["removed"] == ["b.pdf"]
+    assert summary["embedded"] == 1, "only the new paragraph is embedded"
+    assert summary["deleted"] == 2
+    assert stored(vectorstore) == ["alpha one", "alpha three"]
+    assert set(database.load_manifest(manifest_path)["files"]) == {"a.pdf"}
+
+
+def test_sync_resumes_after_a_crash_between_batches(store, library, monkeypatch):
+    vectorstore, db = store
+    folder, write = library
+    manifest_path = os.path.join(db, database.MANIFEST_NAME)
+    write("a.pdf", "a1", "a2")
+    write("b.pdf", "b1", "b2")
+    write("c.pdf", "c1", "c2")
+
+    add_texts = type(vectorstore).add_texts
+    calls = []
+
+    def crash_on_second_batch(self, *args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("killed")
+        return add_texts(self, *args, **kwargs)
+
+    monkeypatch.setattr(type(vectorstore), "add_texts", crash_on_second_batch)
+    with pytest.raises(RuntimeError):
+        database.sync_documents(vectorstore, folder, manifest_path, batch_size=2)
+    assert set(database.load_manifest(manifest_path)["files"]) == {"a.pdf"}, \
+        "only files whose chunks were all written are recorded"
+
+    monkeypatch.setattr(type(vectorstore), "add_texts", add_texts)
+    summary = database.sync_documents(vectorstore, folder, manifest_path, batch_size=2)
+    assert summary["unchanged"] == 1 and summary["added"] == ["b.pdf", "c.pdf"]
+    assert stored(vectorstore) == ["a1", "a2", "b1", "b2", "c1", "c2"]
+
+
+def test_changed_chunking_reindexes(store, library, monkeypatch):
+    vectorstore, db = store
+    folder, write = library
+    manifest_path = os.path.join(db, database.MANIFEST_NAME)
+    write("a.pdf", "alpha")
+    database.sync_documents(vectorstore, folder, manifest_path)
+
+    monkeypatch.setattr(database, "CHUNK_SIZE", database.CHUNK_SIZE + 1)
+    summary = database.sync_documents(vectorstore, folder, manifest_path)
+    assert summary["added"] == ["a.pdf"]
+    assert stored(vectorstore) == ["alpha"]
@@ -0,0 +1,239 @@
+"""ConnectionManager against an in-memory pool and tunnel.
+
+The fakes stand in for psycopg2's ThreadedConnectionPool and sshtunnel's
+forwarder, so borrowing, discarding and reconnecting are checked without a
+database. test_local_postgres runs the same manager against a real server
+when DB_NAME points at one (no SSH_HOST, i.e. no tunnel).
+"""
+import os
+import threading
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import pytest
+
+import db_connector
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.executed.append(sql)
+
+    def fetchone(self):
+        return (1,)
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.closed = 0
+        self.broken = False
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        if self.broken:
+            raise psycopg2.OperationalError("connection already closed")
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool:
+    created = []
+
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.kwargs = kwargs
+        self.idle = []
+        self.used = []
+        self.closed = False
+        FakePool.created.append(self)
+
+    def getconn(self):
+        if self.closed:
+            raise psycopg2.pool.PoolError("connection pool is closed")
+        conn = self.idle.pop() if self.idle else FakeConnection(self)
+        self.used.append(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        if self.closed:
+            raise psycopg2.pool.PoolError("connection pool is closed")
+        assert conn.pool is self, "connection returned to a different pool"
+        self.used.remove(conn)
+        if close:
+            conn.close()
+        else:
+            self.idle.append(conn)
+
+    def closeall(self):
+        for conn in self.idle + self.used:
+            conn.close()
+        self.closed = True
+
+
+class FakeTunnel:
+    def __init__(self, port):
+        self.local_bind_port = port
+        self.is_active = True
+        self.tunnel_is_up = {("127.0.0.1", port): True}
+        self.stopped = False
+
+    def check_tunnels(self):
+        pass
+
+    def stop(self):
+        self.stopped = True
+        self.is_active = False
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    FakePool.created = []
+    tunnels = []
+
+    def start_tunnel(self):
+        tunnels.append(FakeTunnel(40000 + len(tunnels)))
+        return tunnels[-1]
+
+    monkeypatch.setenv("SSH_HOST", "tunnel.example")
+    monkeypatch.setattr(psycopg2.pool, "ThreadedConnectionPool", FakePool)
+    monkeypatch.setattr(db_connector.ConnectionManager, "_start_tunnel", start_tunnel)
+    manager = db_connector.ConnectionManager(minconn=1, maxconn=4, timeout=1, idle_check=30)
+    manager.tunnels = tunnels
+    yield manager
+    manager.close()
+
+
+def test_borrow_and_return(manager):
+    with manager.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 42")
+        assert manager.stats()["in_use"] == 1
+    with manager.connection() as again:
+        pass
+
+    assert again is conn, "a returned connection is reused"
+    assert conn.executed == ["SELECT 42"], "a recently used connection is not health-checked"
+    stats = manager.stats()
+    assert stats["borrowed"] == 2 and stats["in_use"] == 0 and stats["reconnects"] == 0
+    assert FakePool.created[0].kwargs["port"] == manager.tunnels[0].local_bind_port
+
+
+def test_idle_connection_is_checked(manager):
+    manager.idle_check = 0
+    with manager.connection():
+        pass
+    with manager.connection() as conn:
+        pass
+    assert conn.executed == ["SELECT 1"]
+
+
+def test_broken_connection_is_discarded(manager):
+    with pytest.raises(psycopg2.OperationalError):
+        with manager.connection() as conn:
+            conn.broken = True
+            conn.cursor().execute("SELECT 42")
+    assert conn.closed
+
+    # the tunnel is still up, so the pool is kept and a new connection handed out
+    with manager.connection() as fresh:
+        pass
+    assert fresh is not conn
+    assert len(FakePool.created) == 1
+    assert manager.stats()["reconnects"] == 0
+
+
+def test_dead_idle_connection_is_replaced(manager):
+    manager.idle_check = 0
+    with manager.connection() as conn:
+        pass
+    conn.broken = True
+    with manager.connection() as fresh:
+        pass
+    assert fresh is not conn and conn.closed
+    assert manager.stats()["discarded"] == 1
+
+
+def test_reconnect_while_another_thread_holds_a_connection(manager):
+    borrowed = threading.Event()
+    finish = threading.Event()
+    outcome = {}
+
+    def slow_query():
+        try:
+            with manager.connection() as conn:
+                outcome["conn"] = conn
+                borrowed.set()
+                finish.wait(5)
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 42")
+            outcome["ok"] = True
+        except Exception as exc:
+            outcome["error"] = exc
+
+    worker = threading.Thread(target=slow_query)
+    worker.start()
+    assert borrowed.wait(5)
+
+    # the tunnel drops: a query fails, and the next borrow reconnects
+    manager.tunnels[0].is_active = False
+    with pytest.raises(psycopg2.OperationalError):
+        with manager.connection() as conn:
+            conn.broken = True
+            conn.cursor().execute("SELECT 1")
+    with manager.connection() as conn:
+        pass
+
+    old_pool, new_pool = FakePool.created
+    assert conn.pool is new_pool
+    assert not old_pool.closed, "the old pool stays open while a connection is borrowed from it"
+    assert not manager.tunnels[0].stopped
+    assert manager.stats()["retired_pools"] == 1
+
+    finish.set()
+    worker.join(5)
+    assert outcome.get("ok"), outcome.get("error")
+    assert outcome["conn"].pool is old_pool
+    assert old_pool.closed and manager.tunnels[0].stopped
+    stats = manager.stats()
+    assert stats["reconnects"] == 1 and stats["retired_pools"] == 0 and stats["in_use"] == 0
+
+
+@pytest.mark.skipif(not os.getenv("DB_NAME") or os.getenv("SSH_HOST"),
+                    reason="needs a local Postgres (DB_NAME, DB_USER, DB_PASSWORD, DB_HOST) and no SSH_HOST")
+def test_local_postgres():
+    manager = db_connector.ConnectionManager(minconn=1, maxconn=2, timeout=5)
+    try:
+        with manager.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            assert cursor.fetchone() == (1,)
+        with pytest.raises(psycopg2.Error):
+            with manager.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("SELECT * FROM no_such_table")
+        with manager.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT 2")
+            assert cursor.fetchone() == (2,)
+        assert manager.stats()["in_use"] == 0
+    finally:
+        manager.close()
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+import feature_cache
+from feature_cache import FeatureCache, cell_center, snap
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache" / "features.sqlite")
+
+
+def test_points_in_one_cell_share_a_key():
+    cell = snap(-25.4301, -49.2701)
+    assert snap(-25.4309, -49.2709) == cell
+    assert snap(-25.4301 - 1 / 120, -49.2701) != cell
+    lat, lon = cell_center(cell)
+    assert snap(lat, lon) == cell
+    assert abs(lat - -25.4301) <= 1 / 120 and abs(lon - -49.2701) <= 1 / 120
+
+
+def test_negative_coordinates_snap_down():
+    # floor, not truncation: -0.001 is in the cell below 0
+    assert snap(-0.001, -0.001, cell_deg=1.0) == (-1, -1)
+    assert snap(0.001, 0.001, cell_deg=1.0) == (0, 0)
+
+
+def test_round_trip_through_sqlite(cache_path):
+    cache = FeatureCache(path=cache_path)
+    vectors = {(1, 2): [1.0, 2.0, 3.0], (-3, 4): [0.5, -0.5, 7.25]}
+    cache.put_many(vectors.items())
+    cache.put((5, 6), np.arange(3))
+
+    reopened = FeatureCache(path=cache_path)
+    for cell, vector in vectors.items():
+        np.testing.assert_array_equal(reopened.get(cell), vector)
+    np.testing.assert_array_equal(reopened.get((5, 6)), [0.0, 1.0, 2.0])
+    assert reopened.get((7, 8)) is None
+    assert reopened.stats()["disk_hits"] == 3 and reopened.stats()["misses"] == 1
+
+    reopened.get((1, 2))
+    assert reopened.stats()["memory_hits"] == 1
+
+
+def test_other_cell_size_or_window_is_a_miss(cache_path):
+    FeatureCache(path=cache_path).put((1, 2), [1.0])
+    assert FeatureCache(path=cache_path, cell_deg=1 / 60).get((1, 2)) is None
+    assert FeatureCache(path=cache_path, window="2024-01-01/2024-12-31").get((1, 2)) is None
+
+
+def test_expired_entries_are_not_served(cache_path, monkeypatch):
+    cache = FeatureCache(path=cache_path, ttl=10)
+    cache.put((1, 2), [1.0])
+    later = feature_cache.time.time() + 11
+    monkeypatch.setattr(feature_cache.time, "time", lambda: later)
+    assert cache.get((1, 2)) is None
+    assert FeatureCache(path=cache_path, ttl=10).get((1, 2)) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_memory_tier_is_bounded():
+    cache = FeatureCache(path=None, memory_size=2)
+    cache.put_many([((0, 0), [0.0]), ((0, 1), [1.0])])
+    cache.get((0, 0))  # (0, 1) is now the least recently used
+    cache.put((0, 2), [2.0])
+    assert cache.get((0, 1)) is None
+    assert cache.get((0, 0)) is not None and cache.get((0, 2)) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_source_change_clears_the_cache(cache_path, monkeypatch):
+    monkeypatch.setattr(feature_cache, "VERSION_CHECK_INTERVAL", 1)
+    cache = FeatureCache(path=cache_path)
+    cache.check_source_version(lambda: "v1")
+    cache.put((1, 2), [1.0])
+
+    cache._version_checked_at = 0.0
+    cache.check_source_version(lambda: "v1")
+    assert cache.get((1, 2)) is not None
+
+    cache._version_checked_at = 0.0
+    cache.check_source_version(lambda: "v2")
+    assert cache.get((1, 2)) is None
+    assert FeatureCache(path=cache_path).source_version == "v2"
+
+
+def test_unreachable_source_keeps_serving(cache_path, monkeypatch):
+    monkeypatch.setattr(feature_cache, "VERSION_CHECK_INTERVAL", 1)
+    cache = FeatureCache(path=cache_path)
+    cache.put((1, 2), [1.0])
+
+    def unreachable():
+        raise ConnectionError("tunnel down")
+
+    cache.check_source_version(unreachable)
+    assert cache.get((1, 2)) is not None
@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pytest
+
+import feature_tiles
+from feature_cache import snap
+
+BBOX = (-44.5, -20.5, -44.3, -20.3)
+
+
+def constant(value, width=3):
+    return lambda points: np.full((len(points), width), float(value))
+
+
+class Crash(Exception):
+    pass
+
+
+def test_build_and_lookup(tmp_path):
+    store = feature_tiles.TileStore(root=str(tmp_path), check_interval=0)
+    feature_tiles.build_region("a", *BBOX, fetch_features=constant(1), root=str(tmp_path))
+
+    assert store.lookup(snap(-20.4, -44.4)).tolist() == [1.0, 1.0, 1.0]
+    assert store.lookup(snap(-10.0, -44.4)) is None
+    assert sorted(os.listdir(tmp_path)) == ["a"], "no build directories are left behind"
+
+
+def test_rebuild_keeps_mapped_readers_on_the_old_files(tmp_path):
+    feature_tiles.build_region("a", *BBOX, fetch_features=constant(1), root=str(tmp_path))
+    reader = feature_tiles.TileStore(root=str(tmp_path), check_interval=0)
+    cell = snap(-20.4, -44.4)
+    assert reader.lookup(cell)[0] == 1.0
+
+    # a different grid forces a full rebuild of the same region
+    feature_tiles.build_region("a", *BBOX, fetch_features=constant(2, width=5), root=str(tmp_path), cell_deg=0.05)
+
+    assert reader.lookup(cell).tolist() == [1.0, 1.0, 1.0]
+    fresh = feature_tiles.TileStore(root=str(tmp_path), cell_deg=0.05)
+    assert fresh.lookup(snap(-20.4, -44.4, 0.05)).tolist() == [2.0] * 5
+
+
+def test_interrupted_build_is_invisible_and_resumes(tmp_path):
+    calls = []
+
+    def failing(points):
+        calls.append(len(points))
+        if len(calls) == 2:
+            raise Crash()
+        return np.full((len(points), 3), 7.0)
+
+    with pytest.raises(Crash):
+        feature_tiles.build_region("a", *BBOX, fetch_features=failing, root=str(tmp_path), batch=2)
+    store = feature_tiles.TileStore(root=str(tmp_path), check_interval=0)
+    assert store.regions == [], "a half-built region is not served"
+    assert not os.path.exists(tmp_path / "a" / "meta.json")
+
+    resumed = []
+
+    def counting(points):
+        resumed.append(len(points))
+        return np.full((len(points), 3), 7.0)
+
+    feature_tiles.build_region("a", *BBOX, fetch_features=counting, root=str(tmp_path), batch=2)
+    region = feature_tiles.TileStore(root=str(tmp_path)).regions[0]
+    total = region.rows * region.cols
+    assert sum(resumed) == total - 2, "the cells of the first batch are not fetched again"
+    assert np.asarray(region.filled).all()
+
+
+def test_inverted_bbox_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Inverted bounding box"):
+        feature_tiles.build_region("a", -44.3, -20.5, -44.5, -20.3, fetch_features=constant(1), root=str(tmp_path))
+    assert not os.listdir(tmp_path)
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+import geocoding
+from benchmarks.standins import write_gazetteer
+
+
+class SlowNominatim:
+    """Answers every query after `delay` seconds and records when each call started."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.started = []
+        self.lock = threading.Lock()
+
+    def geocode(self, query, exactly_one=True, timeout=None):
+        with self.lock:
+            self.started.append(time.monotonic())
+        time.sleep(self.delay)
+        return type("Location", (), {"latitude": 1.0, "longitude": 2.0})()
+
+
+def make_geocoder(tmp_path, gazetteer=True):
+    dump = write_gazetteer(str(tmp_path)) if gazetteer else str(tmp_path / "missing.txt")
+    return geocoding.Geocoder(
+        gazetteer=geocoding.Gazetteer(dump, str(tmp_path / "gazetteer.npz")),
+        cache=geocoding.GeocodeCache(str(tmp_path / "geocode.sqlite")),
+        online=True,
+        deadline=5,
+    )
+
+
+def test_cache_then_gazetteer(tmp_path):
+    geocoder = make_geocoder(tmp_path)
+    geocoder.online = False
+    assert geocoder.geocode("Curitiba") == pytest.approx((-25.4284, -49.2733), abs=1e-4)
+    assert geocoder.geocode("curitiba") == pytest.approx((-25.4284, -49.2733), abs=1e-4)
+    assert geocoder.reverse(-25.43, -49.27) == "Curitiba"
+    stats = geocoder.stats()
+    assert stats["gazetteer"] == 2 and stats["cache"] == 1 and stats["gazetteer_places"] == 8
+
+
+def test_slow_nominatim_call_does_not_block_other_lookups(tmp_path, monkeypatch):
+    monkeypatch.setattr(geocoding, "NOMINATIM_INTERVAL", 0.1)
+    geocoder = make_geocoder(tmp_path, gazetteer=False)
+    nominatim = geocoder._nominatim = SlowNominatim(delay=0.6)
+
+    threads = [threading.Thread(target=geocoder.geocode, args=(f"Nowhere {i}",)) for i in range(3)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    elapsed = time.monotonic() - started
+
+    gaps = [b - a for a, b in zip(nominatim.started, nominatim.started[1:])]
+    assert len(nominatim.started) == 3
+    assert all(gap >= 0.09 for gap in gaps), "requests still keep the rate limit"
+    assert elapsed < 1.2, "requests overlap instead of queueing behind the slow one"
+    assert geocoder.stats()["nominatim"] == 3
+
+
+def test_missing_gazetteer_is_reported(tmp_path, caplog):
+    geocoder = make_geocoder(tmp_path, gazetteer=False)
+    with caplog.at_level("WARNING", logger="geocoding"):
+        geocoder.gazetteer.load()
+    assert "python -m geocoding build" in caplog.text
@@ -0,0 +1,108 @@
+from rag_functions.history_window import CHARS_PER_TOKEN, HistoryWindow, estimate_tokens
+
+
+def turns(n, words=1):
+    messages = []
+    for i in range(n):
+        messages.append({"role": "human", "content": " ".join([f"q{i}"] * words)})
+        messages.append({"role": "ai", "content": " ".join([f"a{i}"] * words)})
+    return messages
+
+
+class Recorder:
+    """Summarizer that lists what it was given, so folds are easy to assert on."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, summary, messages):
+        self.calls.append([m["content"] for m in messages])
+        return (summary + " " if summary else "") + ",".join(m["content"] for m in messages)
+
+
+def settle(window):
+    """Wait for the background fold (the executor has a single worker)."""
+    window._executor.submit(lambda: None).result()
+
+
+def test_keeps_at_most_max_turns():
+    window = HistoryWindow(max_turns=3, token_budget=10_000, summarize=Recorder())
+    messages = turns(5)
+    assert window.recent_start(messages) == 4
+    assert window.recent_start(turns(2)) == 0
+    assert window.recent_start([]) == 0
+
+
+def test_keeps_whole_turns_within_the_token_budget():
+    messages = turns(4, words=10)
+    turn_cost = sum(estimate_tokens(m["content"]) for m in messages[:2])
+    window = HistoryWindow(max_turns=10, token_budget=2 * turn_cost + 1, summarize=Recorder())
+    assert window.recent_start(messages) == 4
+    window.token_budget = turn_cost - 1
+    assert window.recent_start(messages) == len(messages), "a turn is never split"
+
+
+def test_a_turn_starts_at_the_user_message():
+    messages = [{"role": "human", "content": "q"}, {"role": "ai", "content": "a1"}, {"role": "ai", "content": "a2"}]
+    assert HistoryWindow(max_turns=1, token_budget=10_000, summarize=Recorder()).recent_start(messages) == 0
+
+
+def test_older_turns_are_folded_in_the_background():
+    summarize = Recorder()
+    window = HistoryWindow(max_turns=2, token_budget=10_000, summarize=summarize, batch=3)
+    messages = turns(5)
+
+    summary, recent = window.window("s1", messages)
+    assert summary == "", "the first prompt goes out before the summary is ready"
+    assert recent == messages[6:]
+    settle(window)
+    assert summarize.calls == [["q0", "a0", "q1"], ["a1", "q2", "a2"]]
+
+    summary, recent = window.window("s1", messages)
+    assert summary == "q0,a0,q1 a1,q2,a2"
+    assert recent == messages[6:]
+
+    messages += turns(1)
+    window.window("s1", messages)
+    settle(window)
+    assert summarize.calls[-1] == ["q3", "a3"], "only the newly older turn is folded"
+    assert window.stats()["summaries"] == 3
+
+
+def test_summary_is_capped():
+    window = HistoryWindow(max_turns=1, token_budget=10_000, summary_tokens=2,
+                           summarize=lambda summary, messages: "x" * 100)
+    window.window("s1", turns(3))
+    settle(window)
+    assert window.window("s1", turns(3))[0] == "x" * (2 * CHARS_PER_TOKEN)
+
+
+def test_failed_summary_keeps_the_previous_one():
+    def broken(summary, messages):
+        raise ConnectionError("ollama down")
+
+    window = HistoryWindow(max_turns=1, token_budget=10_000, summarize=broken)
+    window.window("s1", turns(3))
+    settle(window)
+    assert window.window("s1", turns(3))[0] == ""
+    settle(window)
+    assert window.stats()["summary_errors"] == 2, "each prompt retries the fold"
+    assert window.stats()["pending"] == 0
+
+
+def test_shorter_history_resets_the_summary():
+    window = HistoryWindow(max_turns=1, token_budget=10_000, summarize=Recorder())
+    window.window("s1", turns(4))
+    settle(window)
+    assert window.window("s1", turns(4))[0]
+    # the session log was cleared and started again
+    assert window.window("s1", turns(1)) == ("", turns(1))
+
+
+def test_prompt_text():
+    window = HistoryWindow(max_turns=1, token_budget=10_000, summarize=Recorder())
+    window.window("s1", turns(2))
+    settle(window)
+    assert window.prompt_text("s1", turns(2), "next?") == (
+        "Summary of the earlier conversation: q0,a0\nUser: q1\nAI: a1\nUser: next?\nAI:"
+    )
@@ -0,0 +1,80 @@
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import LabelEncoder
+
+from model_registry import ModelRegistry
+
+
+def fit(codes):
+    encoder = LabelEncoder().fit(codes)
+    x = np.arange(len(codes) * 4, dtype=float).reshape(-1, 1)
+    y = np.repeat(encoder.transform(codes), 4)
+    return LogisticRegression(max_iter=500).fit(x, y), encoder
+
+
+def deploy(path, obj, stamp):
+    joblib.dump(obj, path)
+    os.utime(path, (stamp, stamp))
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = {name: str(tmp_path / name) for name in ("model.joblib", "encoder.joblib", "query.sql")}
+    with open(paths["query.sql"], "w") as f:
+        f.write("SELECT 1")
+    model, encoder = fit(["AAA", "BBB"])
+    deploy(paths["model.joblib"], model, 1000)
+    deploy(paths["encoder.joblib"], encoder, 1000)
+    return paths
+
+
+def make_registry(files):
+    return ModelRegistry(files["model.joblib"], files["encoder.joblib"], files["query.sql"], check_interval=0)
+
+
+def test_model_and_encoder_reload_together(files):
+    registry = make_registry(files)
+    first_model, first_encoder = registry.classifier
+    assert list(first_encoder.classes_) == ["AAA", "BBB"]
+
+    model, encoder = fit(["CCC", "DDD", "EEE"])
+    deploy(files["model.joblib"], model, 2000)
+    deploy(files["encoder.joblib"], encoder, 2000)
+
+    new_model, new_encoder = registry.classifier
+    assert new_model is not first_model
+    assert list(new_encoder.classes_) == ["CCC", "DDD", "EEE"]
+    assert registry.query == "SELECT 1"
+
+
+def test_half_deployed_pair_keeps_the_loaded_one(files):
+    registry = make_registry(files)
+    loaded = registry.classifier
+
+    # the new model has three classes but the old two-class encoder is still on disk
+    model, encoder = fit(["CCC", "DDD", "EEE"])
+    deploy(files["model.joblib"], model, 2000)
+    assert registry.classifier is loaded
+
+    deploy(files["encoder.joblib"], encoder, 2000)
+    assert list(registry.classifier[1].classes_) == ["CCC", "DDD", "EEE"]
+
+
+def test_mismatched_pair_fails_on_first_load(files):
+    model, _ = fit(["CCC", "DDD", "EEE"])
+    deploy(files["model.joblib"], model, 2000)
+    with pytest.raises(ValueError, match="classes"):
+        make_registry(files).classifier
+
+
+def test_unchanged_files_are_not_reloaded(files):
+    registry = ModelRegistry(files["model.joblib"], files["encoder.joblib"], files["query.sql"], check_interval=60)
+    loaded = registry.classifier
+    model, encoder = fit(["CCC", "DDD", "EEE"])
+    deploy(files["model.joblib"], model, 2000)
+    deploy(files["encoder.joblib"], encoder, 2000)
+    assert registry.classifier is loaded, "files are only stat'ed once per check interval"
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from benchmarks.query_router import CASES, passes
+from query_router import QueryRouter, build_router
+
+with open(CASES, encoding="utf-8") as f:
+    LABELLED = json.load(f)
+
+
+@pytest.fixture(scope="module")
+def router():
+    return build_router()
+
+
+@pytest.mark.parametrize("case", LABELLED, ids=[case["text"] for case in LABELLED])
+def test_labelled_routing_cases(router, case):
+    route = router.route(case["text"])
+    assert passes(case, route, check_terms=True), route
+
+
+def test_integer_pairs_are_not_coordinates_without_a_cue(router):
+    route = router.route("What is 3,5 times 2 for species X?")
+    assert route["coordinates"] is None
+    assert route["intent"] == "species"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Which species grow near 25,49?", (25.0, 49.0)),
+    ("Which species grow at coordinates 25, 49?", (25.0, 49.0)),
+    ("Best species -25.43, -49.27", (-25.43, -49.27)),
+])
+def test_coordinates(router, text, expected):
+    route = router.route(text)
+    assert route["coordinates"] == expected
+    assert route["intent"] == "location"
+
+
+def test_registered_terms_and_intents():
+    router = QueryRouter(intents=[{"name": "fruit", "requires": ["fruit"]}], default_intent="other")
+    router.register("fruit", {"Apple": "APL", "pear": "PER"}, prefix=True)
+    route = router.route("Any APPLES or Pears?")
+    assert route["intent"] == "fruit"
+    assert route["terms"]["fruit"] == ["APL", "PER"]
+    assert router.route("nothing here")["intent"] == "other"
@@ -0,0 +1,14 @@
+import pytest
+
+from spatial import PointIndex
+
+
+def test_nearest_returns_row_and_great_circle_distance():
+    # Curitiba, São Paulo, Porto Alegre
+    index = PointIndex([-25.43, -23.55, -30.03], [-49.27, -46.63, -51.23])
+    row, distance_km = index.nearest(-23.6, -46.6)
+    assert row == 1
+    assert distance_km < 10
+    # Curitiba to São Paulo is about 340 km along the great circle
+    assert index.nearest(-25.43, -49.27)[1] == pytest.approx(0, abs=1e-6)
+    assert PointIndex([-23.55], [-46.63]).nearest(-25.43, -49.27)[1] == pytest.approx(340, rel=0.05)
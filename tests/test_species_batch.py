@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def handler(standins):
+    import species_data_handler
+
+    return species_data_handler
+
+
+POINTS = [(-25.43, -49.27), (-23.55, -46.63), (-15.79, -47.88), (-25.43, -49.27)]
+
+
+def test_batch_matches_single_point_predictions(standins, handler):
+    _, handles = standins
+    handler.feature_cache.invalidate("standin")
+    calls = handles["features"].calls
+    ranked = handler.get_species_for_locations(POINTS, top_k=3)
+    assert handles["features"].calls == calls + 1, "one feature query for the whole batch"
+
+    assert len(ranked) == len(POINTS)
+    for (lat, lon), top in zip(POINTS, ranked):
+        assert len(top) == 3
+        probabilities = [p for _, p in top]
+        assert probabilities == sorted(probabilities, reverse=True)
+        assert top[0][0] == handler.get_species_for_location(lat, lon)
+    assert ranked[0] == ranked[3]
+
+
+def test_points_without_coverage_get_no_species(handler, monkeypatch):
+    def partly_covered(points):
+        features = np.ones((len(points), 4))
+        features[1] = np.nan
+        return features
+
+    monkeypatch.setattr(handler, "get_features", partly_covered)
+    monkeypatch.setattr(handler, "predict_top_species",
+                        lambda features, top_k: [[("A", 1.0)]] * len(features))
+    assert handler.get_species_for_locations([(0, 0), (1, 1), (2, 2)]) == [[("A", 1.0)], [], [("A", 1.0)]]
+    assert handler.get_species_for_locations([]) == []
+
+
+def test_batch_endpoint(standins):
+    api_server, _ = standins
+    body, status = api_server.species_batch_response(
+        {"points": [{"lat": -25.43, "lon": -49.27}, [-23.55, -46.63]], "top_k": 2})
+    assert status == 200
+    assert [(r["lat"], r["lon"]) for r in body["results"]] == [(-25.43, -49.27), (-23.55, -46.63)]
+    assert all(len(r["species"]) == 2 and {"code", "name", "probability"} <= set(r["species"][0])
+               for r in body["results"])
+
+
+@pytest.mark.parametrize("payload", [
+    {"points": [{"lat": 1}]},
+    {"points": [["a", 2]]},
+    {"points": [[1, 2]], "top_k": "many"},
+])
+def test_batch_endpoint_rejects_malformed_points(standins, payload):
+    api_server, _ = standins
+    body, status = api_server.species_batch_response(payload)
+    assert status == 400 and "error" in body
+
+
+def test_batch_endpoint_limits_the_batch_size(standins, monkeypatch):
+    api_server, _ = standins
+    monkeypatch.setattr(api_server, "MAX_BATCH_POINTS", 2)
+    assert api_server.species_batch_response({"points": [[0, 0]] * 3})[1] == 400
@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.mark.parametrize("bbox", [
+    [-49.0, -25.0, -50.0, -24.0],   # min_lon > max_lon
+    [-50.0, -24.0, -49.0, -25.0],   # min_lat > max_lat
+    [-50.0, -25.0, -50.0, -24.0],   # zero width
+    [-50.0, "nan", -49.0, -24.0],
+])
+def test_empty_or_inverted_bbox_is_a_400_with_a_reason(standins, bbox):
+    api_server, _ = standins
+    body, status = api_server.species_suitability_response({"bbox": bbox})
+    assert status == 400
+    assert body["error"].startswith("Empty or inverted bounding box")
@@ -0,0 +1,43 @@
+import pytest
+
+
+@pytest.fixture
+def api_server(standins, monkeypatch):
+    api_server, _ = standins
+    monkeypatch.setattr(api_server, "warm_up_status", dict(api_server.warm_up_status))
+    monkeypatch.setattr(api_server, "READY_STAGES", ("rag", "species_model"))
+    monkeypatch.setattr(api_server, "get_rag_services", lambda: {})
+    monkeypatch.setattr(api_server, "warm_up_species_model", lambda: None)
+    monkeypatch.setattr(api_server.geocoder.gazetteer, "load", lambda: {})
+    monkeypatch.setattr(api_server.productivity, "load", lambda: None)
+    monkeypatch.setattr(api_server, "get_router", lambda: None)
+    return api_server
+
+
+def broken():
+    raise RuntimeError("model file missing")
+
+
+def test_all_stages_ready(api_server):
+    api_server.warm_up()
+    status = api_server.warm_up_status
+    assert all(status[stage] == "ready" for stage in ("rag", "species_model", "gazetteer", "productivity", "router"))
+    assert status["finished_at"] is not None
+    assert api_server.app.test_client().get("/ready").status_code == 200
+
+
+def test_failed_stage_is_logged_and_reported(api_server, monkeypatch, caplog):
+    monkeypatch.setattr(api_server, "warm_up_species_model", broken)
+    monkeypatch.setattr(api_server.productivity, "load", broken)
+    api_server.warm_up()
+
+    status = api_server.warm_up_status
+    assert status["species_model"] == "failed: model file missing"
+    assert status["productivity"] == "failed: model file missing"
+    assert status["rag"] == "ready" and status["router"] == "ready", "later stages still run"
+    assert status["finished_at"] is not None
+    assert "Warm-up of species_model failed" in caplog.text
+
+    response = api_server.app.test_client().get("/ready")
+    assert response.status_code == 503
+    assert response.get_json()["ready"] is False
@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import time
+import uuid
+import bisect
+import logging
+import threading
+import contextvars
+
+# Spans time the stages of a request (routing, geocoding, the PostGIS query,
+# retrieval, the LLM...). Every finished span is added to a per-stage latency
+# histogram served in Prometheus text format at /metrics; with TRACE_LOG=1 each
+# request's spans are also logged as one JSON line. TRACING=0 turns spans into
+# no-ops.
+TRACING = os.getenv("TRACING", "1") != "0"
+TRACE_LOG = os.getenv("TRACE_LOG", "0") == "1"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# timings keys filled in by RagPipeline and HybridRetriever, as stage names
+TIMING_STAGES = {
+    "reformulate_s": "history_reformulation",
+    "embed_s": "query_embedding",
+    "retrieve_s": "retrieval",
+    "vector_search_s": "vector_search",
+    "keyword_search_s": "keyword_search",
+    "fuse_s": "rerank_fusion",
+    "first_token_s": "llm_first_token",
+    "answer_s": "llm_completion",
+}
+
+logger = logging.getLogger("trace")
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class StageHistogram:
+    """Latency histograms keyed by stage, plus a per-stage error count."""
+
+    def __init__(self, name, errors_name, help_text, buckets=BUCKETS):
+        self.name = name
+        self.errors_name = errors_name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._stages = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, error=False):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._stages.get(stage)
+            if series is None:
+                # one count per bucket plus +Inf, then the running sum
+                series = self._stages[stage] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+            if error:
+                self._errors[stage] = self._errors.get(stage, 0) + 1
+
+    def render(self):
+        with self._lock:
+            stages = {stage: list(series) for stage, series in self._stages.items()}
+            errors = dict(self._errors)
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for stage, series in sorted(stages.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{stage="{stage}"}} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{{stage="{stage}"}} {cumulative}')
+        lines.append(f"# HELP {self.errors_name} Stages that ended with an exception.")
+        lines.append(f"# TYPE {self.errors_name} counter")
+        for stage, count in sorted(errors.items()):
+            lines.append(f'{self.errors_name}{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """{stage: {"count", "mean_s"}} for quick inspection."""
+        with self._lock:
+            return {
+                stage: {"count": sum(series[:-1]), "mean_s": series[-1] / max(sum(series[:-1]), 1)}
+                for stage, series in self._stages.items()
+            }
+
+
+stage_latency = StageHistogram("rag_stage_duration_seconds", "rag_stage_errors_total",
+                               "Time spent in each stage of a request.")
+
+
+class Trace:
+    """The spans of one request, kept so they can be logged together."""
+
+    __slots__ = ("name", "trace_id", "started", "spans", "attrs", "_token")
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.spans = []
+        self.attrs = attrs
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        _current.reset(self._token)
+        stage_latency.observe(self.name, duration, exc_type is not None)
+        if TRACE_LOG and logger.isEnabledFor(logging.INFO):
+            record = {"trace_id": self.trace_id, "name": self.name, "duration_s": round(duration, 6),
+                      **self.attrs, "spans": self.spans}
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            logger.info("%s", json.dumps(record, default=str), extra={"trace_record": record})
+        return False
+
+
+class Span:
+    __slots__ = ("stage", "attrs", "started")
+
+    def __init__(self, stage, attrs):
+        self.stage = stage
+        self.attrs = attrs
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        _finish(self.stage, self.started, duration, self.attrs, exc_type)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def _finish(stage, started, duration, attrs, exc_type=None):
+    stage_latency.observe(stage, duration, exc_type is not None)
+    current = _current.get()
+    if current is not None and TRACE_LOG:
+        span = {"stage": stage, "start_s": round(started - current.started, 6), "duration_s": round(duration, 6)}
+        if attrs:
+            span.update(attrs)
+        if exc_type is not None:
+            span["error"] = exc_type.__name__
+        current.spans.append(span)
+
+
+def span(stage, **attrs):
+    """Context manager timing one stage of the current request."""
+    if not TRACING:
+        return _NO_SPAN
+    return Span(stage, attrs)
+
+
+def trace(name, **attrs):
+    """Context manager for a whole request; spans inside it are logged with it when TRACE_LOG=1."""
+    if not TRACING:
+        return _NO_SPAN
+    return Trace(name, **attrs)
+
+
+def record(stage, seconds, **attrs):
+    """Add a stage that was timed elsewhere (ended now, lasted seconds)."""
+    if TRACING:
+        _finish(stage, time.perf_counter() - seconds, seconds, attrs)
+
+
+def record_timings(timings):
+    """Add the stages measured into a RagPipeline timings dict."""
+    if TRACING:
+        for key, seconds in timings.items():
+            _finish(TIMING_STAGES.get(key, key.removesuffix("_s")), time.perf_counter() - seconds, seconds, None)
+
+
+def timed_stream(tokens, first_stage="llm_first_token", total_stage="llm_completion"):
+    """Pass tokens through, recording time to the first one and to the end."""
+    started = time.perf_counter()
+    first = True
+    for token in tokens:
+        if first:
+            record(first_stage, time.perf_counter() - started)
+            first = False
+        yield token
+    record(total_stage, time.perf_counter() - started)
+
+
+def current_trace_id():
+    current = _current.get()
+    return current.trace_id if current is not None else None
+
+
+def metrics_text():
+    return stage_latency.render()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        trace_record = getattr(record, "trace_record", None)
+        if trace_record is not None:
+            entry.update(trace_record)
+        else:
+            entry["message"] = record.getMessage()
+        trace_id = current_trace_id()
+        if trace_id:
+            entry["trace_id"] = trace_id
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Send log records to stderr, as JSON lines when fmt is "json"."""
+    handler = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)